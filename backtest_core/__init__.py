@@ -0,0 +1 @@
+# backtest_core: 網頁版與 LINE Bot 共用的 MACD 回測核心
@@ -0,0 +1,110 @@
+# backtest.py
+# 單檔 MACD 回測的共用入口：網頁版與 LINE Bot 都呼叫這裡，
+# 回傳數值型的結果 (權益曲線、結構化交易紀錄)，字串格式化留給各前端
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from backtest_core.data import load_history, data_version
+from backtest_core.engine import (simulate_macd, find_crosses, TradeLog, BUY, DEATH_CROSS, STOP_LOSS, TAKE_PROFIT,
+                                  SIGNAL_EXIT, FEE_RATE, TAX_RATE, STOP_LOSS_PCT, TAKE_PROFIT_PCT)
+from backtest_core.profiling import stage
+
+
+class Indicators(NamedTuple):
+    dates: pd.DatetimeIndex
+    close: np.ndarray
+    dif: np.ndarray
+    macd: np.ndarray
+    histogram: np.ndarray
+    crosses: tuple          # (golden, death) 布林陣列
+    version: str            # 價格資料版本，供快取 key 使用
+
+
+class BacktestResult(NamedTuple):
+    ticker: str
+    start: str
+    end: str
+    indicators: Indicators
+    trades: TradeLog
+    equity: np.ndarray      # 每根 K 棒收盤後的總資產
+    initial_cash: float
+    final_value: float
+    total_return: float     # %
+    cagr: float             # %
+    win_rate: float         # %
+    total_trades: int
+    winning_trades: int
+    max_drawdown: float     # %
+    risk_reward: float      # 每股平均獲利價差 / 平均虧損價差
+
+
+def compute_indicators(df, fast=12, slow=26, signal=9):
+    """以 ewm(adjust=False) 計算 MACD，與本金無關，可跨不同本金共用。"""
+    close = df['Close']
+    dif = close.ewm(span=fast, adjust=False).mean() - close.ewm(span=slow, adjust=False).mean()
+    macd = dif.ewm(span=signal, adjust=False).mean()
+    dif, macd = dif.to_numpy(), macd.to_numpy()
+    return Indicators(df.index, close.to_numpy(), dif, macd, dif - macd,
+                      find_crosses(dif, macd), data_version(df))
+
+
+def load_indicators(ticker, start, end, fast=12, slow=26, signal=9):
+    with stage('fetch'):
+        df = load_history(ticker, start, end)
+    if df.empty:
+        raise ValueError(f'無法在指定日期範圍內取得 {ticker} 的資料，請嘗試調整日期。')
+    with stage('indicators'):
+        return compute_indicators(df, fast, slow, signal)
+
+
+def describe_action(action, stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT,
+                    entry_label='黃金交叉', exit_label='出場訊號'):
+    """交易動作的顯示文字；entry_label / exit_label 供其他策略替換進出場訊號的名稱。"""
+    if action == BUY:
+        return f'買進 ({entry_label})'
+    reasons = {
+        DEATH_CROSS: '死亡交叉',
+        SIGNAL_EXIT: exit_label,
+        STOP_LOSS: f'停損 (-{stop_loss_pct*100:.0f}%)',
+        TAKE_PROFIT: f'停利 (+{take_profit_pct*100:.0f}%)',
+    }
+    return f'賣出 ({reasons[action]})' if action in reasons else '期末強制平倉'
+
+
+def _risk_reward(trades):
+    # 與原本兩個前端相同：以每筆買賣的每股價差計算，沒有獲利 (或虧損) 的交易時平均值以 0.01 代替
+    sells = np.flatnonzero(trades.sells)
+    diffs = trades.price[sells] - trades.price[sells - 1]
+    gains, losses = diffs[diffs > 0], -diffs[diffs < 0]
+    avg_gain = gains.mean() if len(gains) else 0.01
+    avg_loss = losses.mean() if len(losses) else 0.01
+    return float(avg_gain / avg_loss)
+
+
+def run_backtest(indicators, start, end, initial_cash, ticker='0050.TW',
+                 fee_rate=FEE_RATE, tax_rate=TAX_RATE,
+                 stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT):
+    with stage('simulate'):
+        sim = simulate_macd(indicators.close, indicators.dif, indicators.macd, initial_cash,
+                            fee_rate=fee_rate, tax_rate=tax_rate,
+                            stop_loss_pct=stop_loss_pct, take_profit_pct=take_profit_pct,
+                            crosses=indicators.crosses)
+
+    total_return = (sim.cash - initial_cash) / initial_cash * 100
+    win_rate = (sim.winning_trades / sim.total_trades) * 100 if sim.total_trades > 0 else 0.0
+    # 年化報酬率 (CAGR)，不足一年時等於總報酬率
+    num_years = (pd.to_datetime(end) - pd.to_datetime(start)).days / 365.25
+    cagr = ((sim.cash / initial_cash) ** (1 / num_years) - 1) * 100 if num_years > 0 else total_return
+
+    return BacktestResult(ticker, start, end, indicators, sim.trades, sim.equity, float(initial_cash),
+                          sim.cash, total_return, cagr, win_rate, sim.total_trades, sim.winning_trades,
+                          sim.max_drawdown * 100, _risk_reward(sim.trades))
+
+
+def backtest_ticker(ticker, start, end, initial_cash, fast=12, slow=26, signal=9, **kwargs):
+    """讀取價格、計算指標並回測。"""
+    indicators = load_indicators(ticker, start, end, fast, slow, signal)
+    return run_backtest(indicators, start, end, initial_cash, ticker=ticker, **kwargs)
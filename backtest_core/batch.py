@@ -0,0 +1,167 @@
+# batch.py
+# 批次回測：一次接收多組回測設定 (標的、區間、本金、參數)，依標的分組，
+# 每檔只讀一次涵蓋所有區間的價格；同一區間的設定共用一個 strategies.IndicatorSet，
+# 各 EMA / 交叉訊號只計算一次。各標的分組在執行緒中平行處理，完成一組就回傳一組結果。
+# 每筆設定可指定 execution (預設組合名稱或 ExecutionModel 欄位) 以實際成交模型回測。
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from backtest_core.backtest import _risk_reward
+from backtest_core.data import load_history, data_version
+from backtest_core.engine import DEATH_CROSS, STOP_LOSS_PCT, TAKE_PROFIT_PCT
+from backtest_core.execution import ExecutionModel
+from backtest_core.portfolio import normalize_tickers
+from backtest_core.strategies import IndicatorSet, Strategy, get_strategies, run_strategy, dif, macd
+from backtest_core.sweep import summarize
+
+MAX_SPECS = 1000
+DEFAULT_START = '2005-01-01'
+_FIELDS = ('id', 'ticker', 'start', 'end', 'cash', 'strategy', 'fast', 'slow', 'signal',
+           'stop_loss_pct', 'take_profit_pct', 'execution')
+
+
+def _date(value, name):
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'{name} 日期格式必須是 YYYY-MM-DD：{value}') from None
+
+
+def _optional_pct(spec, name, default):
+    if name not in spec:
+        return default
+    return None if spec[name] is None else float(spec[name])
+
+
+def _execution(value):
+    # 預設組合名稱 (例如 "tw_board") 或 ExecutionModel 欄位物件；未指定時以收盤價成交
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = {'preset': value}
+    if not isinstance(value, dict):
+        raise ValueError('execution 必須是預設組合名稱或 JSON 物件。')
+    unknown = set(value) - set(ExecutionModel._fields) - {'preset'}
+    if unknown:
+        raise ValueError(f"execution 有未知的欄位：{', '.join(sorted(unknown))}")
+    return ExecutionModel.from_dict(value)
+
+
+def _convert(spec, position):
+    return {
+        'index': position,      # 在請求中的位置，整份回傳時依此排序
+        'id': spec.get('id', position),
+        'ticker': normalize_tickers(spec.get('ticker'))[0],
+        'start': _date(spec.get('start', DEFAULT_START), 'start'),
+        'end': _date(spec.get('end', datetime.today().strftime('%Y-%m-%d')), 'end'),
+        'cash': float(spec.get('cash', 1_000_000)),
+        'strategy': spec.get('strategy', 'macd'),
+        'fast': int(spec.get('fast', 12)),
+        'slow': int(spec.get('slow', 26)),
+        'signal': int(spec.get('signal', 9)),
+        'stop_loss_pct': _optional_pct(spec, 'stop_loss_pct', STOP_LOSS_PCT),
+        'take_profit_pct': _optional_pct(spec, 'take_profit_pct', TAKE_PROFIT_PCT),
+        'execution': _execution(spec.get('execution')),
+    }
+
+
+def parse_spec(spec, position=0):
+    """驗證並補上預設值；格式錯誤時丟出 ValueError。"""
+    if not isinstance(spec, dict):
+        raise ValueError(f'第 {position + 1} 筆設定必須是 JSON 物件。')
+    unknown = set(spec) - set(_FIELDS)
+    if unknown:
+        raise ValueError(f"第 {position + 1} 筆設定有未知的欄位：{', '.join(sorted(unknown))}")
+    try:
+        parsed = _convert(spec, position)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'第 {position + 1} 筆設定：{e}') from None
+    if parsed['start'] >= parsed['end']:
+        raise ValueError(f'第 {position + 1} 筆設定的開始日期必須早於結束日期。')
+    if parsed['cash'] <= 0:
+        raise ValueError(f'第 {position + 1} 筆設定的本金必須大於 0。')
+    if not 0 < parsed['fast'] < parsed['slow'] or parsed['signal'] <= 0:
+        raise ValueError(f'第 {position + 1} 筆設定的 MACD 參數無效 (需 0 < fast < slow，signal > 0)。')
+    get_strategies([parsed['strategy']])
+    return parsed
+
+
+def parse_specs(specs):
+    if not isinstance(specs, list) or not specs:
+        raise ValueError('specs 必須是非空的陣列。')
+    if len(specs) > MAX_SPECS:
+        raise ValueError(f'一次最多 {MAX_SPECS} 筆回測設定。')
+    return [parse_spec(spec, i) for i, spec in enumerate(specs)]
+
+
+def _strategy(spec):
+    if spec['strategy'] == 'macd':
+        f, s, g = spec['fast'], spec['slow'], spec['signal']
+        strategy = Strategy('macd', dif(f, s).crosses_above(macd(f, s, g)), dif(f, s).crosses_below(macd(f, s, g)),
+                            exit_action=DEATH_CROSS)
+    else:
+        strategy = get_strategies([spec['strategy']])[0]
+    return strategy._replace(stop_loss_pct=spec['stop_loss_pct'], take_profit_pct=spec['take_profit_pct'])
+
+
+def _result_key(spec, version):
+    return ('batch',) + tuple(spec[f] for f in _FIELDS[1:]) + (version,)
+
+
+def _run_ticker(ticker, specs, loader, cache):
+    # 一次讀取涵蓋所有設定的區間，再依 (start, end) 切片
+    df = loader(ticker, min(s['start'] for s in specs), max(s['end'] for s in specs))
+    by_range = {}
+    for spec in specs:
+        by_range.setdefault((spec['start'], spec['end']), []).append(spec)
+
+    results = []
+    for (start, end), group in by_range.items():
+        part = df[(df.index >= pd.Timestamp(start)) & (df.index < pd.Timestamp(end))]
+        if part.empty:
+            results += [{'index': s['index'], 'id': s['id'], 'ticker': ticker, 'start': start, 'end': end,
+                         'error': f'無法在指定日期範圍內取得 {ticker} 的資料，請嘗試調整日期。'} for s in group]
+            continue
+        version = data_version(part)
+        ind = IndicatorSet(part)
+        # 與 run_backtest 相同，年數以查詢區間計算
+        num_years = (pd.to_datetime(end) - pd.to_datetime(start)).days / 365.25
+        for spec in group:
+            key = _result_key(spec, version)
+            metrics = cache.get(key) if cache is not None else None
+            if metrics is None:
+                sim = run_strategy(ind, _strategy(spec), spec['cash'], execution=spec['execution'])
+                metrics = summarize(sim, spec['cash'], num_years)
+                metrics['winning_trades'] = sim.winning_trades
+                metrics['risk_reward'] = _risk_reward(sim.trades)
+                metrics['bars'] = len(part)
+                if cache is not None:
+                    cache.put(key, metrics)
+            execution = spec['execution']._asdict() if spec['execution'] else None
+            results.append({**spec, **metrics, 'execution': execution, 'error': None})
+    return results
+
+
+def run_batch(specs, loader=load_history, cache=None, max_workers=8):
+    """specs 為 parse_specs() 的結果；以產生器依完成順序逐筆回傳結果 dict。
+
+    cache：可選的 LRUCache，以 (設定, 資料版本) 保存數值結果。
+    """
+    groups = {}
+    for spec in specs:
+        groups.setdefault(spec['ticker'], []).append(spec)
+    workers = max(1, min(max_workers, len(groups)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as pool:
+        futures = {pool.submit(_run_ticker, ticker, group, loader, cache): (ticker, group)
+                   for ticker, group in groups.items()}
+        for future in as_completed(futures):
+            ticker, group = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                rows = [{'index': s['index'], 'id': s['id'], 'ticker': ticker, 'start': s['start'], 'end': s['end'],
+                         'error': f'發生未預期的錯誤: {e}'} for s in group]
+            yield from rows
@@ -0,0 +1,515 @@
+# benchmarks.py
+# 回測流程的基準測試：
+#   engine：比較舊版逐列 df.iloc 迴圈與 NumPy 引擎的速度，並確認兩者結果逐位元一致
+#   suite ：以合成價格離線量測各段落耗時，可存成 JSON 基準並比對退步
+#   startup：在全新的子行程中量測兩個前端的匯入時間與第一個請求的延遲，超過 STARTUP_BUDGET 時以非 0 結束
+#   execution：在數十年的合成 OHLC 上量測 execution.simulate_orders 各成交模型的吞吐量 (K 棒/秒)
+# 執行方式：
+#   python -m backtest_core.benchmarks engine [K 棒數量 ...]
+#   python -m backtest_core.benchmarks suite [--sizes 1000 10000 100000] [--save-baseline PATH] [--baseline PATH]
+#   python -m backtest_core.benchmarks startup [--fresh-font-cache] [--scale 1.0]
+#   python -m backtest_core.benchmarks execution [--years 10 30 60 120] [--min-throughput 250000]
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest_core.engine import (
+    simulate_macd, FEE_RATE, TAX_RATE, STOP_LOSS_PCT, TAKE_PROFIT_PCT
+)
+
+
+def synthetic_prices(n_bars, seed=0, start_price=50.0):
+    # 幾何布朗運動產生的模擬日收盤價
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0003, 0.012, n_bars)
+    close = start_price * np.exp(np.cumsum(returns))
+    index = pd.bdate_range('2000-01-03', periods=n_bars)
+    return pd.DataFrame({'Close': close}, index=index)
+
+
+def add_macd(df, fast=12, slow=26, signal=9):
+    df['EMA_fast'] = df['Close'].ewm(span=fast, adjust=False).mean()
+    df['EMA_slow'] = df['Close'].ewm(span=slow, adjust=False).mean()
+    df['DIF'] = df['EMA_fast'] - df['EMA_slow']
+    df['MACD'] = df['DIF'].ewm(span=signal, adjust=False).mean()
+    df['Histogram'] = df['DIF'] - df['MACD']
+    return df
+
+
+def legacy_loop(df, initial_cash, fee_rate=FEE_RATE, tax_rate=TAX_RATE,
+                stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT):
+    # 原本 網頁/APP.py 的逐列迴圈，僅保留數值部分作為比對基準
+    position = 0
+    buy_price = 0
+    cash = initial_cash
+    shares = 0
+    trades = []
+    total_trades = 0
+    winning_trades = 0
+    peak_portfolio_value = initial_cash
+    max_drawdown = 0.0
+
+    for i in range(1, len(df)):
+        today = df.iloc[i]
+        yesterday = df.iloc[i - 1]
+
+        if position == 0 and (yesterday['DIF'] < yesterday['MACD']) and (today['DIF'] > today['MACD']):
+            buy_price = today['Close']
+            shares_to_buy = int(cash // (buy_price * (1 + fee_rate)))
+            if shares_to_buy > 0:
+                cost = shares_to_buy * buy_price
+                fee = cost * fee_rate
+                total_cost = cost + fee
+                cash -= total_cost
+                position = shares_to_buy
+                shares = shares_to_buy
+                trades.append((i, buy_price, shares, cash))
+
+        elif position > 0:
+            sell = False
+            current_price = today['Close']
+            change_pct = (current_price - buy_price) / buy_price
+
+            if (yesterday['DIF'] > yesterday['MACD']) and (today['DIF'] < today['MACD']):
+                sell = True
+            elif change_pct <= -stop_loss_pct:
+                sell = True
+            elif change_pct >= take_profit_pct:
+                sell = True
+
+            if sell:
+                revenue = shares * current_price
+                fee = revenue * fee_rate
+                tax = revenue * tax_rate
+                net_income = revenue - fee - tax
+                buy_cost = shares * buy_price
+                profit = net_income - (buy_cost * (1 + fee_rate))
+                cash += net_income
+                total_trades += 1
+                if profit > 0:
+                    winning_trades += 1
+                trades.append((i, current_price, shares, cash))
+                position = 0
+                shares = 0
+                buy_price = 0
+
+        current_portfolio_value = cash + (shares * today['Close'])
+        peak_portfolio_value = max(peak_portfolio_value, current_portfolio_value)
+        drawdown = (peak_portfolio_value - current_portfolio_value) / peak_portfolio_value
+        max_drawdown = max(max_drawdown, drawdown)
+
+    if position > 0:
+        final_price = df.iloc[-1]['Close']
+        revenue = shares * final_price
+        fee, tax = revenue * fee_rate, revenue * tax_rate
+        net_income = revenue - fee - tax
+        buy_cost = shares * buy_price
+        profit = net_income - (buy_cost * (1 + fee_rate))
+        cash += net_income
+        total_trades += 1
+        if profit > 0:
+            winning_trades += 1
+        trades.append((len(df) - 1, final_price, shares, cash))
+
+    return trades, cash, total_trades, winning_trades, max_drawdown
+
+
+def run_engine(df, initial_cash):
+    sim = simulate_macd(df['Close'].to_numpy(), df['DIF'].to_numpy(), df['MACD'].to_numpy(), initial_cash)
+    trades = [(t.index, t.price, t.shares, t.cash) for t in sim.trades]
+    return trades, sim.cash, sim.total_trades, sim.winning_trades, sim.max_drawdown
+
+
+def _best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def compare(n_bars, initial_cash=1_000_000.0, repeat=3):
+    df = add_macd(synthetic_prices(n_bars))
+    legacy_time, legacy = _best_of(lambda: legacy_loop(df, initial_cash), 1)
+    engine_time, engine = _best_of(lambda: run_engine(df, initial_cash), repeat)
+    if legacy != engine:
+        raise AssertionError(f'{n_bars} 根 K 棒：引擎結果與舊版迴圈不一致')
+    return legacy_time, engine_time
+
+
+def engine_main(sizes):
+    sizes = sizes or [1_000, 5_000, 20_000]
+    print(f"{'K 棒數':>8} {'舊版迴圈(s)':>12} {'NumPy 引擎(s)':>14} {'加速倍數':>8}")
+    for n in sizes:
+        legacy_time, engine_time = compare(n)
+        print(f"{n:>8} {legacy_time:>12.4f} {engine_time:>14.4f} {legacy_time / engine_time:>8.1f}x")
+
+
+# --- 分段基準測試 -------------------------------------------------------------
+
+NOISE_FLOOR = 0.005   # 低於 5ms 的段落不判定為退步
+
+
+def _ohlcv(close_df):
+    df = close_df[['Close']].copy()
+    df['Open'] = df['High'] = df['Low'] = df['Close']
+    df['Volume'] = 0.0
+    return df
+
+
+def _series(sizes):
+    return {f'synthetic:{n}': _ohlcv(synthetic_prices(n)) for n in sizes}
+
+
+def _time_core(name, df, initial_cash, charts, repeat):
+    # 直接呼叫核心模組的各段落
+    from backtest_core.charts import render_macd_chart, WEB_STYLE
+    from backtest_core.data import PriceStore
+    from backtest_core.profiling import recorder, stage
+
+    root = tempfile.mkdtemp(prefix='bench_')
+    try:
+        store = PriceStore(root, fetcher=None, today=lambda: datetime.date(2100, 1, 1))
+        store.seed('BENCH', df, start=df.index[0], end=df.index[-1] + pd.Timedelta(days=1))
+        start, end = df.index[0].strftime('%Y-%m-%d'), (df.index[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        recorder.reset()
+        for _ in range(repeat):
+            with stage('fetch'):
+                prices = store.history('BENCH', start, end)
+            with stage('indicators'):
+                prices = add_macd(prices)
+            with stage('simulate'):
+                sim = simulate_macd(prices['Close'].to_numpy(), prices['DIF'].to_numpy(),
+                                    prices['MACD'].to_numpy(), initial_cash)
+            with stage('format'):
+                [(prices.index[t.index].strftime('%Y-%m-%d'), f"{t.price:.2f}", f"{t.cash:,.2f}")
+                 for t in sim.trades]
+        if charts:
+            render_macd_chart(prices.index, prices['Close'].to_numpy(), prices['DIF'].to_numpy(),
+                              prices['MACD'].to_numpy(), prices['Histogram'].to_numpy(), name, WEB_STYLE)
+        return {stage_name: stats['p50'] for stage_name, stats in recorder.summary()['stages'].items()}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _time_web(df, initial_cash, repeat):
+    # 透過 Flask test client 走完整個 /strategy (含串流的頁面內容)，各段落耗時由 recorder 讀回；
+    # 串流回應的 Server-Timing 標頭在回測之前就已送出，因此不再使用
+    import importlib.util
+    from backtest_core import data, snapshots
+    from backtest_core.profiling import recorder
+
+    root = tempfile.mkdtemp(prefix='bench_web_')
+    previous_store, previous_snapshots = data._default_store, snapshots._default_store
+    previous_prewarm = os.environ.get('PREWARM')
+    try:
+        # 價格與快照都放在暫存目錄，且不啟動預熱：預熱執行緒會透過 yfinance 下載並寫入專案目錄
+        os.environ['PREWARM'] = 'off'
+        data._default_store = data.PriceStore(root, fetcher=None, today=lambda: datetime.date(2100, 1, 1))
+        snapshots._default_store = snapshots.SnapshotStore(os.path.join(root, 'snapshots'))
+        data._default_store.seed('0050.TW', df, start=df.index[0], end=df.index[-1] + pd.Timedelta(days=1))
+        web_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '網頁')
+        module = sys.modules.get('bench_web_app')
+        if module is None:
+            spec = importlib.util.spec_from_file_location('bench_web_app', os.path.join(web_dir, 'APP.py'))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules['bench_web_app'] = module
+            spec.loader.exec_module(module)
+        client = module.app.test_client()
+        start = df.index[0].strftime('%Y-%m-%d')
+        end = (df.index[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        samples = {}
+        for _ in range(repeat):
+            # 清掉快取，量測冷啟動的完整路徑
+            module.result_cache.clear()
+            module.signal_cache.clear()
+            recorder.reset()
+            t0 = time.perf_counter()
+            resp = client.get(f'/strategy?start={start}&end={end}&cash={initial_cash}')
+            resp.get_data()
+            resp.close()
+            samples.setdefault('web.total', []).append(time.perf_counter() - t0)
+            for name, stats in recorder.summary()['stages'].items():
+                samples.setdefault(f'web.{name}', []).append(stats['avg'] * stats['count'])
+        return {name: sorted(v)[len(v) // 2] for name, v in samples.items()}
+    finally:
+        data._default_store, snapshots._default_store = previous_store, previous_snapshots
+        if previous_prewarm is None:
+            os.environ.pop('PREWARM', None)
+        else:
+            os.environ['PREWARM'] = previous_prewarm
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def run_suite(sizes, initial_cash=1_000_000.0, charts=True, web=True, repeat=3):
+    results = {}
+    for name, df in _series(sizes).items():
+        timings = _time_core(name, df, initial_cash, charts, repeat)
+        if web:
+            timings.update(_time_web(df, initial_cash, repeat))
+        results[name] = {'bars': len(df), 'stages': timings}
+    return results
+
+
+def compare_baseline(results, baseline, tolerance):
+    regressions = []
+    for name, entry in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        for stage_name, seconds in entry['stages'].items():
+            ref = base['stages'].get(stage_name)
+            if ref and seconds > NOISE_FLOOR and seconds > ref * tolerance:
+                regressions.append((name, stage_name, ref, seconds))
+    return regressions
+
+
+def print_results(results):
+    for name, entry in results.items():
+        print(f"\n== {name} ({entry['bars']} 根 K 棒) ==")
+        for stage_name, seconds in sorted(entry['stages'].items(), key=lambda kv: -kv[1]):
+            print(f"  {stage_name:<24} {seconds * 1000:>10.2f} ms")
+
+
+def suite_main(args):
+    results = run_suite(args.sizes, charts=not args.skip_charts, web=not args.skip_web, repeat=args.repeat)
+    print_results(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                       'results': results}, f, ensure_ascii=False, indent=2)
+        print(f'\n已寫入基準：{args.save_baseline}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(results, baseline, args.tolerance)
+        for name, stage_name, ref, seconds in regressions:
+            print(f'⚠️ 退步：{name} {stage_name} {ref * 1000:.2f}ms -> {seconds * 1000:.2f}ms')
+        if regressions:
+            return 1
+        print('\n與基準比較：沒有超過容許範圍的退步。')
+    return 0
+
+
+# 冷啟動預算 (秒)：cold 為不預熱的新行程，warm 為預熱 (warmup.prewarm) 完成後
+STARTUP_BUDGET = {
+    'web.import': 1.0,
+    'web.cold.first_request': 0.5,
+    'web.cold.first_chart': 4.0,
+    'web.warm.first_request': 0.3,
+    'web.warm.first_chart': 3.0,
+    'bot.import': 3.0,
+    'bot.cold.first_backtest': 5.0,
+}
+
+_WEB_PROBE = '''
+import json, os, re, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {web_dir!r})
+import APP
+out = {{'import': time.perf_counter() - started}}
+if {warm!r}:
+    from backtest_core.warmup import prewarm
+    started = time.perf_counter()
+    prewarm()
+    out['prewarm'] = time.perf_counter() - started
+client = APP.app.test_client()
+started = time.perf_counter()
+html = client.get({query!r}).get_data(as_text=True)
+out['first_request'] = time.perf_counter() - started
+started = time.perf_counter()
+client.get(re.search(r'/chart/[0-9a-f]+[.]png', html).group(0))
+out['first_chart'] = time.perf_counter() - started
+print(json.dumps(out))
+sys.stdout.flush()
+os._exit(0)
+'''
+
+_BOT_PROBE = '''
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {bot_dir!r})
+import app
+out = {{'import': time.perf_counter() - started}}
+started = time.perf_counter()
+app.build_backtest_messages({start!r}, {end!r}, 1000000.0, 'http://localhost', ('0050.TW',))
+out['first_backtest'] = time.perf_counter() - started
+print(json.dumps(out))
+sys.stdout.flush()
+os._exit(0)
+'''
+
+
+def _run_probe(code, env):
+    proc = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, timeout=600)
+    if proc.returncode != 0:
+        raise RuntimeError(f'啟動量測失敗：\n{proc.stderr[-2000:]}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_startup(fresh_font_cache=False):
+    """以離線價格快取啟動全新子行程，回傳 {量測名稱: 秒}。"""
+    from backtest_core import data
+
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    root = tempfile.mkdtemp(prefix='bench_startup_')
+    try:
+        # 價格資料結束於今天，涵蓋範圍標到後天，預熱與請求都不會向 yfinance 下載
+        today = datetime.date.today()
+        df = _ohlcv(synthetic_prices(2700))
+        df.index = pd.bdate_range(end=today, periods=len(df))
+        store = data.PriceStore(os.path.join(root, 'cache'), fetcher=None)
+        store.seed('0050.TW', df, start='1990-01-01', end=today + datetime.timedelta(days=2))
+        start = (today - datetime.timedelta(days=5 * 365)).isoformat()
+        end = (today + datetime.timedelta(days=1)).isoformat()
+
+        env = dict(os.environ, PRICE_CACHE_DIR=os.path.join(root, 'cache'), PREWARM='off',
+                   IMAGE_DIR=os.path.join(root, 'images'), LINE_CHANNEL_ACCESS_TOKEN='x',
+                   LINE_CHANNEL_SECRET='x', PYTHONDONTWRITEBYTECODE='1')
+        if fresh_font_cache:
+            env['MPLCONFIGDIR'] = os.path.join(root, 'mpl')
+        query = f'/strategy?start={start}&end={end}&cash=1000000'
+        results = {}
+        for mode, warm in (('cold', False), ('warm', True)):
+            out = _run_probe(_WEB_PROBE.format(web_dir=os.path.join(repo, '網頁'), warm=warm, query=query), env)
+            results.setdefault('web.import', out['import'])
+            for name in ('prewarm', 'first_request', 'first_chart'):
+                if name in out:
+                    results[f'web.{mode}.{name}'] = out[name]
+        out = _run_probe(_BOT_PROBE.format(bot_dir=os.path.join(repo, 'line_bot'), start=start, end=end), env)
+        results['bot.import'] = out['import']
+        results['bot.cold.first_backtest'] = out['first_backtest']
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def startup_main(args):
+    results = run_startup(args.fresh_font_cache)
+    over = []
+    print(f"{'量測':<28}{'耗時':>10}{'預算':>10}")
+    for name, seconds in results.items():
+        budget = STARTUP_BUDGET.get(name)
+        mark = ''
+        if budget is not None and seconds > budget * args.scale:
+            over.append(name)
+            mark = '  ⚠️ 超過預算'
+        budget_text = f'{budget * args.scale * 1000:.0f}ms' if budget is not None else '-'
+        print(f'{name:<28}{seconds * 1000:>8.0f}ms{budget_text:>10}{mark}')
+    if over:
+        print(f"\n超過啟動預算：{', '.join(over)}")
+        return 1
+    print('\n啟動時間皆在預算內。')
+    return 0
+
+
+# --- 成交模型吞吐量 ---------------------------------------------------------
+
+BARS_PER_YEAR = 252
+EXECUTION_MIN_THROUGHPUT = 250_000   # K 棒/秒；逐列迴圈約只有數萬
+
+
+def synthetic_ohlc(n_bars, seed=0):
+    # 以合成收盤價加上跳空開盤與盤中高低點，讓盤中停損停利與跳空成交都會發生
+    df = synthetic_prices(n_bars, seed)
+    rng = np.random.default_rng(seed + 1)
+    close = df['Close'].to_numpy()
+    prev = np.concatenate(([close[0]], close[:-1]))
+    df['Open'] = prev * np.exp(rng.normal(0.0, 0.004, n_bars))
+    body_high = np.maximum(df['Open'].to_numpy(), close)
+    body_low = np.minimum(df['Open'].to_numpy(), close)
+    df['High'] = body_high * (1 + np.abs(rng.normal(0.0, 0.006, n_bars)))
+    df['Low'] = body_low * (1 - np.abs(rng.normal(0.0, 0.006, n_bars)))
+    df['Volume'] = 0.0
+    return df
+
+
+def run_execution(years, initial_cash=1_000_000.0, repeat=3):
+    from backtest_core.engine import simulate_signals, find_crosses
+    from backtest_core.execution import simulate_orders, EXECUTION_PRESETS
+    from backtest_core.strategies import IndicatorSet
+
+    rows = []
+    for span in years:
+        df = synthetic_ohlc(span * BARS_PER_YEAR)
+        ind = IndicatorSet(df)
+        golden, death = find_crosses(*ind.macd())
+        columns = [ind.column(c) for c in ('Open', 'High', 'Low')] + [ind.close]
+        base_time, base = _best_of(lambda: simulate_signals(ind.close, golden, death, initial_cash), repeat)
+        rows.append((span, len(df), 'simulate_signals', base_time, base.total_trades))
+        for name, model in EXECUTION_PRESETS.items():
+            elapsed, sim = _best_of(lambda: simulate_orders(*columns, golden, death, initial_cash, model=model),
+                                    repeat)
+            if name == 'close' and not (sim.cash == base.cash and np.array_equal(sim.equity, base.equity)):
+                raise AssertionError(f'{span} 年：close 成交模型與 simulate_signals 結果不一致')
+            rows.append((span, len(df), name, elapsed, sim.total_trades))
+    return rows
+
+
+def execution_main(args):
+    rows = run_execution(args.years, repeat=args.repeat)
+    slow = []
+    print(f"{'年數':>4} {'K 棒數':>8} {'模型':<18}{'耗時(ms)':>10}{'交易數':>8}{'K 棒/秒':>14}")
+    for span, bars, name, elapsed, trades in rows:
+        throughput = bars / elapsed
+        mark = ''
+        if throughput < args.min_throughput:
+            slow.append(f'{name}@{span}y')
+            mark = '  ⚠️ 低於門檻'
+        print(f'{span:>4} {bars:>8} {name:<18}{elapsed * 1000:>10.2f}{trades:>8}{throughput:>14,.0f}{mark}')
+    if slow:
+        print(f"\n吞吐量低於 {args.min_throughput:,.0f} K 棒/秒：{', '.join(slow)}")
+        return 1
+    print('\n各成交模型的吞吐量皆達門檻。')
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m backtest_core.benchmarks')
+    sub = parser.add_subparsers(dest='command')
+
+    p_engine = sub.add_parser('engine', help='舊版逐列迴圈 vs NumPy 引擎')
+    p_engine.add_argument('sizes', nargs='*', type=int)
+
+    p_suite = sub.add_parser('suite', help='各段落分段計時 (離線)')
+    p_suite.add_argument('--sizes', nargs='*', type=int, default=[1_000, 10_000, 100_000])
+    p_suite.add_argument('--repeat', type=int, default=3)
+    p_suite.add_argument('--skip-charts', action='store_true')
+    p_suite.add_argument('--skip-web', action='store_true')
+    p_suite.add_argument('--save-baseline', metavar='PATH')
+    p_suite.add_argument('--baseline', metavar='PATH')
+    p_suite.add_argument('--tolerance', type=float, default=1.5)
+
+    p_startup = sub.add_parser('startup', help='冷啟動：匯入時間與第一個請求的延遲預算')
+    p_startup.add_argument('--fresh-font-cache', action='store_true', help='使用全新的 matplotlib 字型快取')
+    p_startup.add_argument('--scale', type=float, default=1.0, help='預算倍率 (較慢的機器)')
+
+    p_execution = sub.add_parser('execution', help='成交模型在長歷史上的吞吐量')
+    p_execution.add_argument('--years', nargs='*', type=int, default=[10, 30, 60, 120])
+    p_execution.add_argument('--repeat', type=int, default=3)
+    p_execution.add_argument('--min-throughput', type=float, default=EXECUTION_MIN_THROUGHPUT)
+
+    args = parser.parse_args(argv)
+    if args.command == 'execution':
+        return execution_main(args)
+    if args.command == 'startup':
+        return startup_main(args)
+    if args.command == 'suite':
+        return suite_main(args)
+    engine_main(getattr(args, 'sizes', None))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,291 @@
+# charts.py
+# MACD 策略圖表的產生流程：
+#   - 只用物件導向的 Figure API (不經過 pyplot 全域狀態)，可在多執行緒中同時繪圖
+#   - matplotlib 延到第一次繪圖才載入，不拖慢行程啟動 (可由 warmup.prewarm 預先載入)
+#   - 以執行緒池在背景繪圖，請求端只拿到 key，不必等圖畫完
+#   - 畫好的 PNG 以 (ticker, start, end, params) 為 key 做 LRU 快取，相同請求直接重用
+
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from backtest_core.profiling import stage
+
+FONT_FAMILY = ['Microsoft JhengHei', 'Heiti TC', 'sans-serif']
+_figure_classes = None
+_matplotlib_lock = threading.Lock()
+
+# 網頁版：較完整的標籤與格線
+WEB_STYLE = {
+    'close_label': '收盤價', 'price_ylabel': '股價 (TWD)',
+    'dif_label': 'DIF (快線)', 'macd_label': 'MACD (慢線)', 'hist_label': '柱狀圖 (DIF-MACD)',
+    'line_width': 1.5, 'up_color': '#28a745', 'down_color': '#dc3545',
+    'zero_line': True, 'macd_ylabel': 'MACD 值', 'xlabel': '日期', 'macd_grid': True,
+}
+# LINE Bot 版：精簡圖例
+BOT_STYLE = {
+    'close_label': '收盤價', 'price_ylabel': None,
+    'dif_label': 'DIF', 'macd_label': 'MACD', 'hist_label': '柱狀圖',
+    'line_width': None, 'up_color': 'green', 'down_color': 'red',
+    'zero_line': False, 'macd_ylabel': None, 'xlabel': None, 'macd_grid': False,
+}
+
+
+# 圖寬 12 吋 x 100 dpi：超過每個像素兩點 (最小/最大) 的資料先降採樣再畫
+MAX_CHART_POINTS = 2400
+
+
+class ChartSeries(NamedTuple):
+    # 降採樣後的圖表資料：每個區塊保留最小與最大值 (依出現順序)，柱狀圖保留正/負兩側極值
+    x: np.ndarray           # 區塊起點時間，每個區塊重複兩次
+    close: np.ndarray
+    dif: np.ndarray
+    macd: np.ndarray
+    hist_x: np.ndarray      # 區塊起點時間
+    hist_hi: np.ndarray     # 區塊內正柱的最大值 (無則 0)
+    hist_lo: np.ndarray     # 區塊內負柱的最小值 (無則 0)
+
+
+def _new_figure(figsize):
+    # 第一次呼叫時才載入 matplotlib (約 0.5 秒) 並套用中文字型設定
+    global _figure_classes
+    if _figure_classes is None:
+        with _matplotlib_lock:
+            if _figure_classes is None:
+                import matplotlib
+                from matplotlib.figure import Figure
+                from matplotlib.backends.backend_agg import FigureCanvasAgg
+                matplotlib.rcParams['font.sans-serif'] = FONT_FAMILY
+                matplotlib.rcParams['axes.unicode_minus'] = False
+                _figure_classes = (Figure, FigureCanvasAgg)
+    figure_cls, canvas_cls = _figure_classes
+    fig = figure_cls(figsize=figsize)
+    canvas_cls(fig)
+    return fig
+
+
+def warm_up():
+    """載入 matplotlib 並畫一張含中文的小圖，讓字型清單與字型查找在第一個請求之前完成。"""
+    fig = _new_figure((2, 2))
+    ax = fig.subplots()
+    ax.plot([0, 1], [0, 1], label='收盤價')
+    ax.set_title('回測 MACD')
+    ax.legend()
+    return _encode_png(fig, 50)
+
+
+def _minmax(values, bucket):
+    values = np.asarray(values, dtype=np.float64)
+    n_buckets = -(-len(values) // bucket)
+    padded = np.full(n_buckets * bucket, np.nan)
+    padded[:len(values)] = values
+    blocks = padded.reshape(n_buckets, bucket)
+    lo_idx, hi_idx = np.nanargmin(blocks, axis=1), np.nanargmax(blocks, axis=1)
+    rows = np.arange(n_buckets)
+    first = np.where(lo_idx <= hi_idx, blocks[rows, lo_idx], blocks[rows, hi_idx])
+    second = np.where(lo_idx <= hi_idx, blocks[rows, hi_idx], blocks[rows, lo_idx])
+    return np.column_stack((first, second)).ravel()
+
+
+def downsample_series(dates, close, dif, macd, hist, bucket):
+    """每 bucket 根 K 棒壓成一個區塊 (最小/最大值)，不必逐根繪製也不必建立逐根顏色清單。"""
+    starts = np.asarray(dates)[::bucket]
+    hist = np.asarray(hist, dtype=np.float64)
+    return ChartSeries(np.repeat(starts, 2), _minmax(close, bucket), _minmax(dif, bucket), _minmax(macd, bucket),
+                       starts, np.maximum(_minmax(np.maximum(hist, 0), bucket)[1::2], 0),
+                       np.minimum(_minmax(np.minimum(hist, 0), bucket)[::2], 0))
+
+
+def concat_series(parts):
+    return ChartSeries(*(np.concatenate([getattr(p, f) for p in parts]) for f in ChartSeries._fields))
+
+
+def render_macd_chart(dates, close, dif, macd, hist, title, style=WEB_STYLE, dpi=100):
+    """繪製「收盤價 + DIF/MACD/柱狀圖」雙圖，回傳 PNG bytes。"""
+    if len(close) > MAX_CHART_POINTS:
+        bucket = -(-len(close) // (MAX_CHART_POINTS // 2))
+        return render_series_chart(downsample_series(dates, close, dif, macd, hist, bucket), title, style, dpi)
+    with stage('chart_draw'):
+        fig = _draw_macd_chart(dates, close, dif, macd, hist, title, style)
+    return _encode_png(fig, dpi)
+
+
+def render_series_chart(series, title, style=WEB_STYLE, dpi=100):
+    """以降採樣後的 ChartSeries 繪圖 (長歷史或分鐘線)，柱狀圖改用 fill_between。"""
+    with stage('chart_draw'):
+        fig = _new_figure((12, 8))
+        ax1, ax2 = fig.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [2, 1]})
+        line_kw = {'linewidth': style['line_width']} if style['line_width'] else {}
+        ax1.plot(series.x, series.close, label=style['close_label'], color='darkcyan')
+        ax1.set_title(title, fontsize=16)
+        if style['price_ylabel']:
+            ax1.set_ylabel(style['price_ylabel'])
+        ax1.grid(True, linestyle='--', alpha=0.6)
+        ax1.legend()
+
+        ax2.plot(series.x, series.dif, label=style['dif_label'], color='blue', **line_kw)
+        ax2.plot(series.x, series.macd, label=style['macd_label'], color='red', **line_kw)
+        ax2.fill_between(series.hist_x, 0, series.hist_hi, step='post', color=style['up_color'],
+                         alpha=0.5, label=style['hist_label'])
+        ax2.fill_between(series.hist_x, series.hist_lo, 0, step='post', color=style['down_color'], alpha=0.5)
+        if style['zero_line']:
+            ax2.axhline(0, color='black', linewidth=0.8, linestyle='--')
+        if style['xlabel']:
+            ax2.set_xlabel(style['xlabel'])
+        if style['macd_ylabel']:
+            ax2.set_ylabel(style['macd_ylabel'])
+        ax2.legend()
+        if style['macd_grid']:
+            ax2.grid(True, linestyle='--', alpha=0.6)
+        fig.tight_layout()
+    return _encode_png(fig, dpi)
+
+
+def _draw_macd_chart(dates, close, dif, macd, hist, title, style):
+    fig = _new_figure((12, 8))
+    ax1, ax2 = fig.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [2, 1]})
+    line_kw = {'linewidth': style['line_width']} if style['line_width'] else {}
+
+    ax1.plot(dates, close, label=style['close_label'], color='darkcyan')
+    ax1.set_title(title, fontsize=16)
+    if style['price_ylabel']:
+        ax1.set_ylabel(style['price_ylabel'])
+    ax1.grid(True, linestyle='--', alpha=0.6)
+    ax1.legend()
+
+    ax2.plot(dates, dif, label=style['dif_label'], color='blue', **line_kw)
+    ax2.plot(dates, macd, label=style['macd_label'], color='red', **line_kw)
+    hist = np.asarray(hist, dtype=np.float64)
+    bar_colors = np.where(hist > 0, style['up_color'], style['down_color'])
+    ax2.bar(dates, hist, label=style['hist_label'], color=bar_colors, alpha=0.5)
+    if style['zero_line']:
+        ax2.axhline(0, color='black', linewidth=0.8, linestyle='--')
+    if style['xlabel']:
+        ax2.set_xlabel(style['xlabel'])
+    if style['macd_ylabel']:
+        ax2.set_ylabel(style['macd_ylabel'])
+    ax2.legend()
+    if style['macd_grid']:
+        ax2.grid(True, linestyle='--', alpha=0.6)
+    fig.tight_layout()
+    return fig
+
+
+def _encode_png(fig, dpi):
+    with stage('png_encode'):
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', dpi=dpi)
+        return buf.getvalue()
+
+
+def render_equity_chart(dates, equity, symbol_equity, title, dpi=100):
+    """投資組合總資產 (上) 與各標的子帳戶資產 (下)，回傳 PNG bytes。"""
+    fig = _new_figure((12, 8))
+    ax1, ax2 = fig.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [2, 1]})
+    ax1.plot(dates, equity, label='投資組合總資產', color='darkcyan', linewidth=1.5)
+    ax1.set_title(title, fontsize=16)
+    ax1.set_ylabel('資產 (TWD)')
+    ax1.grid(True, linestyle='--', alpha=0.6)
+    ax1.legend()
+    for ticker, values in symbol_equity.items():
+        ax2.plot(dates, values, label=ticker, linewidth=1)
+    ax2.set_xlabel('日期')
+    ax2.set_ylabel('子帳戶資產')
+    ax2.grid(True, linestyle='--', alpha=0.6)
+    ax2.legend(fontsize=8, ncol=4)
+    fig.tight_layout()
+    return _encode_png(fig, dpi)
+
+
+def render_heatmap(matrix, row_labels, col_labels, title, value_label='%', dpi=100):
+    """各視窗結果的熱圖 (紅負綠正)，回傳 PNG bytes。"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    width = min(24, max(8, 0.35 * len(col_labels) + 3))
+    fig = _new_figure((width, max(3, 0.6 * len(row_labels) + 2)))
+    ax = fig.subplots()
+    limit = np.nanmax(np.abs(matrix)) if np.isfinite(matrix).any() else 1.0
+    image = ax.imshow(matrix, aspect='auto', cmap='RdYlGn', vmin=-limit, vmax=limit)
+    ax.set_yticks(range(len(row_labels)), labels=row_labels)
+    step = max(1, len(col_labels) // 30)
+    ax.set_xticks(range(0, len(col_labels), step), labels=col_labels[::step], rotation=60, fontsize=8)
+    ax.set_title(title, fontsize=14)
+    fig.colorbar(image, ax=ax, label=value_label)
+    fig.tight_layout()
+    return _encode_png(fig, dpi)
+
+
+def chart_key(*parts):
+    # (ticker, start, end, params...) -> 可放進網址的短 key
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+class ChartPipeline:
+    def __init__(self, max_workers=2, max_entries=128):
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chart')
+        self._cache = OrderedDict()   # key -> PNG bytes
+        self._pending = {}            # key -> Future
+        self._lock = threading.Lock()
+
+    def submit(self, key, *args, renderer=render_macd_chart, **kwargs):
+        """排入背景繪圖 (已快取或繪製中則不重複)，回傳 key。renderer 預設為 MACD 圖。"""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return key
+            if key not in self._pending:
+                future = self._executor.submit(renderer, *args, **kwargs)
+                self._pending[key] = future
+                future.add_done_callback(lambda f, k=key: self._store(k, f))
+        return key
+
+    def put(self, key, png):
+        """放入已經畫好的 PNG (例如預先計算的快照)。"""
+        with self._lock:
+            self._cache[key] = png
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _store(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.exception() is None:
+                self._cache[key] = future.result()
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+
+    def get(self, key, timeout=None):
+        """取得 PNG bytes；若仍在繪製中則等待完成，未知的 key 回傳 None。"""
+        with self._lock:
+            png = self._cache.get(key)
+            if png is not None:
+                self._cache.move_to_end(key)
+                return png
+            future = self._pending.get(key)
+        if future is None:
+            return None
+        return future.result(timeout=timeout)
+
+    def render(self, key, *args, renderer=render_macd_chart, **kwargs):
+        # 同步取得圖表 (背景工作中使用)，仍會經過快取
+        self.submit(key, *args, renderer=renderer, **kwargs)
+        return self.get(key)
+
+
+_default_pipeline = None
+_default_pipeline_guard = threading.Lock()
+
+
+def get_pipeline():
+    global _default_pipeline
+    with _default_pipeline_guard:
+        if _default_pipeline is None:
+            _default_pipeline = ChartPipeline()
+        return _default_pipeline
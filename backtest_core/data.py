@@ -0,0 +1,219 @@
+# data.py
+# 本機 OHLCV 價格快取：每個代號一個 SQLite 檔，記錄已下載過的日期區間，
+# 只向 yfinance 補抓缺少的區段，之後任何 [start, end) 區間皆直接由磁碟讀取。
+# yfinance 的價格為還原權值後的價格，除權息或分割後整段歷史都會改變：補抓時一併下載缺口兩側各一根
+# 已快取的 K 棒比對，不一致時清空該代號的快取整段重抓，避免新舊資料接縫處出現假的跳空
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from backtest_core.metrics import FETCH_TOTAL, FETCH_SECONDS
+from backtest_core.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+DEFAULT_CACHE_DIR = os.getenv(
+    'PRICE_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.price_cache')
+)
+SEAM_RTOL = 1e-6   # 接縫 K 棒收盤價的容許誤差，超過即視為還原權值已改變
+
+
+def yfinance_fetcher(ticker, start, end):
+    import yfinance as yf
+    return yf.Ticker(ticker).history(start=start, end=end)
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _merge_intervals(intervals):
+    merged = []
+    for s, e in sorted(intervals):
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return [tuple(x) for x in merged]
+
+
+def missing_ranges(covered, start, end):
+    # 回傳 [start, end) 中尚未被 covered 涵蓋的區段
+    gaps = []
+    cursor = start
+    for s, e in _merge_intervals(covered):
+        if e <= cursor or s >= end:
+            continue
+        if s > cursor:
+            gaps.append((cursor, min(s, end)))
+        cursor = max(cursor, e)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class PriceStore:
+    """fetcher 為 None 時為離線模式：不補抓缺少的區段，只回傳磁碟上已有的資料。"""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, fetcher=yfinance_fetcher, today=date.today):
+        self.root = root
+        self.fetcher = fetcher
+        self.today = today
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, ticker):
+        safe = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in ticker)
+        return os.path.join(self.root, f'{safe}.sqlite3')
+
+    def _lock(self, ticker):
+        with self._locks_guard:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    def _connect(self, ticker):
+        conn = sqlite3.connect(self._path(ticker))
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS bars (date TEXT PRIMARY KEY, '
+            'open REAL, high REAL, low REAL, close REAL, volume REAL)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS coverage (start TEXT, end TEXT)')
+        return conn
+
+    def _covered(self, conn):
+        rows = conn.execute('SELECT start, end FROM coverage').fetchall()
+        return [(_to_date(s), _to_date(e)) for s, e in rows]
+
+    def _write(self, conn, df, covered_ranges):
+        rows = [
+            (idx.strftime('%Y-%m-%d'), *(float(row[c]) for c in COLUMNS))
+            for idx, row in df[COLUMNS].iterrows()
+        ] if df is not None and not df.empty else []
+        merged = _merge_intervals(self._covered(conn) + list(covered_ranges))
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?)', rows)
+            conn.execute('DELETE FROM coverage')
+            conn.executemany('INSERT INTO coverage VALUES (?, ?)',
+                             [(s.isoformat(), e.isoformat()) for s, e in merged])
+
+    def seed(self, ticker, df, start=None, end=None):
+        # 直接寫入既有資料（離線測試或預先匯入用），區間預設為資料首尾
+        start = _to_date(start or df.index[0])
+        end = _to_date(end) if end else _to_date(df.index[-1]) + timedelta(days=1)
+        with self._lock(ticker):
+            conn = self._connect(ticker)
+            try:
+                self._write(conn, df, [(start, end)])
+            finally:
+                conn.close()
+
+    def _fetch(self, ticker, start, end):
+        # 下載次數依結果 (ok / empty / error) 分類，耗時同時記到 fetch_remote 段落
+        started = time.perf_counter()
+        try:
+            with stage('fetch_remote'):
+                df = self.fetcher(ticker, start.isoformat(), end.isoformat())
+        except Exception:
+            FETCH_TOTAL.inc(result='error')
+            raise
+        finally:
+            FETCH_SECONDS.observe(time.perf_counter() - started)
+        FETCH_TOTAL.inc(result='empty' if df is None or df.empty else 'ok')
+        return df
+
+    def _seams(self, conn, start, end):
+        # 缺口前最後一根與缺口後第一根已快取的 K 棒
+        before = conn.execute('SELECT date, close FROM bars WHERE date < ? ORDER BY date DESC LIMIT 1',
+                              (start.isoformat(),)).fetchone()
+        after = conn.execute('SELECT date, close FROM bars WHERE date >= ? ORDER BY date LIMIT 1',
+                             (end.isoformat(),)).fetchone()
+        return [row for row in (before, after) if row is not None]
+
+    def _fill(self, conn, ticker, start, end, check=True):
+        # 下載 [start, end) 並寫入；check 時連同接縫 K 棒一起下載，還原權值改變時不寫入並回傳 False
+        seams = self._seams(conn, start, end) if check else []
+        fetch_start = min([start] + [_to_date(d) for d, _ in seams])
+        fetch_end = max([end] + [_to_date(d) + timedelta(days=1) for d, _ in seams])
+        df = self._fetch(ticker, fetch_start, fetch_end)
+        if seams and df is not None and not df.empty:
+            fetched = dict(zip(df.index.strftime('%Y-%m-%d'), df['Close'].astype(float)))
+            for day, close in seams:
+                if day in fetched and abs(fetched[day] - close) > SEAM_RTOL * abs(close):
+                    logger.info('%s 在 %s 的還原價格由 %s 變為 %s，重新下載整段歷史', ticker, day, close, fetched[day])
+                    return False
+        # 今天 (含) 之後的資料可能尚未收盤，不標記為已涵蓋
+        covered_end = min(end, self.today())
+        self._write(conn, df, [(start, covered_end)] if covered_end > start else [])
+        return True
+
+    def _refetch_all(self, conn, ticker, start, end):
+        # 清空該代號的快取，以單次下載重建原本涵蓋的範圍與這次要求的區間
+        covered = self._covered(conn)
+        start = min([start] + [s for s, _ in covered])
+        end = max([end] + [e for _, e in covered])
+        with conn:
+            conn.execute('DELETE FROM bars')
+            conn.execute('DELETE FROM coverage')
+        self._fill(conn, ticker, start, end, check=False)
+
+    def history(self, ticker, start, end):
+        start, end = _to_date(start), _to_date(end)
+        with self._lock(ticker):
+            conn = self._connect(ticker)
+            try:
+                # 離線模式不補抓，缺少的區段也不標記為已涵蓋
+                gaps = missing_ranges(self._covered(conn), start, end) if self.fetcher is not None else []
+                for gap_start, gap_end in gaps:
+                    if not self._fill(conn, ticker, gap_start, gap_end):
+                        self._refetch_all(conn, ticker, start, end)
+                        break
+                rows = conn.execute(
+                    'SELECT date, open, high, low, close, volume FROM bars '
+                    'WHERE date >= ? AND date < ? ORDER BY date',
+                    (start.isoformat(), end.isoformat())
+                ).fetchall()
+            finally:
+                conn.close()
+        df = pd.DataFrame(rows, columns=['Date'] + COLUMNS)
+        df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('Date')), name='Date')
+        return df
+
+
+_default_store = None
+_default_store_guard = threading.Lock()
+
+
+def get_store():
+    global _default_store
+    with _default_store_guard:
+        if _default_store is None:
+            _default_store = PriceStore()
+        return _default_store
+
+
+def data_version(df):
+    # 價格資料內容的雜湊，作為快取 key 的資料版本；資料被修正或補上新 K 棒時即改變
+    h = hashlib.sha1()
+    h.update(df.index.asi8.tobytes())
+    h.update(df[COLUMNS].to_numpy(dtype='float64').tobytes())
+    return h.hexdigest()
+
+
+def load_history(ticker, start, end):
+    """兩個前端共用的價格取得入口，回傳與 yf.Ticker().history() 相同欄位的 DataFrame。"""
+    return get_store().history(ticker, start, end)
@@ -0,0 +1,362 @@
+# engine.py
+# 以 NumPy 陣列執行的回測引擎：
+#   1. 進場/出場訊號 (例如 MACD 黃金/死亡交叉) 以陣列運算一次找出
+#   2. 停損/停利等具狀態的出場條件，以「跳到下一個事件」的狀態機處理，
+#      持有期間以區塊向量化搜尋出場點，不再逐列 df.iloc
+
+from typing import NamedTuple
+
+import numpy as np
+
+FEE_RATE = 0.001425
+TAX_RATE = 0.001  # ETF 稅率為 0.1%
+STOP_LOSS_PCT = 0.05
+TAKE_PROFIT_PCT = 0.10
+
+# 交易動作代碼
+BUY = 'buy'
+DEATH_CROSS = 'death_cross'
+STOP_LOSS = 'stop_loss'
+TAKE_PROFIT = 'take_profit'
+FINAL_CLOSE = 'final_close'
+SIGNAL_EXIT = 'signal_exit'     # 非 MACD 策略的出場訊號
+ACTIONS = (BUY, DEATH_CROSS, STOP_LOSS, TAKE_PROFIT, FINAL_CLOSE, SIGNAL_EXIT)   # TradeLog.action_code 的對照
+
+EXIT_SEARCH_CHUNK = 64   # 出場搜尋的第一個區塊大小 (K 棒數)，之後每段倍增
+
+
+class Trade(NamedTuple):
+    index: int      # 成交 K 棒位置
+    action: str     # ACTIONS 其中之一
+    price: float
+    shares: int
+    cash: float     # 成交後的資金餘額
+    roi: float      # 單筆報酬率 (%)，買進時為 nan
+    profit: float   # 單筆損益，買進時為 nan
+
+
+class TradeLog:
+    """以欄位陣列保存的交易紀錄 (預先配置)，逐筆存取時才產生 Trade。"""
+
+    __slots__ = ('index', 'action_code', 'price', 'shares', 'cash', 'roi', 'profit', '_size')
+    COLUMNS = ('index', 'action_code', 'price', 'shares', 'cash', 'roi', 'profit')
+
+    def __init__(self, capacity=0):
+        self.index = np.empty(capacity, dtype=np.int64)
+        self.action_code = np.empty(capacity, dtype=np.int8)
+        self.price = np.empty(capacity, dtype=np.float64)
+        self.shares = np.empty(capacity, dtype=np.int64)
+        self.cash = np.empty(capacity, dtype=np.float64)
+        self.roi = np.empty(capacity, dtype=np.float64)
+        self.profit = np.empty(capacity, dtype=np.float64)
+        self._size = 0
+
+    @classmethod
+    def from_columns(cls, **columns):
+        log = cls()
+        for name in cls.COLUMNS:
+            setattr(log, name, np.asarray(columns[name], dtype=getattr(log, name).dtype))
+        log._size = len(log.index)
+        return log
+
+    def append(self, index, action, price, shares, cash, roi, profit):
+        k = self._size
+        self.index[k] = index
+        self.action_code[k] = ACTIONS.index(action)
+        self.price[k] = price
+        self.shares[k] = shares
+        self.cash[k] = cash
+        self.roi[k] = roi
+        self.profit[k] = profit
+        self._size = k + 1
+
+    def trim(self):
+        # 模擬結束後把欄位縮成實際筆數 (切片為 view，不複製)
+        for name in self.COLUMNS:
+            setattr(self, name, getattr(self, name)[:self._size])
+        return self
+
+    def take(self, rows):
+        return TradeLog.from_columns(**{name: getattr(self, name)[:self._size][rows] for name in self.COLUMNS})
+
+    def with_index(self, index):
+        """回傳以新 K 棒位置取代 index 欄的副本 (例如對齊到投資組合的共同日期)。"""
+        columns = {name: getattr(self, name)[:self._size] for name in self.COLUMNS}
+        columns['index'] = index
+        return TradeLog.from_columns(**columns)
+
+    @property
+    def actions(self):
+        return np.array(ACTIONS, dtype=object)[self.action_code[:self._size]]
+
+    @property
+    def sells(self):
+        return self.action_code[:self._size] != ACTIONS.index(BUY)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.COLUMNS)
+
+    def _trade(self, k):
+        return Trade(int(self.index[k]), ACTIONS[self.action_code[k]], float(self.price[k]), int(self.shares[k]),
+                     float(self.cash[k]), float(self.roi[k]), float(self.profit[k]))
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return (self._trade(k) for k in range(self._size))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._trade(k) for k in range(*key.indices(self._size))]
+        if key < 0:
+            key += self._size
+        if not 0 <= key < self._size:
+            raise IndexError(key)
+        return self._trade(key)
+
+
+class Simulation(NamedTuple):
+    trades: TradeLog
+    cash: float
+    total_trades: int
+    winning_trades: int
+    cash_curve: np.ndarray     # 每根 K 棒收盤後的現金
+    shares_curve: np.ndarray   # 每根 K 棒收盤後的持股
+    equity: np.ndarray         # 每根 K 棒收盤後的總資產
+    max_drawdown: float        # 比例 (0~1)
+
+
+def find_crosses(dif, macd):
+    """回傳 (golden, death) 布林陣列，index 0 恆為 False。"""
+    dif = np.asarray(dif, dtype=np.float64)
+    macd = np.asarray(macd, dtype=np.float64)
+    golden = np.zeros(len(dif), dtype=bool)
+    death = np.zeros(len(dif), dtype=bool)
+    golden[1:] = (dif[:-1] < macd[:-1]) & (dif[1:] > macd[1:])
+    death[1:] = (dif[:-1] > macd[:-1]) & (dif[1:] < macd[1:])
+    return golden, death
+
+
+def find_exit(close, exit_signal, start, buy_price, stop_loss_pct, take_profit_pct, exit_action=DEATH_CROSS):
+    """
+    由 start 開始分段搜尋第一個出場 K 棒 (區塊大小倍增以兼顧短持有與長持有)，
+    回傳 (K 棒, 動作)；沒有出場時為 (None, None)。
+    """
+    n = len(close)
+    lo, chunk = start, EXIT_SEARCH_CHUNK
+    while lo < n:
+        hi = min(n, lo + chunk)
+        change = (close[lo:hi] - buy_price) / buy_price
+        is_stop = change <= -stop_loss_pct
+        is_take = change >= take_profit_pct
+        hit = exit_signal[lo:hi] | is_stop | is_take
+        k = int(hit.argmax())
+        if hit[k]:
+            # 判斷順序與原本迴圈一致：出場訊號 (死亡交叉) > 停損 > 停利
+            if exit_signal[lo + k]:
+                return lo + k, exit_action
+            if is_stop[k]:
+                return lo + k, STOP_LOSS
+            return lo + k, TAKE_PROFIT
+        lo, chunk = hi, chunk * 2
+    return None, None
+
+
+def sell_proceeds(shares, price, buy_price, fee_rate, tax_rate):
+    revenue = shares * price
+    fee = revenue * fee_rate
+    tax = revenue * tax_rate
+    net_income = revenue - fee - tax
+
+    buy_cost = shares * buy_price
+    profit = net_income - (buy_cost * (1 + fee_rate))
+    roi = (profit / buy_cost) * 100 if buy_cost > 0 else 0
+    return net_income, profit, roi
+
+
+def simulate_macd(close, dif, macd, initial_cash,
+                  fee_rate=FEE_RATE, tax_rate=TAX_RATE,
+                  stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT,
+                  crosses=None):
+    # crosses: 預先算好的 find_crosses() 結果，可在不同本金的回測間重複使用
+    golden, death = crosses if crosses is not None else find_crosses(dif, macd)
+    return simulate_signals(close, golden, death, initial_cash, fee_rate=fee_rate, tax_rate=tax_rate,
+                            stop_loss_pct=stop_loss_pct, take_profit_pct=take_profit_pct,
+                            exit_action=DEATH_CROSS)
+
+
+def simulate_signals(close, entry, exit_signal, initial_cash,
+                     fee_rate=FEE_RATE, tax_rate=TAX_RATE,
+                     stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT,
+                     exit_action=SIGNAL_EXIT):
+    """空手時於 entry 為 True 的 K 棒以收盤價全額買進，持有時遇 exit_signal、停損或停利賣出。
+
+    stop_loss_pct / take_profit_pct 為 None 時不設停損/停利；index 0 的訊號不會成交。
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    exit_signal = np.asarray(exit_signal, dtype=bool)
+    stop_loss_pct = np.inf if stop_loss_pct is None else stop_loss_pct
+    take_profit_pct = np.inf if take_profit_pct is None else take_profit_pct
+    golden_idx = np.flatnonzero(entry)
+
+    cash_curve = np.empty(n, dtype=np.float64)
+    shares_curve = np.zeros(n, dtype=np.int64)
+    # 每個進場訊號最多一買一賣，再加上期末平倉
+    trades = TradeLog(2 * len(golden_idx) + 1)
+    cash = initial_cash
+    total_trades = 0
+    winning_trades = 0
+    shares = 0
+    buy_price = 0.0
+    seg_start = 0   # 目前現金/持股狀態生效的起始 K 棒
+    pos = 1         # 下一根要檢查的 K 棒
+
+    while pos < n:
+        # 空手：直接跳到下一個進場訊號
+        k = int(np.searchsorted(golden_idx, pos))
+        if k == len(golden_idx):
+            break
+        i = int(golden_idx[k])
+        price = close[i]
+        shares_to_buy = int(cash // (price * (1 + fee_rate)))
+        if shares_to_buy <= 0:
+            pos = i + 1
+            continue
+
+        cash_curve[seg_start:i] = cash
+        cost = shares_to_buy * price
+        fee = cost * fee_rate
+        cash -= cost + fee
+        shares, buy_price, seg_start = shares_to_buy, price, i
+        trades.append(i, BUY, price, shares, cash, np.nan, np.nan)
+
+        # 持有：向量化搜尋出場點
+        j, reason = find_exit(close, exit_signal, i + 1, buy_price, stop_loss_pct, take_profit_pct, exit_action)
+        if j is None:
+            break
+
+        cash_curve[seg_start:j] = cash
+        shares_curve[seg_start:j] = shares
+        net_income, profit, roi = sell_proceeds(shares, close[j], buy_price, fee_rate, tax_rate)
+        cash += net_income
+        total_trades += 1
+        if profit > 0:
+            winning_trades += 1
+        trades.append(j, reason, close[j], shares, cash, roi, profit)
+        shares, buy_price, seg_start = 0, 0.0, j
+        pos = j + 1
+
+    cash_curve[seg_start:] = cash
+    shares_curve[seg_start:] = shares
+
+    # 每日資產與最大回撤 (自第 1 根 K 棒起算，峰值以初始資金為起點)
+    equity = cash_curve + shares_curve * close
+    max_drawdown = 0.0
+    if n > 1:
+        peak = np.maximum.accumulate(np.concatenate(([initial_cash], equity[1:])))[1:]
+        drawdowns = (peak - equity[1:]) / peak
+        max_drawdown = max(0.0, float(drawdowns.max()))
+
+    # 期末強制平倉
+    if shares > 0:
+        final_price = close[-1]
+        net_income, profit, roi = sell_proceeds(shares, final_price, buy_price, fee_rate, tax_rate)
+        cash += net_income
+        total_trades += 1
+        if profit > 0:
+            winning_trades += 1
+        trades.append(n - 1, FINAL_CLOSE, final_price, shares, cash, roi, profit)
+
+    return Simulation(trades.trim(), float(cash), total_trades, winning_trades,
+                      cash_curve, shares_curve, equity, max_drawdown)
+
+
+class BatchSimulation(NamedTuple):
+    cash: np.ndarray            # 每條路徑期末資金 (已強制平倉)
+    total_trades: np.ndarray
+    winning_trades: np.ndarray
+    max_drawdown: np.ndarray    # 比例 (0~1)
+
+
+def simulate_macd_batch(close, dif, macd, initial_cash,
+                        fee_rate=FEE_RATE, tax_rate=TAX_RATE,
+                        stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT):
+    """多條價格路徑一起回測：close/dif/macd 為 (路徑數, K 棒數) 陣列。
+
+    依時間逐根前進、在路徑維度上向量化，規則與 simulate_macd 相同 (同一根 K 棒賣出後不會再買進)，
+    只回傳彙總指標，不保留交易紀錄。
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n_paths, n = close.shape
+    golden, death = find_crosses_batch(dif, macd)
+
+    cash = np.full(n_paths, float(initial_cash))
+    shares = np.zeros(n_paths, dtype=np.int64)
+    buy_price = np.zeros(n_paths)
+    total_trades = np.zeros(n_paths, dtype=np.int64)
+    winning_trades = np.zeros(n_paths, dtype=np.int64)
+    peak = cash.copy()
+    max_drawdown = np.zeros(n_paths)
+
+    for t in range(1, n):
+        price = close[:, t]
+        holding = shares > 0
+
+        # 出場：死亡交叉、停損或停利
+        change = np.where(holding, (price - buy_price) / np.where(holding, buy_price, 1.0), 0.0)
+        exit_ = holding & (death[:, t] | (change <= -stop_loss_pct) | (change >= take_profit_pct))
+        if exit_.any():
+            net_income, profit = _sell_batch(shares[exit_], price[exit_], buy_price[exit_], fee_rate, tax_rate)
+            cash[exit_] += net_income
+            total_trades[exit_] += 1
+            winning_trades[exit_] += profit > 0
+            shares[exit_] = 0
+
+        # 進場：本根開始時空手且出現黃金交叉
+        entry = ~holding & golden[:, t]
+        if entry.any():
+            idx = np.flatnonzero(entry)
+            p = price[idx]
+            to_buy = (cash[idx] // (p * (1 + fee_rate))).astype(np.int64)
+            ok = to_buy > 0
+            idx, p, to_buy = idx[ok], p[ok], to_buy[ok]
+            cost = to_buy * p
+            cash[idx] -= cost + cost * fee_rate
+            shares[idx] = to_buy
+            buy_price[idx] = p
+
+        equity = cash + shares * price
+        np.maximum(peak, equity, out=peak)
+        np.maximum(max_drawdown, (peak - equity) / peak, out=max_drawdown)
+
+    # 期末強制平倉
+    held = shares > 0
+    if held.any():
+        net_income, profit = _sell_batch(shares[held], close[held, -1], buy_price[held], fee_rate, tax_rate)
+        cash[held] += net_income
+        total_trades[held] += 1
+        winning_trades[held] += profit > 0
+
+    return BatchSimulation(cash, total_trades, winning_trades, max_drawdown)
+
+
+def _sell_batch(shares, price, buy_price, fee_rate, tax_rate):
+    # sell_proceeds 的陣列版本，運算順序相同以得到相同的浮點結果
+    revenue = shares * price
+    net_income = revenue - revenue * fee_rate - revenue * tax_rate
+    profit = net_income - (shares * buy_price * (1 + fee_rate))
+    return net_income, profit
+
+
+def find_crosses_batch(dif, macd):
+    """find_crosses 的 2-D 版本，沿最後一軸 (時間) 判斷。"""
+    dif = np.asarray(dif, dtype=np.float64)
+    macd = np.asarray(macd, dtype=np.float64)
+    golden = np.zeros(dif.shape, dtype=bool)
+    death = np.zeros(dif.shape, dtype=bool)
+    golden[:, 1:] = (dif[:, :-1] < macd[:, :-1]) & (dif[:, 1:] > macd[:, 1:])
+    death[:, 1:] = (dif[:, :-1] > macd[:, :-1]) & (dif[:, 1:] < macd[:, 1:])
+    return golden, death
@@ -0,0 +1,234 @@
+# execution.py
+# 較貼近實際成交的執行層，與 engine.simulate_signals 相同採「跳到下一個事件」的狀態機：
+#   - 成交時點：訊號當根收盤 (close) 或下一根開盤 (next_open)
+#   - 停損/停利：以收盤價判斷，或以當根 High/Low 盤中觸發 (跳空時以開盤價成交)
+#   - 整股 (1000 股) 或零股交易、券商手續費折扣與最低手續費、以 bps 或跳動檔位計的滑價
+# Python 迴圈只在每筆交易執行一次，持有期間以區塊向量化搜尋出場點，不逐列存取。
+
+from typing import NamedTuple
+
+import numpy as np
+
+from backtest_core.engine import (TradeLog, Simulation, BUY, STOP_LOSS, TAKE_PROFIT, FINAL_CLOSE,
+                                  SIGNAL_EXIT, FEE_RATE, TAX_RATE, STOP_LOSS_PCT, TAKE_PROFIT_PCT,
+                                  EXIT_SEARCH_CHUNK)
+
+FILLS = ('close', 'next_open')
+BOARD_LOT = 1000
+
+# 台股股票升降單位：(價格上限, 跳動單位)
+TICK_TABLE = ((10, 0.01), (50, 0.05), (100, 0.1), (500, 0.5), (1000, 1.0), (np.inf, 5.0))
+
+
+class ExecutionModel(NamedTuple):
+    fill: str = 'close'             # 'close'：訊號當根收盤；'next_open'：下一根開盤
+    intrabar_stops: bool = False    # True：停損/停利以 High/Low 盤中觸發
+    lot_size: int = 1               # 1：零股；1000：整股
+    fee_rate: float = FEE_RATE
+    fee_discount: float = 1.0       # 券商手續費折扣，例如 0.6 為六折
+    min_fee: float = 0.0            # 每筆最低手續費 (元)
+    tax_rate: float = TAX_RATE      # 證交稅，賣出時收取
+    slippage_bps: float = 0.0       # 不利方向的滑價 (萬分之一)
+    slippage_ticks: int = 0         # 不利方向的滑價 (跳動檔數)
+
+    @classmethod
+    def from_dict(cls, params):
+        """由查詢參數或 JSON 建立；preset 指定預設組合，其餘欄位覆蓋。格式錯誤時丟出 ValueError。"""
+        params = dict(params)
+        preset = params.pop('preset', None) or 'close'
+        if preset not in EXECUTION_PRESETS:
+            raise ValueError(f"執行模型必須是 {', '.join(EXECUTION_PRESETS)} 其中之一。")
+        model = EXECUTION_PRESETS[preset]
+        fields = {}
+        for name, value in params.items():
+            if name not in cls._fields or value is None:
+                continue
+            default = cls._field_defaults[name]
+            if isinstance(default, bool):
+                value = value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+            fields[name] = type(default)(value)
+        model = model._replace(**fields)
+        model.validate()
+        return model
+
+    def validate(self):
+        if self.fill not in FILLS:
+            raise ValueError(f"成交時點必須是 {', '.join(FILLS)} 其中之一。")
+        if self.lot_size <= 0:
+            raise ValueError('交易單位必須大於 0。')
+        if self.fee_discount < 0 or self.min_fee < 0 or self.slippage_bps < 0 or self.slippage_ticks < 0:
+            raise ValueError('手續費折扣、最低手續費與滑價不可為負數。')
+
+    def fee(self, value):
+        fee = value * self.fee_rate * self.fee_discount if self.fee_discount != 1.0 else value * self.fee_rate
+        return max(fee, self.min_fee) if value > 0 else 0.0
+
+    def slip(self, price, side):
+        """side 為 +1 (買進，價格往上) 或 -1 (賣出，價格往下)。"""
+        if self.slippage_bps:
+            price = price * (1 + side * self.slippage_bps / 10_000)
+        if self.slippage_ticks:
+            price = price + side * self.slippage_ticks * tick_size(price)
+        return price
+
+    def shares_for(self, cash, price):
+        # 以現金可負擔的最大股數，取交易單位的整數倍；最低手續費可能使其再少一單位
+        rate = self.fee_rate * self.fee_discount if self.fee_discount != 1.0 else self.fee_rate
+        shares = int(cash // (price * (1 + rate))) // self.lot_size * self.lot_size
+        while shares > 0 and shares * price + self.fee(shares * price) > cash:
+            shares -= self.lot_size
+        return shares
+
+
+EXECUTION_PRESETS = {
+    # 與原本引擎相同：當根收盤成交、收盤價判斷停損停利、零股、無最低手續費與滑價
+    'close': ExecutionModel(),
+    'tw_board': ExecutionModel(fill='next_open', intrabar_stops=True, lot_size=BOARD_LOT,
+                               min_fee=20.0, slippage_ticks=1),
+    'tw_odd': ExecutionModel(fill='next_open', intrabar_stops=True, lot_size=1, min_fee=1.0, slippage_ticks=1),
+}
+
+
+def parse_execution(params):
+    """由查詢參數取出執行模型 (execution=預設組合名稱，其餘為 ExecutionModel 欄位)；皆未指定時回傳 None。"""
+    fields = {k: v for k, v in params.items() if k in ExecutionModel._fields}
+    if params.get('execution'):
+        fields['preset'] = params['execution']
+    return ExecutionModel.from_dict(fields) if fields else None
+
+
+def tick_size(price):
+    for limit, tick in TICK_TABLE:
+        if price < limit:
+            return tick
+    return TICK_TABLE[-1][1]
+
+
+def _find_exit(open_, high, low, close, exit_signal, start, buy_price, stop_loss_pct, take_profit_pct, intrabar):
+    # 由 start 開始分段搜尋第一個出場 K 棒 (區塊大小倍增，與 engine.find_exit 相同)；
+    # 回傳 (出場 K 棒, 原因, 盤中成交價)，原因為 None 表示出場訊號，成交價為 None 表示依成交時點成交
+    n = len(close)
+    stop_price, take_price = buy_price * (1 - stop_loss_pct), buy_price * (1 + take_profit_pct)
+    lo, chunk = start, EXIT_SEARCH_CHUNK
+    while lo < n:
+        hi = min(n, lo + chunk)
+        if intrabar:
+            is_stop = low[lo:hi] <= stop_price
+            is_take = high[lo:hi] >= take_price
+        else:
+            # 與 engine.find_exit 相同的算式，預設模型的結果才會逐位元一致
+            change = (close[lo:hi] - buy_price) / buy_price
+            is_stop = change <= -stop_loss_pct
+            is_take = change >= take_profit_pct
+        hit = exit_signal[lo:hi] | is_stop | is_take
+        k = int(hit.argmax())
+        if hit[k]:
+            j = lo + k
+            if intrabar:
+                # 盤中觸價先於收盤才確認的訊號；同一根同時觸及停損與停利時保守視為停損；跳空時以開盤價成交
+                if is_stop[k]:
+                    return j, STOP_LOSS, min(open_[j], stop_price)
+                if is_take[k]:
+                    return j, TAKE_PROFIT, max(open_[j], take_price)
+                return j, None, None
+            # 與 simulate_signals 相同的順序：出場訊號 > 停損 > 停利
+            if exit_signal[j]:
+                return j, None, None
+            return j, STOP_LOSS if is_stop[k] else TAKE_PROFIT, None
+        lo, chunk = hi, chunk * 2
+    return None, None, None
+
+
+def simulate_orders(open_, high, low, close, entry, exit_signal, initial_cash, model=ExecutionModel(),
+                    stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT, exit_action=SIGNAL_EXIT):
+    """
+    進出場訊號皆於 K 棒收盤時確認，依 model 成交。預設 ExecutionModel() 的結果與 simulate_signals 相同
+    (單筆損益以實付手續費計算，可能有最後一位的浮點差異)。stop_loss_pct / take_profit_pct 為 None 時不設。
+    """
+    open_, high, low, close = (np.asarray(a, dtype=np.float64) for a in (open_, high, low, close))
+    n = len(close)
+    exit_signal = np.asarray(exit_signal, dtype=bool)
+    stop_loss_pct = np.inf if stop_loss_pct is None else stop_loss_pct
+    take_profit_pct = np.inf if take_profit_pct is None else take_profit_pct
+    next_open = model.fill == 'next_open'
+    entry_idx = np.flatnonzero(entry)
+
+    cash_curve = np.empty(n, dtype=np.float64)
+    shares_curve = np.zeros(n, dtype=np.int64)
+    trades = TradeLog(2 * len(entry_idx) + 1)
+    cash = float(initial_cash)
+    total_trades = winning_trades = 0
+    shares = 0
+    buy_price = buy_cost = 0.0
+    seg_start = 0
+    pos = 1
+
+    def sell(bar, price, reason):
+        nonlocal cash, total_trades, winning_trades
+        price = model.slip(price, -1)
+        revenue = shares * price
+        net_income = revenue - model.fee(revenue) - revenue * model.tax_rate
+        profit = net_income - buy_cost
+        roi = profit / (shares * buy_price) * 100 if buy_price > 0 else 0
+        cash += net_income
+        total_trades += 1
+        if profit > 0:
+            winning_trades += 1
+        trades.append(bar, reason, price, shares, cash, roi, profit)
+
+    while pos < n:
+        k = int(np.searchsorted(entry_idx, pos))
+        if k == len(entry_idx):
+            break
+        i = int(entry_idx[k])
+        fill = i + 1 if next_open else i
+        if fill >= n:
+            break
+        price = model.slip(open_[fill] if next_open else close[fill], +1)
+        to_buy = model.shares_for(cash, price)
+        if to_buy <= 0:
+            pos = i + 1
+            continue
+
+        cash_curve[seg_start:fill] = cash
+        cost = to_buy * price
+        fee = model.fee(cost)
+        cash -= cost + fee
+        shares, buy_price, buy_cost, seg_start = to_buy, price, cost + fee, fill
+        trades.append(fill, BUY, price, shares, cash, np.nan, np.nan)
+
+        # 出場訊號由訊號隔根開始檢查；停損停利在收盤成交時由隔根開始，開盤成交時 (即隔根) 當根盤中就生效
+        j, reason, intrabar_price = _find_exit(open_, high, low, close, exit_signal, i + 1, buy_price,
+                                               stop_loss_pct, take_profit_pct, model.intrabar_stops)
+        if j is None:
+            break
+        if intrabar_price is not None:
+            exit_bar, exit_price = j, intrabar_price
+        elif next_open:
+            if j + 1 >= n:
+                break   # 最後一根才出現訊號，交給期末平倉
+            exit_bar, exit_price = j + 1, open_[j + 1]
+        else:
+            exit_bar, exit_price = j, close[j]
+
+        cash_curve[seg_start:exit_bar] = cash
+        shares_curve[seg_start:exit_bar] = shares
+        sell(exit_bar, exit_price, reason or exit_action)
+        shares, buy_price, buy_cost, seg_start = 0, 0.0, 0.0, exit_bar
+        # 開盤成交後，同一根收盤的進場訊號仍可使用
+        pos = exit_bar if next_open else exit_bar + 1
+
+    cash_curve[seg_start:] = cash
+    shares_curve[seg_start:] = shares
+
+    equity = cash_curve + shares_curve * close
+    max_drawdown = 0.0
+    if n > 1:
+        peak = np.maximum.accumulate(np.concatenate(([initial_cash], equity[1:])))[1:]
+        max_drawdown = max(0.0, float(((peak - equity[1:]) / peak).max()))
+
+    if shares > 0:
+        sell(n - 1, close[-1], FINAL_CLOSE)
+
+    return Simulation(trades.trim(), float(cash), total_trades, winning_trades,
+                      cash_curve, shares_curve, equity, max_drawdown)
@@ -0,0 +1,113 @@
+# export.py
+# 交易紀錄與權益曲線的欄位式匯出 (CSV / Parquet / Arrow IPC)
+# 直接由 TradeLog 與權益陣列組成 DataFrame，不經過逐筆 dict 與格式化字串；
+# 網頁的交易紀錄表則由 TradePages 分頁讀取，只有送出的那一頁才轉成逐筆 dict
+
+import io
+
+import numpy as np
+import pandas as pd
+
+from backtest_core.engine import ACTIONS, BUY, TradeLog
+
+# 格式 -> (完整的 Content-Type，回應時以 content_type= 傳入；副檔名)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow'),
+}
+
+
+def trade_table(dates, trades, ticker=None):
+    """TradeLog -> DataFrame；動作以 category 欄保存。"""
+    table = pd.DataFrame({
+        'date': dates[trades.index],
+        'action': pd.Categorical.from_codes(trades.action_code, categories=ACTIONS),
+        'price': trades.price,
+        'shares': trades.shares,
+        'cash': trades.cash,
+        'roi': trades.roi,
+        'profit': trades.profit,
+    })
+    if ticker is not None:
+        table.insert(0, 'ticker', pd.Categorical([ticker] * len(table)))
+    return table
+
+
+class TradePages:
+    """一或多個標的的 TradeLog 依日期合併 (同日依標的順序) 後分頁讀取。"""
+
+    def __init__(self, dates, logs):
+        # logs：[(代號, TradeLog), ...]，各 TradeLog 的 index 皆為 dates 上的位置
+        self.dates = dates
+        self.tickers = [ticker for ticker, _ in logs]
+        if len(logs) == 1:
+            self.trades = logs[0][1]
+            self.owner = np.zeros(len(self.trades), dtype=np.int64)
+        else:
+            columns = {name: np.concatenate([getattr(log, name)[:len(log)] for _, log in logs])
+                       for name in TradeLog.COLUMNS}
+            owner = np.repeat(np.arange(len(logs)), [len(log) for _, log in logs])
+            order = np.argsort(columns['index'], kind='stable')
+            self.trades = TradeLog.from_columns(**{name: values[order] for name, values in columns.items()})
+            self.owner = owner[order]
+
+    def __len__(self):
+        return len(self.trades)
+
+    def rows(self, offset=0, limit=None):
+        """回傳 [offset, offset + limit) 的交易 dict；買進的 roi / profit 為 None。"""
+        stop = len(self) if limit is None else min(len(self), offset + limit)
+        rows = []
+        for k in range(max(0, offset), stop):
+            t = self.trades._trade(k)
+            sell = t.action != BUY
+            rows.append({
+                'ticker': self.tickers[self.owner[k]],
+                'date': self.dates[t.index].strftime('%Y-%m-%d'),
+                'action': t.action,
+                'price': t.price,
+                'shares': t.shares,
+                'cash': t.cash,
+                'roi': t.roi if sell else None,
+                'profit': t.profit if sell else None,
+            })
+        return rows
+
+
+def equity_table(dates, equity, columns=None):
+    """權益曲線 -> DataFrame；columns 可額外放入各標的的權益陣列。"""
+    table = pd.DataFrame({'date': dates, 'equity': np.asarray(equity, dtype=np.float64)})
+    for name, values in (columns or {}).items():
+        table[name] = np.asarray(values, dtype=np.float64)
+    return table
+
+
+def _require_pyarrow(fmt):
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValueError(f'{fmt} 匯出需要安裝 pyarrow (pip install pyarrow)。')
+    return pyarrow
+
+
+def export_table(table, fmt):
+    """回傳 (bytes, Content-Type, 副檔名)。"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"匯出格式必須是 {', '.join(EXPORT_FORMATS)} 其中之一。")
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    if fmt == 'csv':
+        # utf-8-sig 讓 Excel 正確顯示中文
+        return table.to_csv(index=False).encode('utf-8-sig'), mimetype, ext
+
+    pa = _require_pyarrow(fmt)
+    arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+    buffer = io.BytesIO()
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(arrow_table, buffer)
+    else:
+        import pyarrow.ipc as ipc
+        with ipc.new_file(buffer, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+    return buffer.getvalue(), mimetype, ext
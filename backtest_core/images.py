@@ -0,0 +1,100 @@
+# images.py
+# 以內容定址 (參數 + 資料版本的雜湊) 保存圖表 PNG 與縮圖：
+# 相同圖表只存一份；依檔案年齡與總容量定期清理，最久未使用的先刪除
+
+import io
+import os
+import re
+import threading
+import time
+
+_NAME = re.compile(r'^[0-9a-f]{8,64}(_preview)?\.png$')
+
+
+class ImageStore:
+    def __init__(self, root, max_bytes=200 * 1024 * 1024, max_age=7 * 24 * 3600,
+                 preview_size=(240, 240), sweep_interval=600, clock=time.time):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.preview_size = preview_size
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.writes = 0
+        self.dedup_hits = 0
+        self.removed = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _write(self, name, data):
+        # 先寫暫存檔再 rename，其他 worker 不會讀到寫到一半的檔案
+        tmp = self._path(f'.{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._path(name))
+
+    def _thumbnail(self, png_bytes):
+        from PIL import Image   # 只有產生縮圖時才需要，不影響啟動時間
+        image = Image.open(io.BytesIO(png_bytes))
+        image.thumbnail(self.preview_size)
+        out = io.BytesIO()
+        image.save(out, format='PNG', optimize=True)
+        return out.getvalue()
+
+    def put(self, key, png_bytes):
+        """保存圖表與縮圖，回傳 (原圖檔名, 縮圖檔名)；已存在時只更新使用時間。"""
+        names = (f'{key}.png', f'{key}_preview.png')
+        with self._lock:
+            if all(os.path.exists(self._path(n)) for n in names):
+                self.dedup_hits += 1
+                now = self.clock()
+                for n in names:
+                    os.utime(self._path(n), (now, now))
+            else:
+                self._write(names[0], png_bytes)
+                self._write(names[1], self._thumbnail(png_bytes))
+                self.writes += 1
+            due = self.clock() - self._last_sweep >= self.sweep_interval
+        if due:
+            self.sweep()
+        return names
+
+    def valid_name(self, name):
+        return bool(_NAME.match(name))
+
+    def _own_files(self):
+        # 只處理本模組寫入的檔名 (雜湊 + 可選 _preview)，目錄中其他 PNG 不計入也不刪除
+        return [e for e in os.scandir(self.root) if e.is_file() and _NAME.match(e.name)]
+
+    def sweep(self):
+        """刪除過期的圖，總容量仍超過上限時由最久未使用的開始刪。"""
+        with self._lock:
+            self._last_sweep = now = self.clock()
+            files = []
+            for entry in self._own_files():
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for mtime, size, path in files:
+                if now - mtime <= self.max_age and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self.removed += removed
+            return removed
+
+    def stats(self):
+        files = [e.stat().st_size for e in self._own_files()]
+        return {'root': self.root, 'files': len(files), 'bytes': sum(files), 'max_bytes': self.max_bytes,
+                'max_age': self.max_age, 'writes': self.writes, 'dedup_hits': self.dedup_hits,
+                'removed': self.removed}
@@ -0,0 +1,298 @@
+# intraday.py
+# 分鐘線 (1m / 5m / 60m) 回測：
+#   BarStore            ：每個 (代號, 週期) 一個資料夾，每欄一個只追加的二進位檔，讀取時以 np.memmap 映射，
+#                         不把數千萬根 K 棒整個載入 DataFrame
+#   ChunkedMacdBacktest ：依區塊串流計算 EMA / 交叉並回測，狀態跨區塊延續，
+#                         結果與對整段陣列呼叫 simulate_macd 相同；圖表資料同時以區塊最小/最大值降採樣
+
+import os
+import threading
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from backtest_core.charts import ChartSeries, downsample_series, concat_series, MAX_CHART_POINTS
+from backtest_core.data import DEFAULT_CACHE_DIR
+from backtest_core.engine import (find_crosses, sell_proceeds, find_exit, TradeLog, BUY, FINAL_CLOSE,
+                                  FEE_RATE, TAX_RATE, STOP_LOSS_PCT, TAKE_PROFIT_PCT)
+
+INTERVALS = ('1m', '5m', '60m')
+FIELDS = ('ts', 'open', 'high', 'low', 'close', 'volume')
+CHUNK_BARS = 1_000_000
+
+
+def yfinance_intraday_fetcher(ticker, interval, start, end):
+    # yfinance 的分鐘線只提供最近一段期間 (1m 約 7 天、5m 約 60 天、60m 約 730 天)
+    import yfinance as yf
+    return yf.Ticker(ticker).history(interval=interval, start=start, end=end)
+
+
+class Bars(NamedTuple):
+    ts: np.ndarray      # int64，UTC 奈秒
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self):
+        return len(self.ts)
+
+    def slice(self, a, b):
+        return Bars(*(col[a:b] for col in self))
+
+
+class BarStore:
+    def __init__(self, root=os.path.join(DEFAULT_CACHE_DIR, 'intraday'), fetcher=yfinance_intraday_fetcher):
+        self.root = root
+        self.fetcher = fetcher
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, ticker, interval):
+        if interval not in INTERVALS:
+            raise ValueError(f"週期必須是 {', '.join(INTERVALS)} 其中之一。")
+        safe = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in ticker)
+        return os.path.join(self.root, safe, interval)
+
+    def _lock(self, ticker, interval):
+        with self._locks_guard:
+            return self._locks.setdefault((ticker, interval), threading.Lock())
+
+    def _length(self, path):
+        # 以最短的欄位為準，寫到一半中斷時多出的尾端不會被讀到
+        files = [os.path.join(path, f'{f}.bin') for f in FIELDS]
+        return min(os.path.getsize(f) if os.path.exists(f) else 0 for f in files) // 8
+
+    def open(self, ticker, interval):
+        """回傳整段資料的 memmap (唯讀)。"""
+        path = self._dir(ticker, interval)
+        n = self._length(path)
+        if n == 0:
+            return Bars(np.empty(0, np.int64), *(np.empty(0) for _ in FIELDS[1:]))
+        return Bars(*(np.memmap(os.path.join(path, f'{f}.bin'), dtype=np.int64 if f == 'ts' else np.float64,
+                                mode='r', shape=(n,)) for f in FIELDS))
+
+    def bars(self, ticker, interval, start=None, end=None):
+        """[start, end) 區間的 memmap 切片 (不複製)。"""
+        bars = self.open(ticker, interval)
+        a = np.searchsorted(bars.ts, _to_ns(start), 'left') if start is not None else 0
+        b = np.searchsorted(bars.ts, _to_ns(end), 'left') if end is not None else len(bars)
+        return bars.slice(a, b)
+
+    def append(self, ticker, interval, df):
+        """追加新 K 棒 (只接受比既有資料更新的時間)，回傳寫入筆數。"""
+        if df.empty:
+            return 0
+        index = pd.DatetimeIndex(df.index)
+        index = index.tz_convert('UTC') if index.tz is not None else index.tz_localize('UTC')
+        ts = index.as_unit('ns').asi8
+        path = self._dir(ticker, interval)
+        with self._lock(ticker, interval):
+            os.makedirs(path, exist_ok=True)
+            n = self._length(path)
+            last = self.open(ticker, interval).ts[-1] if n else np.iinfo(np.int64).min
+            keep = ts > last
+            if not keep.any():
+                return 0
+            columns = {'ts': ts[keep]}
+            for f, col in zip(FIELDS[1:], ['Open', 'High', 'Low', 'Close', 'Volume']):
+                columns[f] = df[col].to_numpy(dtype=np.float64)[keep]
+            # ts 最後寫入：中斷時其他欄位多出的資料會被 _length 忽略
+            for f in FIELDS[1:] + ('ts',):
+                file_path = os.path.join(path, f'{f}.bin')
+                with open(file_path, 'r+b' if os.path.exists(file_path) else 'wb') as fh:
+                    fh.seek(n * 8)
+                    fh.truncate()
+                    fh.write(np.ascontiguousarray(columns[f]).tobytes())
+            return int(keep.sum())
+
+    def update(self, ticker, interval, start, end):
+        # 只向資料來源補抓最後一根之後的資料
+        bars = self.open(ticker, interval)
+        fetch_start = pd.Timestamp(bars.ts[-1], tz='UTC') if len(bars) else pd.Timestamp(start)
+        if self.fetcher is None or fetch_start >= pd.Timestamp(end, tz=fetch_start.tz):
+            return 0
+        return self.append(ticker, interval, self.fetcher(ticker, interval, fetch_start.strftime('%Y-%m-%d'), end))
+
+
+def _to_ns(value):
+    ts = pd.Timestamp(value)
+    ts = ts.tz_convert('UTC') if ts.tz is not None else ts.tz_localize('UTC')
+    return ts.as_unit('ns').value
+
+
+def _ema_continue(values, span, prev):
+    # 把上一區塊最後的 EMA 接在最前面，pandas ewm(adjust=False) 的遞迴與整段計算完全相同
+    if prev is None:
+        return pd.Series(values).ewm(span=span, adjust=False).mean().to_numpy()
+    return pd.Series(np.concatenate(([prev], values))).ewm(span=span, adjust=False).mean().to_numpy()[1:]
+
+
+class IntradayResult(NamedTuple):
+    ticker: str
+    interval: str
+    bars: int
+    ts: np.ndarray              # 交易所在 K 棒的時間 (與 trades 對齊)
+    trades: TradeLog            # index 為整段資料中的 K 棒位置
+    initial_cash: float
+    final_value: float
+    total_return: float         # %
+    win_rate: float             # %
+    total_trades: int
+    winning_trades: int
+    max_drawdown: float         # %
+    chart: ChartSeries
+
+
+class ChunkedMacdBacktest:
+    """逐區塊餵入 (ts, close)，最後呼叫 finish() 取得結果。"""
+
+    def __init__(self, initial_cash, fast=12, slow=26, signal=9, fee_rate=FEE_RATE, tax_rate=TAX_RATE,
+                 stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT, chart_bucket=1):
+        self.initial_cash = float(initial_cash)
+        self.spans = (fast, slow, signal)
+        self.costs = (fee_rate, tax_rate)
+        self.exits = (stop_loss_pct, take_profit_pct)
+        self.chart_bucket = chart_bucket
+        self._ema = [None, None, None]      # fast, slow, signal 的最後值
+        self._last = None                   # 上一根的 (dif, macd)，判斷跨區塊的交叉
+        self.cash = self.initial_cash
+        self.shares = 0
+        self.buy_price = 0.0
+        self.peak = self.initial_cash
+        self.max_drawdown = 0.0
+        self.total_trades = 0
+        self.winning_trades = 0
+        self.offset = 0                     # 已處理的 K 棒數
+        self._trades = []
+        self._trade_ts = []
+        self._chart = []
+        self._last_bar = None               # (ts, close)，期末平倉用
+
+    def _indicators(self, close):
+        fast, slow, signal = self.spans
+        ema_fast = _ema_continue(close, fast, self._ema[0])
+        ema_slow = _ema_continue(close, slow, self._ema[1])
+        dif = ema_fast - ema_slow
+        macd = _ema_continue(dif, signal, self._ema[2])
+        self._ema = [ema_fast[-1], ema_slow[-1], macd[-1]]
+        return dif, macd
+
+    def feed(self, ts, close):
+        close = np.asarray(close, dtype=np.float64)
+        m = len(close)
+        if m == 0:
+            return
+        dif, macd = self._indicators(close)
+        if self._last is None:
+            golden, death = find_crosses(dif, macd)
+        else:
+            golden, death = (c[1:] for c in find_crosses(np.concatenate(([self._last[0]], dif)),
+                                                         np.concatenate(([self._last[1]], macd))))
+        self._last = (dif[-1], macd[-1])
+        fee_rate, tax_rate = self.costs
+        stop_loss_pct, take_profit_pct = self.exits
+
+        golden_idx = np.flatnonzero(golden)
+        trades = TradeLog(2 * len(golden_idx) + 2)
+        cash_curve = np.empty(m)
+        shares_curve = np.zeros(m, dtype=np.int64)
+        seg_start, pos = 0, 0
+        while pos < m:
+            if self.shares > 0:
+                j, reason = find_exit(close, death, pos, self.buy_price, stop_loss_pct, take_profit_pct)
+                if j is None:
+                    break
+                cash_curve[seg_start:j] = self.cash
+                shares_curve[seg_start:j] = self.shares
+                net_income, profit, roi = sell_proceeds(self.shares, close[j], self.buy_price, fee_rate, tax_rate)
+                self.cash += net_income
+                self.total_trades += 1
+                self.winning_trades += profit > 0
+                trades.append(self.offset + j, reason, close[j], self.shares, self.cash, roi, profit)
+                self.shares, self.buy_price, seg_start, pos = 0, 0.0, j, j + 1
+            else:
+                k = int(np.searchsorted(golden_idx, pos))
+                if k == len(golden_idx):
+                    break
+                i = int(golden_idx[k])
+                price = close[i]
+                shares_to_buy = int(self.cash // (price * (1 + fee_rate)))
+                if shares_to_buy <= 0:
+                    pos = i + 1
+                    continue
+                cash_curve[seg_start:i] = self.cash
+                cost = shares_to_buy * price
+                self.cash -= cost + cost * fee_rate
+                self.shares, self.buy_price, seg_start, pos = shares_to_buy, price, i, i + 1
+                trades.append(self.offset + i, BUY, price, self.shares, self.cash, np.nan, np.nan)
+        cash_curve[seg_start:] = self.cash
+        shares_curve[seg_start:] = self.shares
+
+        # 最大回撤：與 simulate_macd 相同，自第 1 根起算、峰值以初始資金為起點
+        equity = cash_curve + shares_curve * close
+        tail = equity[1:] if self.offset == 0 else equity
+        if len(tail):
+            peak = np.maximum.accumulate(np.concatenate(([self.peak], tail)))[1:]
+            self.max_drawdown = max(self.max_drawdown, float(((peak - tail) / peak).max()))
+            self.peak = peak[-1]
+
+        ts = np.asarray(ts)
+        trades.trim()
+        self._trades.append(trades)
+        self._trade_ts.append(ts[trades.index - self.offset])
+        self._chart.append(downsample_series(ts.astype('datetime64[ns]'), close, dif, macd, dif - macd,
+                                             self.chart_bucket))
+        self._last_bar = (ts[-1], close[-1])
+        self.offset += m
+
+    def finish(self, ticker='', interval=''):
+        if self.offset == 0:
+            raise ValueError('沒有任何 K 棒資料。')
+        if self.shares > 0:
+            # 期末強制平倉
+            final_ts, final_price = self._last_bar
+            fee_rate, tax_rate = self.costs
+            net_income, profit, roi = sell_proceeds(self.shares, final_price, self.buy_price, fee_rate, tax_rate)
+            self.cash += net_income
+            self.total_trades += 1
+            self.winning_trades += profit > 0
+            closing = TradeLog(1)
+            closing.append(self.offset - 1, FINAL_CLOSE, final_price, self.shares, self.cash, roi, profit)
+            self._trades.append(closing.trim())
+            self._trade_ts.append(np.array([final_ts]))
+            self.shares = 0
+
+        trades = TradeLog.from_columns(**{c: np.concatenate([getattr(t, c) for t in self._trades])
+                                          for c in TradeLog.COLUMNS})
+        total_return = (self.cash - self.initial_cash) / self.initial_cash * 100
+        win_rate = self.winning_trades / self.total_trades * 100 if self.total_trades else 0.0
+        return IntradayResult(ticker, interval, self.offset, np.concatenate(self._trade_ts).astype('datetime64[ns]'),
+                              trades, self.initial_cash, self.cash, total_return, win_rate, self.total_trades,
+                              int(self.winning_trades), self.max_drawdown * 100, concat_series(self._chart))
+
+
+def run_intraday(bars, initial_cash, ticker='', interval='', chunk_bars=CHUNK_BARS, **params):
+    """以區塊串流回測一段 Bars (通常是 BarStore 的 memmap 切片)。"""
+    # 區塊長度取圖表區塊的整數倍，各區塊各自降採樣後可直接串接
+    bucket = max(1, -(-len(bars) // (MAX_CHART_POINTS // 2)))
+    chunk_bars = max(bucket, chunk_bars // bucket * bucket)
+    backtest = ChunkedMacdBacktest(initial_cash, chart_bucket=bucket, **params)
+    for a in range(0, len(bars), chunk_bars):
+        backtest.feed(bars.ts[a:a + chunk_bars], bars.close[a:a + chunk_bars])
+    return backtest.finish(ticker, interval)
+
+
+_default_store = None
+_default_store_guard = threading.Lock()
+
+
+def get_bar_store():
+    global _default_store
+    with _default_store_guard:
+        if _default_store is None:
+            _default_store = BarStore()
+        return _default_store
@@ -0,0 +1,129 @@
+# jobs.py
+# 固定大小的工作執行緒池 + 有上限的佇列：
+#   - 佇列滿時拒絕新工作 (QueueFull)，由呼叫端回覆使用者稍後再試
+#   - 相同 key 的工作若已在佇列中或執行中，直接合併，共用同一次計算結果
+#   - 提供佇列深度、等待/執行時間等統計數據
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from backtest_core.profiling import summarize_samples
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ('key', 'func', 'args', 'callbacks', 'submitted_at', 'started_at')
+
+    def __init__(self, key, func, args):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.callbacks = []
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+
+
+class JobQueue:
+    def __init__(self, workers=2, max_pending=20, latency_window=200):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending = OrderedDict()   # key -> _Job (尚未開始)
+        self._running = {}              # key -> _Job (執行中)
+        self._cond = threading.Condition()
+        self._wait_times = deque(maxlen=latency_window)
+        self._run_times = deque(maxlen=latency_window)
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'backtest-worker-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, key, func, *args, callback=None):
+        """
+        排入工作並回傳排隊位置：0 表示已開始執行 (或合併到執行中的工作)，
+        n 表示要等前面 n 筆工作。callback(result, error) 於完成時呼叫。
+        """
+        with self._cond:
+            job = self._running.get(key) or self._pending.get(key)
+            if job is not None:
+                self.coalesced += 1
+            else:
+                if len(self._pending) >= self.max_pending:
+                    self.rejected += 1
+                    raise QueueFull(f'佇列已滿 ({self.max_pending} 筆)')
+                job = _Job(key, func, args)
+                self._pending[key] = job
+                self.submitted += 1
+                self._cond.notify()
+            if callback is not None:
+                job.callbacks.append(callback)
+            return self._position(key)
+
+    def _position(self, key):
+        if key in self._running:
+            return 0
+        idle = self.workers - len(self._running)
+        return max(0, list(self._pending).index(key) + 1 - idle)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                key, job = self._pending.popitem(last=False)
+                job.started_at = time.monotonic()
+                self._running[key] = job
+            result, error = None, None
+            try:
+                result = job.func(*job.args)
+            except Exception as e:
+                error = e
+            finished_at = time.monotonic()
+            with self._cond:
+                del self._running[key]
+                callbacks = list(job.callbacks)
+                self._wait_times.append(job.started_at - job.submitted_at)
+                self._run_times.append(finished_at - job.started_at)
+                if error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            for callback in callbacks:
+                try:
+                    callback(result, error)
+                except Exception:
+                    logger.exception('工作完成回呼失敗')
+
+    def depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'queue_depth': len(self._pending),
+                'running': len(self._running),
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed,
+                'wait_seconds': summarize_samples(self._wait_times),
+                'run_seconds': summarize_samples(self._run_times),
+            }
+
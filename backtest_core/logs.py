@@ -0,0 +1,94 @@
+# logs.py
+# 兩個前端共用的結構化日誌設定：
+#   LOG_FORMAT=json (預設)：每筆一行 JSON，含時間、等級、logger、訊息與 extra={...} 傳入的欄位；text 為一般文字格式
+#   LOG_LEVEL=INFO
+#   LOG_SAMPLE=line_bot.webhook=0.01,web.access=0.1：指定 logger (含其子 logger) 在 INFO 以下只保留部分紀錄，
+#              WARNING 以上一律保留；略過的筆數記到 /metrics 的 log_records_dropped_total
+# 熱路徑 (webhook、存取紀錄) 只記錄大小、耗時等摘要欄位，不記錄完整內容。
+
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+from backtest_core.metrics import Counter
+
+DROPPED = Counter('log_records_dropped_total', '因取樣而略過的日誌筆數', ('logger',))
+DEFAULT_SAMPLE = 'line_bot.webhook=0.1,line_bot.access=0.1,web.access=0.1'
+
+# LogRecord 本身的屬性；其餘屬性視為 extra 欄位
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """依 logger 名稱 (最長前綴) 取樣 INFO 以下的紀錄。"""
+
+    def __init__(self, rates, rng=random.random):
+        super().__init__()
+        self.rates = dict(rates)
+        self.rng = rng
+
+    def rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1.0 or self.rng() < rate:
+            return True
+        DROPPED.inc(logger=record.name)
+        return False
+
+
+def parse_rates(spec):
+    rates = {}
+    for part in (spec or '').split(','):
+        if part.strip():
+            name, _, rate = part.partition('=')
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+_configured = False
+
+
+def configure_logging(fmt=None, level=None, sample=None):
+    """設定根 logger；重複呼叫 (兩個前端在同一行程中匯入時) 只生效一次。"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    fmt = fmt or os.getenv('LOG_FORMAT', 'json')
+    handler = logging.StreamHandler(sys.stderr)
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    handler.addFilter(SamplingFilter(parse_rates(sample if sample is not None else
+                                                 os.getenv('LOG_SAMPLE', DEFAULT_SAMPLE))))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level or os.getenv('LOG_LEVEL', 'INFO'))
@@ -0,0 +1,206 @@
+# metrics.py
+# 以 Prometheus 文字格式 (0.0.4) 輸出的輕量指標，兩個前端的 /metrics 共用，不另外依賴 prometheus_client：
+#   Counter / Histogram：在程式中累加 (請求延遲、回測各段落、價格下載)
+#   CallbackMetric     ：抓取時才呼叫函式取值 (快取命中率、佇列長度、圖片目錄大小)
+# 每個行程各自一份；多個 gunicorn worker 時由 Prometheus 分別抓取各 worker 再加總。
+
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} 的標籤必須是 {self.labelnames}：{tuple(labels)}')
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.labelnames, k)} {_format_value(v)}' for k, v in items]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, help, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+
+    def collect(self):
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = (('le', _format_value(float(bound))),)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """抓取時呼叫 add() 登記的函式取值；type 為 'gauge' 或 'counter' (函式回傳累計值)。"""
+
+    def __init__(self, name, help, labelnames=(), type='gauge', registry=None):
+        self.type = type
+        super().__init__(name, help, labelnames, registry)
+
+    def add(self, fn, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = fn
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = []
+        for key, fn in items:
+            try:
+                value = fn()
+            except Exception:
+                logger.exception('指標 %s 取值失敗', self.name)
+                continue
+            if value is not None:
+                lines.append(f'{self.name}{_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'指標名稱重複：{metric.name}')
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            samples = metric.collect()
+            if samples:
+                lines += metric.header() + samples
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_SECONDS = Histogram('http_request_duration_seconds', 'HTTP 請求處理時間 (秒)',
+                         ('app', 'endpoint', 'method', 'status'))
+STAGE_SECONDS = Histogram('backtest_stage_duration_seconds', '回測各段落 (profiling.stage) 耗時 (秒)', ('stage',))
+FETCH_TOTAL = Counter('price_fetch_total', '向 yfinance 下載價格的次數', ('result',))
+FETCH_SECONDS = Histogram('price_fetch_duration_seconds', '向 yfinance 下載價格的耗時 (秒)')
+
+CACHE_HITS = CallbackMetric('cache_hits_total', '快取命中次數', ('cache',), type='counter')
+CACHE_MISSES = CallbackMetric('cache_misses_total', '快取未命中次數', ('cache',), type='counter')
+CACHE_HIT_RATIO = CallbackMetric('cache_hit_ratio', '快取命中率 (啟動以來)', ('cache',))
+CACHE_BYTES = CallbackMetric('cache_bytes', '快取占用的位元組', ('cache',))
+QUEUE_DEPTH = CallbackMetric('job_queue_depth', '背景工作佇列中等待的工作數', ('queue',))
+QUEUE_RUNNING = CallbackMetric('job_queue_running', '背景工作佇列中執行中的工作數', ('queue',))
+DISK_BYTES = CallbackMetric('directory_bytes', '目錄中檔案的總大小', ('directory',))
+DISK_FILES = CallbackMetric('directory_files', '目錄中的檔案數', ('directory',))
+
+
+def track_cache(name, stats):
+    """stats 為回傳含 hits / misses (可選 bytes) 的 dict 的函式，例如 LRUCache.stats。"""
+    def ratio():
+        s = stats()
+        lookups = s['hits'] + s['misses']
+        return s['hits'] / lookups if lookups else 0.0
+    CACHE_HITS.add(lambda: stats()['hits'], cache=name)
+    CACHE_MISSES.add(lambda: stats()['misses'], cache=name)
+    CACHE_HIT_RATIO.add(ratio, cache=name)
+    CACHE_BYTES.add(lambda: stats().get('bytes'), cache=name)
+
+
+def track_queue(name, stats):
+    """stats 為回傳含 queue_depth (可選 running) 的 dict 的函式，例如 JobQueue.stats。"""
+    QUEUE_DEPTH.add(lambda: stats()['queue_depth'], queue=name)
+    QUEUE_RUNNING.add(lambda: stats().get('running'), queue=name)
+
+
+def track_directory(name, stats):
+    """stats 為回傳含 bytes / files 的 dict 的函式，例如 ImageStore.stats。"""
+    DISK_BYTES.add(lambda: stats()['bytes'], directory=name)
+    DISK_FILES.add(lambda: stats()['files'], directory=name)
+
+
+def observe_request(app, endpoint, method, status, seconds):
+    HTTP_SECONDS.observe(seconds, app=app, endpoint=endpoint, method=method, status=status)
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,128 @@
+# montecarlo.py
+# 蒙地卡羅穩健度分析：以歷史報酬的區塊拔靴法 (block bootstrap) 或幾何布朗運動 (GBM)
+# 產生大量價格路徑，以 engine.simulate_macd_batch 在路徑維度上批次回測，並分塊交給多個行程，
+# 最後回報 CAGR、最大回撤、勝率等指標的分位數分布
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest_core.engine import (simulate_macd_batch, FEE_RATE, TAX_RATE,
+                                  STOP_LOSS_PCT, TAKE_PROFIT_PCT)
+
+METHODS = ('bootstrap', 'gbm')
+MAX_PATHS = 20000
+PATHS_PER_TASK = 250
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def log_returns(close):
+    close = np.asarray(close, dtype=np.float64)
+    return np.diff(np.log(close))
+
+
+def bootstrap_paths(close, n_paths, n_bars=None, block=20, seed=None):
+    """以固定長度區塊重抽歷史日對數報酬，保留短期自我相關與波動叢聚。"""
+    rets = log_returns(close)
+    n_bars = n_bars or len(close)
+    if len(rets) < block:
+        raise ValueError(f'歷史資料不足 {block} 根 K 棒，無法做區塊拔靴。')
+    rng = np.random.default_rng(seed)
+    n_blocks = -(-(n_bars - 1) // block)
+    starts = rng.integers(0, len(rets) - block + 1, size=(n_paths, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :n_bars - 1]
+    return _to_prices(close[0], rets[idx])
+
+
+def gbm_paths(close, n_paths, n_bars=None, seed=None):
+    """以歷史日對數報酬的平均與標準差產生幾何布朗運動路徑。"""
+    rets = log_returns(close)
+    n_bars = n_bars or len(close)
+    rng = np.random.default_rng(seed)
+    sampled = rng.normal(rets.mean(), rets.std(ddof=1), size=(n_paths, n_bars - 1))
+    return _to_prices(close[0], sampled)
+
+
+def _to_prices(start_price, rets):
+    paths = np.empty((rets.shape[0], rets.shape[1] + 1))
+    paths[:, 0] = start_price
+    paths[:, 1:] = start_price * np.exp(np.cumsum(rets, axis=1))
+    return paths
+
+
+def macd_batch(paths, fast=12, slow=26, signal=9):
+    # 與 calculate_macd 相同的 ewm(adjust=False)，每條路徑為 DataFrame 的一欄
+    df = pd.DataFrame(paths.T)
+    dif = df.ewm(span=fast, adjust=False).mean() - df.ewm(span=slow, adjust=False).mean()
+    macd = dif.ewm(span=signal, adjust=False).mean()
+    return dif.to_numpy().T, macd.to_numpy().T
+
+
+def _run_paths(task):
+    paths, initial_cash, num_years, params = task
+    fast, slow, signal, fee_rate, tax_rate, stop_loss_pct, take_profit_pct = params
+    dif, macd = macd_batch(paths, fast, slow, signal)
+    sim = simulate_macd_batch(paths, dif, macd, initial_cash, fee_rate=fee_rate, tax_rate=tax_rate,
+                              stop_loss_pct=stop_loss_pct, take_profit_pct=take_profit_pct)
+    total_return = (sim.cash - initial_cash) / initial_cash * 100
+    cagr = ((sim.cash / initial_cash) ** (1 / num_years) - 1) * 100 if num_years > 0 else total_return
+    with np.errstate(invalid='ignore', divide='ignore'):
+        win_rate = np.where(sim.total_trades > 0, sim.winning_trades / sim.total_trades * 100, 0.0)
+    return {
+        'total_return': total_return,
+        'cagr': cagr,
+        'max_drawdown': sim.max_drawdown * 100,
+        'win_rate': win_rate,
+        'total_trades': sim.total_trades.astype(np.float64),
+    }
+
+
+def _distribution(values, percentiles):
+    return {
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        **{f'p{p}': float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))},
+    }
+
+
+def run_monte_carlo(close, num_years, initial_cash, method='bootstrap', n_paths=1000, block=20,
+                    seed=None, fast=12, slow=26, signal=9, fee_rate=FEE_RATE, tax_rate=TAX_RATE,
+                    stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT,
+                    percentiles=PERCENTILES, max_workers=None):
+    """回傳各指標的分布摘要，以及實際歷史路徑的結果作為對照。"""
+    if method not in METHODS:
+        raise ValueError(f"method 必須是 {', '.join(METHODS)} 其中之一。")
+    if not 1 <= n_paths <= MAX_PATHS:
+        raise ValueError(f'路徑數必須介於 1 到 {MAX_PATHS}。')
+    close = np.asarray(close, dtype=np.float64)
+    if method == 'bootstrap':
+        paths = bootstrap_paths(close, n_paths, block=block, seed=seed)
+    else:
+        paths = gbm_paths(close, n_paths, seed=seed)
+
+    params = (fast, slow, signal, fee_rate, tax_rate, stop_loss_pct, take_profit_pct)
+    tasks = [(paths[i:i + PATHS_PER_TASK], initial_cash, num_years, params)
+             for i in range(0, n_paths, PATHS_PER_TASK)]
+    if max_workers == 1 or len(tasks) == 1:
+        parts = [_run_paths(task) for task in tasks]
+    else:
+        workers = max_workers or min(len(tasks), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_run_paths, tasks))
+    metrics = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    historical = _run_paths((close[None, :], initial_cash, num_years, params))
+    return {
+        'method': method,
+        'paths': n_paths,
+        'bars': len(close),
+        'block': block if method == 'bootstrap' else None,
+        'seed': seed,
+        'distribution': {name: _distribution(values, percentiles) for name, values in metrics.items()},
+        'prob_loss': float((metrics['total_return'] < 0).mean()),
+        'historical': {name: float(values[0]) for name, values in historical.items()},
+    }
@@ -0,0 +1,175 @@
+# portfolio.py
+# 多檔標的的 MACD 投資組合回測：
+#   - 依配置規則把本金分給每一檔 (各自獨立運作的子帳戶)
+#   - 所有標的的收盤價對齊成一個 2-D 陣列，只載入一次並放進 shared memory，
+#     各行程直接附掛同一塊記憶體，依欄位平行回測
+#   - 彙總每日總資產、最大回撤、年化報酬率與交易統計
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from backtest_core.data import load_history
+from backtest_core.engine import simulate_macd, TradeLog, FEE_RATE, TAX_RATE, STOP_LOSS_PCT, TAKE_PROFIT_PCT
+
+ALLOCATIONS = ('equal', 'weights')
+MAX_TICKERS = 30
+
+_worker_state = {}
+
+
+class SymbolResult(NamedTuple):
+    ticker: str
+    allocated_cash: float
+    equity: np.ndarray      # 子帳戶每日資產 (對齊 PortfolioResult.dates)
+    final_value: float
+    trades: TradeLog        # index 對應 PortfolioResult.dates
+    total_trades: int
+    winning_trades: int
+
+
+class PortfolioResult(NamedTuple):
+    tickers: list
+    dates: pd.DatetimeIndex
+    equity: np.ndarray      # 每日投資組合總資產
+    symbols: list           # SymbolResult
+    initial_cash: float
+    final_value: float
+    total_return: float     # %
+    cagr: float             # %
+    max_drawdown: float     # %
+    total_trades: int
+    win_rate: float         # %
+
+
+def normalize_tickers(text, default='0050.TW'):
+    """解析以逗號或空白分隔的代號，純數字自動補上 .TW。"""
+    tickers = []
+    for raw in str(text or '').replace('，', ',').replace(' ', ',').split(','):
+        t = raw.strip().upper()
+        if not t:
+            continue
+        if t.isdigit() or (t[:-1].isdigit() and t[-1].isalpha() and '.' not in t):
+            t = f'{t}.TW'
+        if t not in tickers:
+            tickers.append(t)
+    if not tickers:
+        tickers = [default]
+    if len(tickers) > MAX_TICKERS:
+        raise ValueError(f'一次最多 {MAX_TICKERS} 檔標的。')
+    return tickers
+
+
+def allocate(initial_cash, tickers, rule='equal', weights=None):
+    if rule == 'equal':
+        return [initial_cash / len(tickers)] * len(tickers)
+    if rule == 'weights':
+        if not weights or len(weights) != len(tickers):
+            raise ValueError('權重數量必須與標的數量相同。')
+        w = np.asarray(weights, dtype=np.float64)
+        if (w < 0).any() or w.sum() <= 0:
+            raise ValueError('權重必須為非負數且總和大於 0。')
+        return list(initial_cash * w / w.sum())
+    raise ValueError(f"配置規則必須是 {', '.join(ALLOCATIONS)} 其中之一。")
+
+
+def _attach(name, shape):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _init_worker(name, shape, params):
+    shm, prices = _attach(name, shape)
+    _worker_state.update(shm=shm, prices=prices, params=params)
+
+
+def _run_symbol(task):
+    col, cash = task
+    prices = _worker_state['prices']
+    fast, slow, signal, fee_rate, tax_rate, stop_loss_pct, take_profit_pct = _worker_state['params']
+    column = prices[:, col]
+    rows = np.flatnonzero(~np.isnan(column))
+    equity = np.full(len(column), cash, dtype=np.float64)
+    if len(rows) == 0:
+        return equity, [], cash, 0, 0
+
+    close = pd.Series(column[rows])
+    ema_fast = close.ewm(span=fast, adjust=False).mean()
+    ema_slow = close.ewm(span=slow, adjust=False).mean()
+    dif = ema_fast - ema_slow
+    macd = dif.ewm(span=signal, adjust=False).mean()
+    sim = simulate_macd(close.to_numpy(), dif.to_numpy(), macd.to_numpy(), cash,
+                        fee_rate=fee_rate, tax_rate=tax_rate,
+                        stop_loss_pct=stop_loss_pct, take_profit_pct=take_profit_pct)
+
+    # 對齊回共同日期：未上市前為原始配置金額，停牌日沿用前一日資產
+    aligned = np.full(len(column), np.nan)
+    aligned[rows] = sim.equity
+    aligned[:rows[0]] = cash
+    aligned = pd.Series(aligned).ffill().to_numpy()
+    trades = sim.trades.with_index(rows[sim.trades.index])
+    return aligned, trades, sim.cash, sim.total_trades, sim.winning_trades
+
+
+def load_price_matrix(tickers, start, end):
+    closes = {}
+    for ticker in tickers:
+        df = load_history(ticker, start, end)
+        if df.empty:
+            raise ValueError(f'無法在指定日期範圍內取得 {ticker} 的資料，請嘗試調整日期。')
+        closes[ticker] = df['Close']
+    return pd.DataFrame(closes).sort_index()
+
+
+def run_portfolio(tickers, start, end, initial_cash, allocation='equal', weights=None,
+                  fast=12, slow=26, signal=9, fee_rate=FEE_RATE, tax_rate=TAX_RATE,
+                  stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT,
+                  max_workers=None, prices=None):
+    prices = prices if prices is not None else load_price_matrix(tickers, start, end)
+    sleeves = allocate(initial_cash, tickers, allocation, weights)
+    matrix = np.ascontiguousarray(prices[tickers].to_numpy(dtype=np.float64))
+    params = (fast, slow, signal, fee_rate, tax_rate, stop_loss_pct, take_profit_pct)
+    tasks = list(enumerate(sleeves))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+    try:
+        shared = np.ndarray(matrix.shape, dtype=np.float64, buffer=shm.buf)
+        shared[:] = matrix
+        if max_workers == 1 or len(tasks) == 1:
+            _worker_state.update(prices=shared, params=params)
+            outputs = [_run_symbol(task) for task in tasks]
+            _worker_state.clear()
+        else:
+            workers = max_workers or min(len(tasks), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(shm.name, matrix.shape, params)) as pool:
+                outputs = list(pool.map(_run_symbol, tasks))
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+
+    symbols = []
+    equity = np.zeros(len(prices), dtype=np.float64)
+    total_trades = winning_trades = 0
+    for ticker, cash, (sym_equity, trades, final_value, n_trades, n_wins) in zip(tickers, sleeves, outputs):
+        equity += sym_equity
+        total_trades += n_trades
+        winning_trades += n_wins
+        symbols.append(SymbolResult(ticker, cash, sym_equity, final_value, trades, n_trades, n_wins))
+
+    final_value = sum(s.final_value for s in symbols)
+    total_return = (final_value - initial_cash) / initial_cash * 100
+    num_years = (pd.to_datetime(end) - pd.to_datetime(start)).days / 365.25
+    cagr = ((final_value / initial_cash) ** (1 / num_years) - 1) * 100 if num_years > 0 else total_return
+    peak = np.maximum.accumulate(np.concatenate(([initial_cash], equity)))[1:]
+    max_drawdown = float(((peak - equity) / peak).max()) * 100 if len(equity) else 0.0
+    win_rate = winning_trades / total_trades * 100 if total_trades else 0
+
+    return PortfolioResult(list(tickers), prices.index, equity, symbols, initial_cash,
+                           final_value, total_return, cagr, max(max_drawdown, 0.0),
+                           total_trades, win_rate)
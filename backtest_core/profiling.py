@@ -0,0 +1,107 @@
+# profiling.py
+# 回測流程的分段計時：
+#   with stage('fetch'): ...
+# 每段耗時會記到全域的 recorder (供 /debug/timings 統計)，若目前執行緒有
+# 啟用中的請求計時器 (start_request_timer)，也會一併記到該請求，用於 Server-Timing 標頭；
+# 同時記到 metrics 的 backtest_stage_duration_seconds，供 /metrics 輸出。
+
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from backtest_core.metrics import STAGE_SECONDS
+
+_local = threading.local()
+
+
+def summarize_samples(samples):
+    if not samples:
+        return {'count': 0, 'avg': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(samples)
+    n = len(ordered)
+    return {
+        'count': n,
+        'avg': sum(ordered) / n,
+        'p50': ordered[int(0.50 * (n - 1))],
+        'p95': ordered[int(0.95 * (n - 1))],
+        'max': ordered[-1],
+    }
+
+
+class TimingRecorder:
+    def __init__(self, window=500):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._recent = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._samples[name].append(seconds)
+
+    def record_request(self, path, stages, total):
+        with self._lock:
+            self._recent.append({'path': path, 'total': total, 'stages': dict(stages),
+                                 'at': time.strftime('%Y-%m-%d %H:%M:%S')})
+
+    def summary(self):
+        with self._lock:
+            return {
+                'stages': {name: summarize_samples(list(s)) for name, s in self._samples.items()},
+                'recent_requests': list(self._recent),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._recent.clear()
+
+
+recorder = TimingRecorder()
+
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        # Server-Timing 標頭格式：name;dur=毫秒
+        parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.stages.items()]
+        parts.append(f'total;dur={self.total() * 1000:.2f}')
+        return ', '.join(parts)
+
+
+def start_request_timer():
+    _local.timer = RequestTimer()
+    return _local.timer
+
+
+def stop_request_timer():
+    timer = getattr(_local, 'timer', None)
+    _local.timer = None
+    return timer
+
+
+def current_timer():
+    return getattr(_local, 'timer', None)
+
+
+@contextmanager
+def stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        recorder.record(name, elapsed)
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timer = current_timer()
+        if timer is not None:
+            timer.add(name, elapsed)
@@ -0,0 +1,105 @@
+# sessions.py
+# 對話狀態 (LINE Bot 的回測流程) 的存放：每筆有 TTL，超過上限時以 LRU 淘汰。
+#   MemorySessionStore：單一行程內，使用 cache.LRUCache (記憶體上限)
+#   SQLiteSessionStore：本機 SQLite 檔，多個 gunicorn worker 共用，重啟後仍保留
+# 兩者介面相同：get / set / delete / stats，值為可 JSON 化的 dict
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from backtest_core.cache import LRUCache
+from backtest_core.data import DEFAULT_CACHE_DIR
+
+DEFAULT_TTL = 30 * 60   # 放棄流程的對話 30 分鐘後失效
+
+
+class MemorySessionStore:
+    def __init__(self, ttl=DEFAULT_TTL, max_bytes=8 * 1024 * 1024, clock=time.monotonic):
+        self._cache = LRUCache(max_bytes=max_bytes, ttl=ttl, clock=clock)
+
+    def get(self, key):
+        value = self._cache.get(key)
+        # 回傳副本，與 SQLite 後端一樣必須 set() 才會寫回
+        return dict(value) if value is not None else None
+
+    def set(self, key, value):
+        self._cache.put(key, dict(value))
+
+    def delete(self, key):
+        self._cache.pop(key)
+
+    def stats(self):
+        return {'backend': 'memory', **self._cache.stats()}
+
+
+class SQLiteSessionStore:
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=10000, clock=time.time):
+        # 跨行程共用，時間需用牆上時鐘而非 monotonic
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, value TEXT, '
+                         'expires REAL, touched REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched)')
+
+    def _conn(self):
+        # 每個執行緒各自一條連線；WAL 讓多個 worker 可同時讀寫
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = self.clock()
+        conn = self._conn()
+        with conn:
+            row = conn.execute('SELECT value, expires FROM sessions WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute('DELETE FROM sessions WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE sessions SET touched = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = self.clock()
+        conn = self._conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)',
+                         (key, json.dumps(value, ensure_ascii=False), now + self.ttl, now))
+            # 順便清掉過期的，再依最近使用時間淘汰超出上限的部分
+            conn.execute('DELETE FROM sessions WHERE expires <= ?', (now,))
+            conn.execute('DELETE FROM sessions WHERE key IN (SELECT key FROM sessions '
+                         'ORDER BY touched DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def delete(self, key):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM sessions WHERE key = ?', (key,))
+
+    def stats(self):
+        (entries,) = self._conn().execute('SELECT COUNT(*) FROM sessions').fetchone()
+        return {'backend': 'sqlite', 'path': self.path, 'entries': entries,
+                'max_entries': self.max_entries, 'ttl': self.ttl}
+
+
+def open_session_store(spec=None, ttl=DEFAULT_TTL):
+    """spec 為 'memory' (預設) 或 'sqlite' / 'sqlite:<檔案路徑>'。"""
+    spec = spec or 'memory'
+    if spec == 'memory':
+        return MemorySessionStore(ttl=ttl)
+    if spec == 'sqlite' or spec.startswith('sqlite:'):
+        path = spec.partition(':')[2] or os.path.join(DEFAULT_CACHE_DIR, 'sessions.sqlite3')
+        return SQLiteSessionStore(path, ttl=ttl)
+    raise ValueError(f'未知的 session 後端：{spec}')
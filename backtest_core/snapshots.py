@@ -0,0 +1,303 @@
+# snapshots.py
+# 每日收盤後預先計算的回測快照：對設定的標的與標準區間 (近 1/3/5/10 年、結束日為「今天」)
+# 先算好指標、標準本金的回測結果、網頁版與 LINE 版圖表與目前訊號，存成檔案。
+# 網頁 /strategy 與 LINE Bot 查詢這些區間時直接讀快照，自訂區間才即時計算。
+#
+# 排程：python -m backtest_core.snapshots build     (交給 cron / 工作排程器，每個交易日收盤後執行)
+#       python -m backtest_core.snapshots schedule  (自帶迴圈，每個平日 SNAPSHOT_AT 執行一次)
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from backtest_core.backtest import Indicators, BacktestResult, compute_indicators, run_backtest
+from backtest_core.cache import LRUCache
+from backtest_core.charts import render_macd_chart, WEB_STYLE, BOT_STYLE
+from backtest_core.data import load_history, DEFAULT_CACHE_DIR
+from backtest_core.engine import TradeLog
+from backtest_core.portfolio import normalize_tickers
+from backtest_core.streaming import get_signal_store, describe_signal, DEFAULT_SIGNAL_START
+
+SNAPSHOT_TICKERS = os.getenv('SNAPSHOT_TICKERS', '0050.TW')
+SNAPSHOT_YEARS = os.getenv('SNAPSHOT_YEARS', '1,3,5,10')
+SNAPSHOT_CASH = os.getenv('SNAPSHOT_CASH', '100000,1000000')
+SNAPSHOT_AT = os.getenv('SNAPSHOT_AT', '14:30')    # 台股 13:30 收盤，yfinance 約 14:00 後有當日資料
+KEEP_BUILDS = 2
+CHART_STYLES = {'web': WEB_STYLE, 'bot': BOT_STYLE}
+
+
+def _parse_list(text, cast):
+    return [cast(p) for p in str(text).replace(' ', '').split(',') if p]
+
+
+def snapshot_ends(as_of):
+    """as_of 收盤後建立的快照要服務的結束日：隔天到下一個平日 (結束日不含，資料即截至 as_of)。"""
+    ends = []
+    day = as_of + timedelta(days=1)
+    while True:
+        ends.append(day)
+        if day.weekday() < 5:
+            return ends
+        day += timedelta(days=1)
+
+
+def window_start(end, years):
+    return (pd.Timestamp(end) - pd.DateOffset(years=years)).date()
+
+
+class Snapshot(NamedTuple):
+    ticker: str
+    start: str
+    end: str
+    built_at: str
+    indicators: Indicators
+    results: dict           # 本金 -> BacktestResult
+    charts: dict            # 'web' / 'bot' -> PNG bytes
+    signal: str             # describe_signal() 的文字
+
+    def backtest(self, initial_cash, **kwargs):
+        """標準本金直接回傳預先算好的結果，其他本金以快照中的指標即時回測 (毫秒級)。"""
+        result = self.results.get(float(initial_cash))
+        if result is not None and not kwargs:
+            return result
+        return run_backtest(self.indicators, self.start, self.end, initial_cash, ticker=self.ticker, **kwargs)
+
+
+def _name(ticker, start, end):
+    return f"{''.join(c if c.isalnum() else '_' for c in ticker)}_{start}_{end}"
+
+
+def _write_snapshot(directory, name, snap):
+    ind = snap.indicators
+    arrays = {
+        'dates': ind.dates.as_unit('ns').asi8, 'close': ind.close, 'dif': ind.dif, 'macd': ind.macd,
+        'histogram': ind.histogram, 'golden': ind.crosses[0], 'death': ind.crosses[1],
+    }
+    meta = {'ticker': snap.ticker, 'start': snap.start, 'end': snap.end, 'built_at': snap.built_at,
+            'version': ind.version, 'signal': snap.signal, 'results': []}
+    for k, (cash, bt) in enumerate(snap.results.items()):
+        for col in TradeLog.COLUMNS:
+            arrays[f'r{k}_{col}'] = getattr(bt.trades, col)
+        arrays[f'r{k}_equity'] = bt.equity
+        meta['results'].append({f: getattr(bt, f) for f in BacktestResult._fields
+                                if f not in ('ticker', 'start', 'end', 'indicators', 'trades', 'equity')})
+    np.savez(os.path.join(directory, f'{name}.npz'), **arrays)
+    for style, png in snap.charts.items():
+        with open(os.path.join(directory, f'{name}.{style}.png'), 'wb') as f:
+            f.write(png)
+    with open(os.path.join(directory, f'{name}.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+def _read_snapshot(directory, name):
+    with open(os.path.join(directory, f'{name}.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    with np.load(os.path.join(directory, f'{name}.npz')) as z:
+        arrays = {k: z[k] for k in z.files}
+    dates = pd.DatetimeIndex(pd.to_datetime(arrays['dates']), name='Date')
+    ind = Indicators(dates, arrays['close'], arrays['dif'], arrays['macd'], arrays['histogram'],
+                     (arrays['golden'], arrays['death']), meta['version'])
+    results = {}
+    for k, fields in enumerate(meta['results']):
+        trades = TradeLog.from_columns(**{col: arrays[f'r{k}_{col}'] for col in TradeLog.COLUMNS})
+        results[fields['initial_cash']] = BacktestResult(
+            ticker=meta['ticker'], start=meta['start'], end=meta['end'], indicators=ind, trades=trades,
+            equity=arrays[f'r{k}_equity'], **fields)
+    charts = {}
+    for style in CHART_STYLES:
+        path = os.path.join(directory, f'{name}.{style}.png')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                charts[style] = f.read()
+    return Snapshot(meta['ticker'], meta['start'], meta['end'], meta['built_at'], ind, results, charts,
+                    meta['signal'])
+
+
+class SnapshotStore:
+    """root/<建立日>/ 下保存各快照，root/index.json 對照 (代號, 起始日, 結束日) -> 檔案。"""
+
+    def __init__(self, root=os.path.join(DEFAULT_CACHE_DIR, 'snapshots'), max_bytes=64 * 1024 * 1024):
+        self.root = root
+        self._index = {}
+        self._index_mtime = None
+        self._loaded = LRUCache(max_bytes=max_bytes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _index_path(self):
+        return os.path.join(self.root, 'index.json')
+
+    def _read_index(self):
+        # 排程行程重建快照後 index.json 會被替換，以 mtime 判斷是否重新讀取
+        try:
+            mtime = os.stat(self._index_path()).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if mtime != self._index_mtime:
+            with open(self._index_path(), encoding='utf-8') as f:
+                self._index = json.load(f)
+            self._index_mtime = mtime
+        return self._index
+
+    def lookup(self, ticker, start, end):
+        """有對應的快照時回傳 Snapshot，否則回傳 None。"""
+        key = f'{ticker}|{str(start)[:10]}|{str(end)[:10]}'
+        with self._lock:
+            entry = self._read_index().get('entries', {}).get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            snap = self._loaded.get(entry)
+            if snap is None:
+                build, name = entry.split('/')
+                try:
+                    snap = _read_snapshot(os.path.join(self.root, build), name)
+                except FileNotFoundError:
+                    self.misses += 1
+                    return None
+                self._loaded.put(entry, snap)
+            self.hits += 1
+            return snap
+
+    def publish(self, build, snapshots):
+        """寫入一次建立的所有快照，再原子地替換 index.json；只保留最近 KEEP_BUILDS 次的建立結果。"""
+        directory = os.path.join(self.root, build)
+        tmp_dir = f'{directory}.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for snap in snapshots:
+            _write_snapshot(tmp_dir, _name(snap.ticker, snap.start, snap.end), snap)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+
+        builds = sorted(d for d in os.listdir(self.root)
+                        if os.path.isdir(os.path.join(self.root, d)) and not d.endswith('.tmp'))
+        keep = builds[-KEEP_BUILDS:]
+        entries = {}
+        for b in keep:   # 由舊到新，較新的建立覆蓋相同區間
+            for fname in os.listdir(os.path.join(self.root, b)):
+                if fname.endswith('.json'):
+                    with open(os.path.join(self.root, b, fname), encoding='utf-8') as f:
+                        meta = json.load(f)
+                    entries[f"{meta['ticker']}|{meta['start']}|{meta['end']}"] = f'{b}/{fname[:-5]}'
+        tmp = self._index_path() + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'builds': keep, 'entries': entries}, f, ensure_ascii=False)
+        os.replace(tmp, self._index_path())
+        for b in builds[:-KEEP_BUILDS]:
+            shutil.rmtree(os.path.join(self.root, b), ignore_errors=True)
+        return len(snapshots)
+
+    def stats(self):
+        with self._lock:
+            index = self._read_index()
+        return {'root': self.root, 'builds': index.get('builds', []), 'entries': len(index.get('entries', {})),
+                'hits': self.hits, 'misses': self.misses, 'loaded': self._loaded.stats()}
+
+
+def build_snapshots(tickers=None, years=None, cash=None, as_of=None, store=None, loader=load_history,
+                    signal_store=None, charts=True):
+    """建立 as_of (預設今天) 收盤後的快照並發佈，回傳快照數。"""
+    tickers = normalize_tickers(tickers or SNAPSHOT_TICKERS)
+    years = years or _parse_list(SNAPSHOT_YEARS, int)
+    cash = [float(c) for c in (cash or _parse_list(SNAPSHOT_CASH, float))]
+    as_of = as_of or date.today()
+    store = store or get_snapshot_store()
+    # 同時更新 streaming 的增量訊號狀態，隔天「訊號」查詢不必重算
+    signal_store = signal_store or get_signal_store()
+    built_at = datetime.now().isoformat(timespec='seconds')
+    ends = snapshot_ends(as_of)
+
+    snapshots = []
+    for ticker in tickers:
+        # 每檔只讀一次涵蓋所有區間的價格，再依各區間切片
+        first = min(window_start(end, y) for end in ends for y in years)
+        df = loader(ticker, first.isoformat(), ends[-1].isoformat())
+        for end in ends:
+            signal = describe_signal(signal_store.current(ticker, DEFAULT_SIGNAL_START, end.isoformat()))
+            for y in years:
+                start = window_start(end, y)
+                part = df[(df.index >= pd.Timestamp(start)) & (df.index < pd.Timestamp(end))]
+                if part.empty:
+                    continue
+                start_s, end_s = start.isoformat(), end.isoformat()
+                ind = compute_indicators(part)
+                results = {c: run_backtest(ind, start_s, end_s, c, ticker=ticker) for c in cash}
+                title = f'{ticker} MACD 策略回測 ({start_s} ~ {end_s})'
+                pngs = {style: render_macd_chart(ind.dates, ind.close, ind.dif, ind.macd, ind.histogram, title, s)
+                        for style, s in CHART_STYLES.items()} if charts else {}
+                snapshots.append(Snapshot(ticker, start_s, end_s, built_at, ind, results, pngs, signal))
+    return store.publish(as_of.isoformat(), snapshots)
+
+
+def _seconds_until(at, now):
+    hour, minute = (int(p) for p in at.split(':'))
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    while target <= now or target.weekday() >= 5:
+        target = (target + timedelta(days=1)).replace(hour=hour, minute=minute)
+    return (target - now).total_seconds()
+
+
+def run_schedule(at=SNAPSHOT_AT, **kwargs):
+    """每個平日 at (HH:MM，本機時間) 建立一次快照。"""
+    while True:
+        time.sleep(_seconds_until(at, datetime.now()))
+        started = time.perf_counter()
+        try:
+            count = build_snapshots(**kwargs)
+            print(f'{datetime.now():%Y-%m-%d %H:%M:%S} 已建立 {count} 個快照 ({time.perf_counter() - started:.1f}s)')
+        except Exception as e:
+            print(f'{datetime.now():%Y-%m-%d %H:%M:%S} 建立快照失敗：{e}', file=sys.stderr)
+
+
+_default_store = None
+_default_store_guard = threading.Lock()
+
+
+def get_snapshot_store():
+    global _default_store
+    with _default_store_guard:
+        if _default_store is None:
+            _default_store = SnapshotStore()
+        return _default_store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m backtest_core.snapshots')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('build', '立即建立快照'), ('schedule', '每個平日定時建立快照')):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('--tickers', default=SNAPSHOT_TICKERS)
+        p.add_argument('--years', default=SNAPSHOT_YEARS)
+        p.add_argument('--cash', default=SNAPSHOT_CASH)
+        if name == 'build':
+            p.add_argument('--as-of', help='收盤日 (YYYY-MM-DD)，預設今天')
+        else:
+            p.add_argument('--at', default=SNAPSHOT_AT, help='執行時間 HH:MM')
+
+    args = parser.parse_args(argv)
+    kwargs = {'tickers': args.tickers, 'years': _parse_list(args.years, int),
+              'cash': _parse_list(args.cash, float)}
+    if args.command == 'schedule':
+        run_schedule(args.at, **kwargs)
+        return 0
+    as_of = datetime.strptime(args.as_of, '%Y-%m-%d').date() if args.as_of else None
+    started = time.perf_counter()
+    count = build_snapshots(as_of=as_of, **kwargs)
+    print(f'已建立 {count} 個快照 ({time.perf_counter() - started:.1f}s)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
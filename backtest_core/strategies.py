@@ -0,0 +1,296 @@
+# strategies.py
+# 可插拔的策略介面：進場/出場條件宣告為指標欄位上的向量化運算式，例如
+#   Strategy('rsi', entry=rsi(14).crosses_above(30), exit=rsi(14).crosses_below(70))
+# 條件以 & | ~ 組合，停損/停利是策略參數 (None 表示不設)，回測交給 engine.simulate_signals。
+# 指標由 IndicatorSet 依 (名稱, 參數) 記憶：同一段價格比較多個策略時，每個指標只計算一次。
+# 指定 execution (execution.ExecutionModel) 時改用 execution.simulate_orders 模擬實際成交。
+
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from backtest_core.engine import (simulate_signals, DEATH_CROSS, SIGNAL_EXIT, FEE_RATE, TAX_RATE,
+                                  STOP_LOSS_PCT, TAKE_PROFIT_PCT)
+from backtest_core.sweep import summarize, SORT_KEYS
+
+
+def _ewm(values, **kwargs):
+    # 與 compute_indicators 相同：pandas ewm(adjust=False)
+    return pd.Series(values).ewm(adjust=False, **kwargs).mean().to_numpy()
+
+
+class IndicatorSet:
+    """一段價格序列上的指標快取；df 需有 Close 欄，KD 另需 High / Low。"""
+
+    def __init__(self, df):
+        self.df = df
+        self.close = df['Close'].to_numpy(dtype=np.float64)
+        self._memo = {}
+        self.computed = 0   # 實際計算過的指標數
+
+    def __len__(self):
+        return len(self.close)
+
+    def _get(self, key, compute):
+        if key not in self._memo:
+            self._memo[key] = compute()
+            self.computed += 1
+        return self._memo[key]
+
+    def column(self, name):
+        if name not in self.df:
+            raise ValueError(f'價格資料缺少 {name} 欄位。')
+        return self._get(('column', name), lambda: self.df[name].to_numpy(dtype=np.float64))
+
+    def ema(self, span):
+        return self._get(('ema', span), lambda: _ewm(self.close, span=span))
+
+    def sma(self, n):
+        return self._get(('sma', n), lambda: pd.Series(self.close).rolling(n).mean().to_numpy())
+
+    def macd(self, fast=12, slow=26, signal=9):
+        """回傳 (DIF, MACD)，與 compute_indicators 的結果完全相同。"""
+        dif = self._get(('dif', fast, slow), lambda: self.ema(fast) - self.ema(slow))
+        return dif, self._get(('macd', fast, slow, signal), lambda: _ewm(dif, span=signal))
+
+    def rsi(self, n=14):
+        # Wilder 平滑：alpha = 1/n
+        def compute():
+            delta = np.diff(self.close, prepend=np.nan)
+            gain = _ewm(np.clip(delta, 0, None), alpha=1 / n, min_periods=n)
+            loss = _ewm(np.clip(-delta, 0, None), alpha=1 / n, min_periods=n)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                value = 100 - 100 / (1 + gain / loss)
+            return np.where((loss == 0) & (gain > 0), 100.0, value)
+        return self._get(('rsi', n), compute)
+
+    def kd(self, n=9):
+        """台股慣用的 KD：RSV 取 n 日高低，K、D 各以 1/3 權重平滑，初值 50。"""
+        def compute():
+            high = pd.Series(self.column('High')).rolling(n, min_periods=1).max().to_numpy()
+            low = pd.Series(self.column('Low')).rolling(n, min_periods=1).min().to_numpy()
+            span = high - low
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rsv = np.where(span > 0, (self.close - low) / span * 100, 50.0)
+            k = _ewm(np.concatenate(([50.0], rsv)), alpha=1 / 3)
+            d = _ewm(k, alpha=1 / 3)
+            return k[1:], d[1:]
+        return self._get(('kd', n), compute)
+
+    def bollinger(self, n=20, width=2.0):
+        """回傳 (中線, 上軌, 下軌)。"""
+        def compute():
+            mid = self.sma(n)
+            std = pd.Series(self.close).rolling(n).std(ddof=0).to_numpy()
+            return mid, mid + width * std, mid - width * std
+        return self._get(('bollinger', n, width), compute)
+
+
+class Expr:
+    """指標欄位或常數；對 IndicatorSet 求值得到與價格等長的陣列。"""
+
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+
+    def __call__(self, ind):
+        return self.fn(ind)
+
+    def __repr__(self):
+        return self.name
+
+    def _arith(self, other, op, symbol):
+        other = _expr(other)
+        return Expr(f'({self.name} {symbol} {other.name})', lambda ind: op(self(ind), other(ind)))
+
+    def __add__(self, other):
+        return self._arith(other, np.add, '+')
+
+    def __sub__(self, other):
+        return self._arith(other, np.subtract, '-')
+
+    def __mul__(self, other):
+        return self._arith(other, np.multiply, '*')
+
+    def __truediv__(self, other):
+        return self._arith(other, np.divide, '/')
+
+    def _compare(self, other, op, symbol):
+        other = _expr(other)
+        return Rule(f'{self.name} {symbol} {other.name}', lambda ind: op(self(ind), other(ind)))
+
+    def __gt__(self, other):
+        return self._compare(other, np.greater, '>')
+
+    def __lt__(self, other):
+        return self._compare(other, np.less, '<')
+
+    def __ge__(self, other):
+        return self._compare(other, np.greater_equal, '>=')
+
+    def __le__(self, other):
+        return self._compare(other, np.less_equal, '<=')
+
+    def crosses_above(self, other):
+        """前一根在 other 之下、這一根在其上 (與 find_crosses 的黃金交叉相同)。"""
+        other = _expr(other)
+        return Rule(f'{self.name} 上穿 {other.name}', lambda ind: _cross(self(ind), other(ind)))
+
+    def crosses_below(self, other):
+        other = _expr(other)
+        return Rule(f'{self.name} 下穿 {other.name}', lambda ind: _cross(other(ind), self(ind)))
+
+
+def _cross(a, b):
+    out = np.zeros(len(a), dtype=bool)
+    out[1:] = (a[:-1] < b[:-1]) & (a[1:] > b[1:])
+    return out
+
+
+def _expr(value):
+    if isinstance(value, Expr):
+        return value
+    value = float(value)
+    return Expr(f'{value:g}', lambda ind: np.full(len(ind), value))
+
+
+class Rule:
+    """布林條件；以 & (且)、| (或)、~ (非) 組合。"""
+
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+
+    def __call__(self, ind):
+        return np.asarray(self.fn(ind), dtype=bool)
+
+    def __repr__(self):
+        return self.name
+
+    def __and__(self, other):
+        return Rule(f'({self.name} 且 {other.name})', lambda ind: self(ind) & other(ind))
+
+    def __or__(self, other):
+        return Rule(f'({self.name} 或 {other.name})', lambda ind: self(ind) | other(ind))
+
+    def __invert__(self):
+        return Rule(f'非 {self.name}', lambda ind: ~self(ind))
+
+
+# 可用的指標欄位
+def price():
+    return Expr('收盤價', lambda ind: ind.close)
+
+
+def column(name):
+    return Expr(name, lambda ind: ind.column(name))
+
+
+def ema(span):
+    return Expr(f'EMA({span})', lambda ind: ind.ema(span))
+
+
+def sma(n):
+    return Expr(f'MA({n})', lambda ind: ind.sma(n))
+
+
+def dif(fast=12, slow=26):
+    return Expr(f'DIF({fast},{slow})', lambda ind: ind.macd(fast, slow)[0])
+
+
+def macd(fast=12, slow=26, signal=9):
+    return Expr(f'MACD({fast},{slow},{signal})', lambda ind: ind.macd(fast, slow, signal)[1])
+
+
+def rsi(n=14):
+    return Expr(f'RSI({n})', lambda ind: ind.rsi(n))
+
+
+def kd_k(n=9):
+    return Expr(f'K({n})', lambda ind: ind.kd(n)[0])
+
+
+def kd_d(n=9):
+    return Expr(f'D({n})', lambda ind: ind.kd(n)[1])
+
+
+def bb_mid(n=20, width=2.0):
+    return Expr(f'布林中線({n})', lambda ind: ind.bollinger(n, width)[0])
+
+
+def bb_upper(n=20, width=2.0):
+    return Expr(f'布林上軌({n},{width:g})', lambda ind: ind.bollinger(n, width)[1])
+
+
+def bb_lower(n=20, width=2.0):
+    return Expr(f'布林下軌({n},{width:g})', lambda ind: ind.bollinger(n, width)[2])
+
+
+class Strategy(NamedTuple):
+    name: str
+    entry: Rule
+    exit: Rule
+    stop_loss_pct: Optional[float] = STOP_LOSS_PCT      # None：不設停損
+    take_profit_pct: Optional[float] = TAKE_PROFIT_PCT  # None：不設停利
+    exit_action: str = SIGNAL_EXIT                      # 訊號出場在交易紀錄中的動作代碼
+
+
+STRATEGIES = {
+    # 原本的 MACD 交叉策略，結果與 simulate_macd 相同
+    'macd': Strategy('macd', dif().crosses_above(macd()), dif().crosses_below(macd()), exit_action=DEATH_CROSS),
+    'rsi': Strategy('rsi', rsi(14).crosses_above(30), rsi(14).crosses_below(70)),
+    'kd': Strategy('kd', kd_k(9).crosses_above(kd_d(9)) & (kd_d(9) < 30),
+                   kd_k(9).crosses_below(kd_d(9)) & (kd_d(9) > 70)),
+    'bollinger': Strategy('bollinger', price().crosses_above(bb_lower()), price() > bb_upper()),
+    'ma_cross': Strategy('ma_cross', sma(5).crosses_above(sma(20)), sma(5).crosses_below(sma(20))),
+    'macd_rsi': Strategy('macd_rsi', dif().crosses_above(macd()) & (rsi(14) < 60),
+                         dif().crosses_below(macd()) | (rsi(14) > 75)),
+}
+
+
+def register_strategy(strategy):
+    STRATEGIES[strategy.name] = strategy
+    return strategy
+
+
+def get_strategies(names):
+    """由名稱 (list 或逗號分隔字串) 取得已註冊的策略。"""
+    if isinstance(names, str):
+        names = [n.strip() for n in names.split(',') if n.strip()]
+    unknown = [n for n in names if n not in STRATEGIES]
+    if unknown:
+        raise ValueError(f"未知的策略：{', '.join(unknown)}；可用的策略：{', '.join(STRATEGIES)}")
+    return [STRATEGIES[n] for n in names]
+
+
+def run_strategy(ind, strategy, initial_cash, fee_rate=FEE_RATE, tax_rate=TAX_RATE, execution=None):
+    """execution 為 None 時以收盤價成交；否則依 ExecutionModel 成交，費率與稅率以模型為準。"""
+    if execution is not None:
+        from backtest_core.execution import simulate_orders
+        return simulate_orders(ind.column('Open'), ind.column('High'), ind.column('Low'), ind.close,
+                               strategy.entry(ind), strategy.exit(ind), initial_cash, model=execution,
+                               stop_loss_pct=strategy.stop_loss_pct, take_profit_pct=strategy.take_profit_pct,
+                               exit_action=strategy.exit_action)
+    return simulate_signals(ind.close, strategy.entry(ind), strategy.exit(ind), initial_cash,
+                            fee_rate=fee_rate, tax_rate=tax_rate,
+                            stop_loss_pct=strategy.stop_loss_pct, take_profit_pct=strategy.take_profit_pct,
+                            exit_action=strategy.exit_action)
+
+
+def compare_strategies(ind, strategies, initial_cash, num_years, sort_by='cagr',
+                       fee_rate=FEE_RATE, tax_rate=TAX_RATE, execution=None):
+    """在同一個 IndicatorSet 上回測多個策略，回傳依 sort_by 排序的結果列表。"""
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f'不支援的排序欄位：{sort_by}')
+    rows = []
+    for strategy in strategies:
+        sim = run_strategy(ind, strategy, initial_cash, fee_rate, tax_rate, execution)
+        row = {'strategy': strategy.name, 'entry': strategy.entry.name, 'exit': strategy.exit.name,
+               'stop_loss_pct': strategy.stop_loss_pct, 'take_profit_pct': strategy.take_profit_pct}
+        row.update(summarize(sim, initial_cash, num_years))
+        rows.append(row)
+    rows.sort(key=lambda r: r[sort_by], reverse=SORT_KEYS[sort_by])
+    for rank, row in enumerate(rows, 1):
+        row['rank'] = rank
+    return rows
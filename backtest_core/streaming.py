@@ -0,0 +1,214 @@
+# streaming.py
+# 增量式 MACD 指標與持倉狀態：
+#   - 保存 EMA fast / slow / signal 與前一根的 DIF、MACD，每根新 K 棒 O(1) 更新
+#   - 同時依回測規則 (黃金交叉買進、死亡交叉/停損/停利賣出) 更新持倉
+#   - 狀態可存成 JSON，下次只需餵入上次之後的新 K 棒，即可得到今天的訊號
+# EMA 更新公式與 pandas ewm(adjust=False) 的實作一致，數值與 calculate_macd 逐位元相同。
+
+import json
+import os
+import threading
+
+from backtest_core.data import DEFAULT_CACHE_DIR, load_history
+from backtest_core.engine import (
+    sell_proceeds, BUY, DEATH_CROSS, STOP_LOSS, TAKE_PROFIT,
+    FEE_RATE, TAX_RATE, STOP_LOSS_PCT, TAKE_PROFIT_PCT
+)
+
+
+class _Ema:
+    __slots__ = ('alpha', 'value')
+
+    def __init__(self, span, value=None):
+        self.alpha = 2.0 / (span + 1.0)
+        self.value = value
+
+    def update(self, x):
+        # 與 pandas 的 ewma(adjust=False) 相同的運算順序
+        if self.value is None:
+            self.value = x
+        elif self.value != x:
+            old_wt = 1.0 - self.alpha
+            self.value = (old_wt * self.value + self.alpha * x) / (old_wt + self.alpha)
+        return self.value
+
+
+class MacdSignalState:
+    def __init__(self, initial_cash, fast=12, slow=26, signal=9,
+                 fee_rate=FEE_RATE, tax_rate=TAX_RATE,
+                 stop_loss_pct=STOP_LOSS_PCT, take_profit_pct=TAKE_PROFIT_PCT):
+        self.params = {
+            'initial_cash': initial_cash, 'fast': fast, 'slow': slow, 'signal': signal,
+            'fee_rate': fee_rate, 'tax_rate': tax_rate,
+            'stop_loss_pct': stop_loss_pct, 'take_profit_pct': take_profit_pct,
+        }
+        self._fast = _Ema(fast)
+        self._slow = _Ema(slow)
+        self._signal = _Ema(signal)
+        self.dif = None
+        self.macd = None
+        self.last_date = None
+        self.bars = 0
+        self.cash = initial_cash
+        self.shares = 0
+        self.buy_price = 0.0
+        self.last_action = None
+        self.last_action_date = None
+        self.last_action_price = None
+
+    @property
+    def holding(self):
+        return self.shares > 0
+
+    def update(self, date, close):
+        """餵入一根新的收盤價，回傳這根 K 棒觸發的動作 (BUY / DEATH_CROSS / ...) 或 None。"""
+        p = self.params
+        prev_dif, prev_macd = self.dif, self.macd
+        dif = self._fast.update(close) - self._slow.update(close)
+        macd = self._signal.update(dif)
+        self.dif, self.macd = dif, macd
+        self.last_date = str(date)[:10]
+        self.bars += 1
+        if prev_dif is None:
+            return None
+
+        action = None
+        if self.shares == 0:
+            if prev_dif < prev_macd and dif > macd:
+                shares_to_buy = int(self.cash // (close * (1 + p['fee_rate'])))
+                if shares_to_buy > 0:
+                    cost = shares_to_buy * close
+                    self.cash -= cost + cost * p['fee_rate']
+                    self.shares, self.buy_price = shares_to_buy, close
+                    action = BUY
+        else:
+            change_pct = (close - self.buy_price) / self.buy_price
+            if prev_dif > prev_macd and dif < macd:
+                action = DEATH_CROSS
+            elif change_pct <= -p['stop_loss_pct']:
+                action = STOP_LOSS
+            elif change_pct >= p['take_profit_pct']:
+                action = TAKE_PROFIT
+            if action is not None:
+                net_income, _, _ = sell_proceeds(self.shares, close, self.buy_price,
+                                                 p['fee_rate'], p['tax_rate'])
+                self.cash += net_income
+                self.shares, self.buy_price = 0, 0.0
+
+        if action is not None:
+            self.last_action, self.last_action_date, self.last_action_price = action, self.last_date, close
+        return action
+
+    def to_dict(self):
+        return {
+            'params': self.params,
+            'ema': [self._fast.value, self._slow.value, self._signal.value],
+            'dif': self.dif, 'macd': self.macd,
+            'last_date': self.last_date, 'bars': self.bars,
+            'cash': self.cash, 'shares': self.shares, 'buy_price': self.buy_price,
+            'last_action': self.last_action, 'last_action_date': self.last_action_date,
+            'last_action_price': self.last_action_price,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        state = cls(**d['params'])
+        state._fast.value, state._slow.value, state._signal.value = d['ema']
+        for name in ('dif', 'macd', 'last_date', 'bars', 'cash', 'shares', 'buy_price',
+                     'last_action', 'last_action_date', 'last_action_price'):
+            setattr(state, name, d[name])
+        return state
+
+    def summary(self):
+        return {
+            'as_of': self.last_date,
+            'holding': self.holding,
+            'shares': self.shares,
+            'buy_price': self.buy_price if self.holding else None,
+            'cash': self.cash,
+            'dif': self.dif,
+            'macd': self.macd,
+            'last_action': self.last_action,
+            'last_action_date': self.last_action_date,
+            'last_action_price': self.last_action_price,
+        }
+
+
+class SignalStore:
+    """以 JSON 檔保存各 (代號, 起始日, 參數) 的增量狀態。"""
+
+    def __init__(self, root=os.path.join(DEFAULT_CACHE_DIR, 'signals'), loader=load_history):
+        self.root = root
+        self.loader = loader
+        self._memory = {}
+        self._checked = {}   # key -> 已更新到的 end，同一天重複查詢不必再讀價格
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        safe = '_'.join(str(p) for p in key)
+        safe = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in safe)
+        return os.path.join(self.root, f'{safe}.json')
+
+    def _load(self, key):
+        state = self._memory.get(key)
+        if state is None and os.path.exists(self._path(key)):
+            with open(self._path(key), encoding='utf-8') as f:
+                state = MacdSignalState.from_dict(json.load(f))
+        return state
+
+    def _save(self, key, state):
+        self._memory[key] = state
+        tmp = self._path(key) + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state.to_dict(), f)
+        os.replace(tmp, self._path(key))
+
+    def current(self, ticker, start, end, initial_cash=1_000_000.0, **params):
+        """
+        回傳截至 end (不含) 的最新狀態。已保存的狀態只會餵入 last_date 之後的新 K 棒；
+        若尚無狀態則從 start 起算一次。
+        """
+        key = (ticker, str(start)[:10], float(initial_cash)) + tuple(sorted(params.items()))
+        with self._lock:
+            if self._checked.get(key) == str(end)[:10]:
+                return self._memory[key]
+            state = self._load(key) or MacdSignalState(float(initial_cash), **params)
+            since = state.last_date or str(start)[:10]
+            df = self.loader(ticker, since, end)
+            closes = df['Close'].to_numpy().tolist()
+            dates = df.index.strftime('%Y-%m-%d')
+            updated = False
+            for date, close in zip(dates, closes):
+                if state.last_date is not None and date <= state.last_date:
+                    continue
+                state.update(date, close)
+                updated = True
+            if updated or key not in self._memory:
+                self._save(key, state)
+            self._checked[key] = str(end)[:10]
+            return state
+
+
+_default_store = None
+_default_store_guard = threading.Lock()
+
+
+DEFAULT_SIGNAL_START = os.getenv('SIGNAL_START_DATE', '2015-01-01')
+
+
+def describe_signal(state):
+    # 與網頁「最後訊號 / 狀態」相同的文字格式
+    if state.holding:
+        return f"🟢 持有中 (於 {state.last_action_date} 買進)"
+    if state.last_action_date:
+        return f"🔴 空手 (於 {state.last_action_date} 賣出)"
+    return "⚪️ 無交易紀錄"
+
+
+def get_signal_store():
+    global _default_store
+    with _default_store_guard:
+        if _default_store is None:
+            _default_store = SignalStore()
+        return _default_store
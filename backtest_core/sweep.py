@@ -0,0 +1,126 @@
+# sweep.py
+# MACD 參數掃描 (grid search)：fast / slow / signal / 停損 / 停利 五個參數的所有組合
+# 共用同一段價格序列。每個 EMA 週期只在主行程計算一次，再透過 initializer
+# 交給各工作行程；每個 (fast, slow, signal) 組合計算一次 DIF/MACD 後，
+# 於同一個工作中跑完所有停損/停利組合。
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest_core.engine import simulate_macd, FEE_RATE, TAX_RATE
+
+MAX_COMBINATIONS = 50_000
+SORT_KEYS = {
+    # 排序欄位: 是否由大到小
+    'cagr': True,
+    'max_drawdown': False,
+    'win_rate': True,
+    'total_return': True,
+}
+
+_worker_state = {}
+
+
+def parse_range(text, cast=float):
+    """解析 "8:16:2" (含終點) 或 "12,26" 形式的參數範圍。"""
+    text = str(text).strip()
+    if ':' in text:
+        parts = [cast(p) for p in text.split(':')]
+        if len(parts) == 2:
+            parts.append(cast(1))
+        lo, hi, step = parts
+        if step <= 0:
+            raise ValueError(f'範圍步長必須大於 0：{text}')
+        count = int(np.floor((hi - lo) / step + 1e-9)) + 1
+        values = [lo + k * step for k in range(max(count, 0))]
+        if cast is float:
+            values = [round(v, 10) for v in values]
+        return [cast(v) for v in values]
+    return [cast(p) for p in text.split(',') if p.strip()]
+
+
+def ema(close, span):
+    # 與 calculate_macd 相同：pandas ewm(adjust=False)
+    return pd.Series(close).ewm(span=span, adjust=False).mean().to_numpy()
+
+
+def compute_emas(close, spans):
+    return {span: ema(close, span) for span in sorted(set(spans))}
+
+
+def summarize(sim, initial_cash, num_years):
+    total_return = (sim.cash - initial_cash) / initial_cash * 100
+    win_rate = (sim.winning_trades / sim.total_trades) * 100 if sim.total_trades > 0 else 0
+    if num_years > 0:
+        cagr = ((sim.cash / initial_cash) ** (1 / num_years) - 1) * 100
+    else:
+        cagr = total_return
+    return {
+        'final_value': sim.cash,
+        'total_return': total_return,
+        'cagr': cagr,
+        'win_rate': win_rate,
+        'total_trades': sim.total_trades,
+        'max_drawdown': sim.max_drawdown * 100,
+    }
+
+
+def _init_worker(close, emas, initial_cash, num_years, fee_rate, tax_rate):
+    _worker_state.update(close=close, emas=emas, initial_cash=initial_cash,
+                         num_years=num_years, fee_rate=fee_rate, tax_rate=tax_rate)
+
+
+def _run_signal_group(task):
+    fast, slow, signal, exits = task
+    st = _worker_state
+    dif = st['emas'][fast] - st['emas'][slow]
+    macd = ema(dif, signal)
+    rows = []
+    for stop_loss_pct, take_profit_pct in exits:
+        sim = simulate_macd(st['close'], dif, macd, st['initial_cash'],
+                            fee_rate=st['fee_rate'], tax_rate=st['tax_rate'],
+                            stop_loss_pct=stop_loss_pct, take_profit_pct=take_profit_pct)
+        row = {'fast': fast, 'slow': slow, 'signal': signal,
+               'stop_loss_pct': stop_loss_pct, 'take_profit_pct': take_profit_pct}
+        row.update(summarize(sim, st['initial_cash'], st['num_years']))
+        rows.append(row)
+    return rows
+
+
+def run_sweep(close, initial_cash, num_years, fast, slow, signal, stop_loss, take_profit,
+              sort_by='cagr', limit=None, max_workers=None,
+              fee_rate=FEE_RATE, tax_rate=TAX_RATE):
+    """對五個參數範圍做全組合回測，回傳依 sort_by 排序的結果列表。"""
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f'不支援的排序欄位：{sort_by}')
+    close = np.asarray(close, dtype=np.float64)
+    signal_groups = [(f, s, g) for f, s, g in itertools.product(fast, slow, signal) if f < s]
+    exits = list(itertools.product(stop_loss, take_profit))
+    total = len(signal_groups) * len(exits)
+    if total == 0:
+        raise ValueError('沒有有效的參數組合 (fast 必須小於 slow)。')
+    if total > MAX_COMBINATIONS:
+        raise ValueError(f'參數組合數 {total} 超過上限 {MAX_COMBINATIONS}。')
+
+    emas = compute_emas(close, list(fast) + list(slow))
+    tasks = [(f, s, g, exits) for f, s, g in signal_groups]
+    init_args = (close, emas, initial_cash, num_years, fee_rate, tax_rate)
+
+    if max_workers == 1 or len(tasks) == 1:
+        _init_worker(*init_args)
+        chunks = map(_run_signal_group, tasks)
+        rows = [row for chunk in chunks for row in chunk]
+    else:
+        workers = max_workers or min(len(tasks), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+            chunksize = max(1, len(tasks) // (workers * 4))
+            rows = [row for chunk in pool.map(_run_signal_group, tasks, chunksize=chunksize) for row in chunk]
+
+    rows.sort(key=lambda r: r[sort_by], reverse=SORT_KEYS[sort_by])
+    for rank, row in enumerate(rows, 1):
+        row['rank'] = rank
+    return rows[:limit] if limit else rows
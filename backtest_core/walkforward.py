@@ -0,0 +1,204 @@
+# walkforward.py
+# 滾動視窗與 walk-forward 分析：
+#   - rolling：以固定參數，對歷史上每一段 N 年視窗各回測一次
+#   - walk-forward：在訓練視窗中找最佳參數，再用下一段樣本外視窗驗證，依序往前滾動
+# 價格只載入一次；EMA / DIF / MACD 與交叉訊號都在完整歷史上計算一次，
+# 各視窗直接取切片，重疊的視窗不必重新抓資料或重算指標。
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest_core.engine import simulate_macd, find_crosses, FEE_RATE, TAX_RATE
+from backtest_core.sweep import ema, compute_emas, summarize, SORT_KEYS, MAX_COMBINATIONS
+
+# 視窗數少於此值時直接在本行程計算，省下建立行程池的成本
+PARALLEL_THRESHOLD = 64
+
+_worker_state = {}
+
+
+def make_windows(dates, length_months, step_months, first=None, last=None):
+    """回傳 [(start_date, end_date, a, b)]，a/b 為 dates 上的切片位置 (含 a 不含 b)。"""
+    dates = pd.DatetimeIndex(dates)
+    first = pd.Timestamp(first or dates[0])
+    last = pd.Timestamp(last or dates[-1] + pd.Timedelta(days=1))
+    windows = []
+    k = 0
+    while True:
+        ws = first + pd.DateOffset(months=step_months * k)
+        we = ws + pd.DateOffset(months=length_months)
+        if we > last:
+            break
+        a, b = dates.searchsorted(ws), dates.searchsorted(we)
+        if b - a >= 2:
+            windows.append((ws, we, int(a), int(b)))
+        k += 1
+    return windows
+
+
+def _indicators(emas, fast, slow, signal):
+    dif = emas[fast] - emas[slow]
+    macd = ema(dif, signal)
+    return dif, macd, find_crosses(dif, macd)
+
+
+def evaluate_slice(close, dif, macd, crosses, a, b, initial_cash, num_years,
+                   stop_loss_pct, take_profit_pct, fee_rate=FEE_RATE, tax_rate=TAX_RATE):
+    golden, death = crosses
+    sim = simulate_macd(close[a:b], dif[a:b], macd[a:b], initial_cash,
+                        fee_rate=fee_rate, tax_rate=tax_rate,
+                        stop_loss_pct=stop_loss_pct, take_profit_pct=take_profit_pct,
+                        crosses=(golden[a:b], death[a:b]))
+    return summarize(sim, initial_cash, num_years)
+
+
+def _years(ws, we):
+    return (we - ws).days / 365.25
+
+
+# --- rolling ---------------------------------------------------------------
+
+def _init_rolling(close, dif, macd, crosses, initial_cash, exits, fee_rate, tax_rate):
+    _worker_state.update(close=close, dif=dif, macd=macd, crosses=crosses,
+                         initial_cash=initial_cash, exits=exits, fee_rate=fee_rate, tax_rate=tax_rate)
+
+
+def _run_rolling_window(task):
+    length_years, ws, we, a, b = task
+    st = _worker_state
+    stop_loss_pct, take_profit_pct = st['exits']
+    row = {'years': length_years, 'start': ws.strftime('%Y-%m-%d'), 'end': we.strftime('%Y-%m-%d'),
+           'bars': b - a}
+    row.update(evaluate_slice(st['close'], st['dif'], st['macd'], st['crosses'], a, b,
+                              st['initial_cash'], _years(ws, we), stop_loss_pct, take_profit_pct,
+                              st['fee_rate'], st['tax_rate']))
+    return row
+
+
+def run_rolling(close, dates, years, initial_cash=1_000_000.0, step_months=12,
+                fast=12, slow=26, signal=9, stop_loss_pct=0.05, take_profit_pct=0.10,
+                fee_rate=FEE_RATE, tax_rate=TAX_RATE, max_workers=None):
+    """對每個視窗長度 (年) 的所有滾動視窗執行基準策略，回傳結果列表。"""
+    close = np.asarray(close, dtype=np.float64)
+    dif, macd, crosses = _indicators(compute_emas(close, [fast, slow]), fast, slow, signal)
+    tasks = [(n, ws, we, a, b)
+             for n in years
+             for ws, we, a, b in make_windows(dates, int(n * 12), step_months)]
+    if not tasks:
+        raise ValueError('歷史資料長度不足以建立任何視窗。')
+    init_args = (close, dif, macd, crosses, initial_cash, (stop_loss_pct, take_profit_pct), fee_rate, tax_rate)
+    return _map(tasks, _run_rolling_window, _init_rolling, init_args, max_workers)
+
+
+def rolling_heatmap(rows, metric='cagr'):
+    """整理成熱圖用的矩陣：列為視窗長度，欄為視窗起始年月。"""
+    table = pd.DataFrame(rows).pivot_table(index='years', columns='start', values=metric)
+    return table.to_numpy(), [f'{y:g} 年' for y in table.index], [c[:7] for c in table.columns]
+
+
+# --- walk-forward ----------------------------------------------------------
+
+def _init_walkforward(close, emas, folds, exits, initial_cash, sort_by, fee_rate, tax_rate):
+    _worker_state.update(close=close, emas=emas, folds=folds, exits=exits, initial_cash=initial_cash,
+                         sort_by=sort_by, fee_rate=fee_rate, tax_rate=tax_rate)
+
+
+def _best_in_train(task):
+    # 單一 (fast, slow, signal)：指標在完整歷史上算一次，供所有 fold 的訓練視窗共用
+    fast, slow, signal = task
+    st = _worker_state
+    dif, macd, crosses = _indicators(st['emas'], fast, slow, signal)
+    reverse = SORT_KEYS[st['sort_by']]
+    best = []
+    for ts, te, a, b in st['folds']:
+        fold_best = None
+        for stop_loss_pct, take_profit_pct in st['exits']:
+            metrics = evaluate_slice(st['close'], dif, macd, crosses, a, b, st['initial_cash'],
+                                     _years(ts, te), stop_loss_pct, take_profit_pct,
+                                     st['fee_rate'], st['tax_rate'])
+            value = metrics[st['sort_by']]
+            if fold_best is None or (value > fold_best[0] if reverse else value < fold_best[0]):
+                fold_best = (value, (fast, slow, signal, stop_loss_pct, take_profit_pct), metrics)
+        best.append(fold_best)
+    return best
+
+
+def run_walkforward(close, dates, train_months, test_months, fast, slow, signal, stop_loss, take_profit,
+                    initial_cash=1_000_000.0, sort_by='cagr', fee_rate=FEE_RATE, tax_rate=TAX_RATE,
+                    max_workers=None):
+    """訓練視窗找最佳參數、下一段樣本外視窗驗證，每次往前滾動 test_months。"""
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f'不支援的排序欄位：{sort_by}')
+    close = np.asarray(close, dtype=np.float64)
+    dates = pd.DatetimeIndex(dates)
+    signal_groups = [(f, s, g) for f, s, g in itertools.product(fast, slow, signal) if f < s]
+    exits = list(itertools.product(stop_loss, take_profit))
+    if not signal_groups or not exits:
+        raise ValueError('沒有有效的參數組合 (fast 必須小於 slow)。')
+    if len(signal_groups) * len(exits) > MAX_COMBINATIONS:
+        raise ValueError(f'參數組合數超過上限 {MAX_COMBINATIONS}。')
+
+    # 訓練視窗 + 緊接著的測試視窗，以測試視窗長度為步長
+    spans = make_windows(dates, train_months + test_months, test_months)
+    folds, tests = [], []
+    for ws, we, a, b in spans:
+        te = ws + pd.DateOffset(months=train_months)
+        m = int(dates.searchsorted(te))
+        if m - a >= 2 and b - m >= 2:
+            folds.append((ws, te, a, m))
+            tests.append((te, we, m, b))
+    if not folds:
+        raise ValueError('歷史資料長度不足以建立任何訓練/測試視窗。')
+
+    emas = compute_emas(close, [f for f, _, _ in signal_groups] + [s for _, s, _ in signal_groups])
+    init_args = (close, emas, folds, exits, initial_cash, sort_by, fee_rate, tax_rate)
+    # 每個參數組合本身就是一批較重的工作，兩組以上即平行處理
+    per_group = _map(signal_groups, _best_in_train, _init_walkforward, init_args, max_workers, threshold=2)
+
+    reverse = SORT_KEYS[sort_by]
+    rows = []
+    for k, ((ts, te, _, _), (_, test_end, m, b)) in enumerate(zip(folds, tests)):
+        candidates = [group[k] for group in per_group]
+        value, params, train_metrics = (max if reverse else min)(candidates, key=lambda c: c[0])
+        f, s, g, stop_loss_pct, take_profit_pct = params
+        dif, macd, crosses = _indicators(emas, f, s, g)
+        test_metrics = evaluate_slice(close, dif, macd, crosses, m, b, initial_cash,
+                                      _years(te, test_end), stop_loss_pct, take_profit_pct,
+                                      fee_rate, tax_rate)
+        row = {
+            'fold': k + 1,
+            'train_start': ts.strftime('%Y-%m-%d'), 'train_end': te.strftime('%Y-%m-%d'),
+            'test_start': te.strftime('%Y-%m-%d'), 'test_end': test_end.strftime('%Y-%m-%d'),
+            'fast': f, 'slow': s, 'signal': g,
+            'stop_loss_pct': stop_loss_pct, 'take_profit_pct': take_profit_pct,
+        }
+        row.update({f'train_{name}': v for name, v in train_metrics.items()})
+        row.update({f'test_{name}': v for name, v in test_metrics.items()})
+        rows.append(row)
+    return rows
+
+
+def walkforward_heatmap(rows):
+    """各 fold 訓練期與樣本外的主要指標，列為指標、欄為測試期起始年月。"""
+    metrics = [('train_cagr', '訓練 CAGR'), ('test_cagr', '測試 CAGR'),
+               ('train_max_drawdown', '訓練 MDD'), ('test_max_drawdown', '測試 MDD'),
+               ('test_win_rate', '測試勝率')]
+    matrix = np.array([[row[key] for row in rows] for key, _ in metrics], dtype=np.float64)
+    return matrix, [label for _, label in metrics], [row['test_start'][:7] for row in rows]
+
+
+def _map(tasks, func, initializer, init_args, max_workers, threshold=PARALLEL_THRESHOLD):
+    if max_workers == 1 or (max_workers is None and len(tasks) < threshold):
+        initializer(*init_args)
+        try:
+            return [func(task) for task in tasks]
+        finally:
+            _worker_state.clear()
+    workers = max_workers or min(len(tasks), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=init_args) as pool:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        return list(pool.map(func, tasks, chunksize=chunksize))
@@ -0,0 +1,70 @@
+# warmup.py
+# 冷啟動預熱：行程啟動後先載入 matplotlib 與字型、讀取常用標的的價格並跑一次指標與回測，
+# 讓第一個使用者請求不必負擔這些一次性成本。
+#   PREWARM=background (預設)：啟動後在背景執行緒預熱，不延遲開始接受請求
+#   PREWARM=sync             ：匯入時同步預熱；搭配 gunicorn --preload，由 master 預熱後再 fork 出 worker
+#   PREWARM=off              ：不預熱
+# sync 模式只載入模組、字型與資料，不建立執行緒，fork 後的 worker 可以安全沿用。
+
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+from backtest_core.backtest import compute_indicators, run_backtest
+from backtest_core.charts import warm_up
+from backtest_core.data import load_history
+from backtest_core.portfolio import normalize_tickers
+from backtest_core.snapshots import get_snapshot_store
+
+logger = logging.getLogger(__name__)
+
+PREWARM_TICKERS = os.getenv('PREWARM_TICKERS', '0050.TW')
+PREWARM_YEARS = 10
+
+
+def prewarm(tickers=None, years=PREWARM_YEARS, charts=True):
+    """執行預熱並回傳各步驟耗時 (秒)。"""
+    timings = {}
+    if charts:
+        started = time.perf_counter()
+        warm_up()
+        timings['charts'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    end = date.today() + timedelta(days=1)
+    start = end - timedelta(days=int(365.25 * years))
+    for ticker in normalize_tickers(tickers or PREWARM_TICKERS):
+        df = load_history(ticker, start.isoformat(), end.isoformat())
+        if not df.empty:
+            run_backtest(compute_indicators(df), start.isoformat(), end.isoformat(), 1_000_000.0, ticker=ticker)
+    timings['data'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    get_snapshot_store().stats()
+    timings['snapshots'] = time.perf_counter() - started
+    return timings
+
+
+def _run(kwargs):
+    try:
+        timings = prewarm(**kwargs)
+        logger.info('預熱完成：%s', ', '.join(f'{k} {v * 1000:.0f}ms' for k, v in timings.items()))
+    except Exception:
+        # 預熱失敗 (例如離線無法下載價格) 不影響服務，第一個請求會自行載入
+        logger.exception('預熱失敗')
+
+
+def start_prewarm(mode=None, **kwargs):
+    """依 mode (預設讀 PREWARM 環境變數) 啟動預熱；background 模式回傳執行緒。"""
+    mode = mode or os.getenv('PREWARM', 'background')
+    if mode == 'off':
+        return None
+    if mode == 'sync':
+        return _run(kwargs)
+    if mode != 'background':
+        raise ValueError(f'PREWARM 必須是 background、sync 或 off：{mode}')
+    thread = threading.Thread(target=_run, args=(kwargs,), name='prewarm', daemon=True)
+    thread.start()
+    return thread
@@ -1,10 +1,11 @@
 import os
-import io
-import uuid
-import traceback
-import threading
+import sys
+import logging
+import hashlib
+import math
+import time
 from datetime import datetime
-from flask import Flask, request, abort, send_from_directory
+from flask import Flask, request, abort, send_from_directory, jsonify, Response, g
 from dotenv import load_dotenv
 
 from linebot.v3.messaging import MessagingApi, Configuration, ApiClient
@@ -18,11 +19,20 @@ from linebot.v3.webhooks.models import (
     MessageEvent, TextMessageContent, PostbackEvent
 )
 
-import yfinance as yf
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backtest_core.charts import chart_key, get_pipeline, render_equity_chart, BOT_STYLE
+from backtest_core.portfolio import run_portfolio, normalize_tickers
+from backtest_core.streaming import get_signal_store, describe_signal, DEFAULT_SIGNAL_START
+from backtest_core.profiling import recorder
+from backtest_core.jobs import JobQueue, QueueFull
+from backtest_core.backtest import backtest_ticker, describe_action
+from backtest_core.sessions import open_session_store
+from backtest_core.images import ImageStore
+from backtest_core.snapshots import get_snapshot_store
+from backtest_core.warmup import start_prewarm
+from backtest_core.metrics import (CONTENT_TYPE, observe_request, render as render_metrics, track_cache,
+                                   track_directory, track_queue)
+from backtest_core.logs import configure_logging
 
 # === 初始化 ===
 load_dotenv()
@@ -30,40 +40,129 @@ LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
 LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
 BASE_URL = os.getenv('BASE_URL')
 
+configure_logging()
 app = Flask(__name__)
-configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
-api_client = ApiClient(configuration)
-line_bot_api = MessagingApi(api_client)
+logger = logging.getLogger('line_bot')
+# 熱路徑的摘要紀錄，依 LOG_SAMPLE 取樣 (預設 10%)
+webhook_logger = logging.getLogger('line_bot.webhook')
+access_logger = logging.getLogger('line_bot.access')
+# LINE_API_HOST 可指向本機的假 LINE API (fake_line_api.py) 以離線壓測
+configuration = Configuration(host=os.getenv('LINE_API_HOST') or None, access_token=LINE_CHANNEL_ACCESS_TOKEN)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
-IMAGE_DIR = r'C:\Users\eric2\Desktop\程式交易實作\期末2\picture'
-os.makedirs(IMAGE_DIR, exist_ok=True)
-
-user_state = {}
+# WEBHOOK_MODE=async (預設)：驗證簽名後立即回 200，事件在背景依使用者順序處理，
+# reply/push 經由共用連線池非同步送出並合併；WEBHOOK_MODE=sync 則維持在請求執行緒內同步處理
+ASYNC_WEBHOOK = os.getenv('WEBHOOK_MODE', 'async') == 'async'
+if ASYNC_WEBHOOK:
+    # 非同步 SDK (aiohttp) 只在 async 模式載入
+    from outbox import LineOutbox, KeyedDispatcher
+    line_bot_api = LineOutbox(configuration, flush_delay=float(os.getenv('LINE_BATCH_DELAY', '0.02')))
+    event_dispatcher = KeyedDispatcher(workers=int(os.getenv('WEBHOOK_WORKERS', '4')))
+else:
+    api_client = ApiClient(configuration)
+    line_bot_api = MessagingApi(api_client)
+
+# 圖表以內容定址保存 (相同參數與資料只存一份)，並依年齡與總容量自動清理；
+# 預設目錄不納入版本控制，與 picture/ 中既有的圖檔分開
+IMAGE_DIR = os.getenv('IMAGE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '.picture_store')
+image_store = ImageStore(IMAGE_DIR,
+                         max_bytes=int(os.getenv('IMAGE_MAX_MB', '200')) * 1024 * 1024,
+                         max_age=int(os.getenv('IMAGE_MAX_AGE_DAYS', '7')) * 24 * 3600)
+IMAGE_CACHE_SECONDS = 30 * 24 * 3600   # 檔名即內容雜湊，可長期快取
+
+# 對話狀態：每位使用者一筆，逾時 (SESSION_TTL 秒) 失效並有容量上限。
+# SESSION_STORE=sqlite 或 sqlite:<路徑> 時存在 SQLite 檔，多個 worker 共用且重啟後保留
+user_state = open_session_store(os.getenv('SESSION_STORE'), ttl=int(os.getenv('SESSION_TTL', '1800')))
+
+# 回測工作佇列：固定數量的工作執行緒，佇列滿時請使用者稍後再試
+backtest_jobs = JobQueue(workers=int(os.getenv('BACKTEST_WORKERS', '2')),
+                         max_pending=int(os.getenv('BACKTEST_QUEUE_SIZE', '20')))
+
+# 冷啟動預熱 (PREWARM=background|off)：預先載入繪圖模組、字型與常用標的資料
+start_prewarm()
+
+# /metrics：工作佇列長度、圖片目錄大小、快照命中率 (抓取時才讀取)
+track_queue('backtest', backtest_jobs.stats)
+if ASYNC_WEBHOOK:
+    track_queue('outbox', lambda: {'queue_depth': line_bot_api.stats()['pending']})
+track_directory('picture', image_store.stats)
+track_cache('snapshots', lambda: {'hits': get_snapshot_store().hits, 'misses': get_snapshot_store().misses})
+if user_state.stats()['backend'] == 'memory':
+    track_cache('sessions', user_state.stats)
+
+@app.before_request
+def start_timing():
+    g.started = time.perf_counter()
+
+@app.after_request
+def finish_timing(response):
+    elapsed = time.perf_counter() - g.get('started', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_request('line_bot', endpoint, request.method, response.status_code, elapsed)
+    access_logger.log(logging.WARNING if response.status_code >= 500 else logging.INFO, 'request',
+                      extra={'method': request.method, 'endpoint': endpoint, 'status': response.status_code,
+                             'ms': round(elapsed * 1000, 1)})
+    return response
+
+@app.route("/metrics")
+def metrics():
+    # Prometheus 文字格式：/callback 延遲、回測各段落、價格下載、佇列與圖片目錄
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
 
 @app.route("/picture/<filename>")
 def serve_picture(filename):
-    return send_from_directory(IMAGE_DIR, filename)
+    if not image_store.valid_name(filename):
+        abort(404)
+    response = send_from_directory(IMAGE_DIR, filename, max_age=IMAGE_CACHE_SECONDS,
+                                   etag=filename.rsplit('.', 1)[0])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def picture_message(base_url, key, chart_bytes):
+    # 原圖與縮圖分別給 original_content_url 與 preview_image_url
+    original, preview = image_store.put(key, chart_bytes)
+    base = f"{base_url.rstrip('/')}/picture"
+    return ImageMessage(original_content_url=f"{base}/{original}", preview_image_url=f"{base}/{preview}")
+
+@app.route("/debug/timings")
+def debug_timings():
+    return jsonify(recorder.summary())
+
+@app.route("/jobs/stats")
+def job_stats():
+    stats = backtest_jobs.stats()
+    if ASYNC_WEBHOOK:
+        stats['outbox'] = line_bot_api.stats()
+    stats['sessions'] = user_state.stats()
+    stats['images'] = image_store.stats()
+    stats['snapshots'] = get_snapshot_store().stats()
+    return jsonify(stats)
 
 @app.route("/callback", methods=["POST"])
 def callback():
     signature = request.headers.get("X-Line-Signature", "")
     body = request.get_data(as_text=True)
 
-    print("=== 收到 LINE Webhook ===")
-    print("Signature:", signature)
-    print("Body:", body)
-
+    # 不記錄內容 (含使用者訊息)，只記錄大小與事件種類
     try:
-        handler.handle(body, signature)
+        if ASYNC_WEBHOOK:
+            # 只在請求執行緒內驗證簽名，事件交給背景處理後立即回應
+            events = handler.parser.parse(body, signature)
+            for event in events:
+                event_dispatcher.submit(getattr(event.source, 'user_id', None), dispatch_event, event)
+            webhook_logger.info('webhook', extra={'bytes': len(body), 'events': len(events),
+                                                  'types': sorted({type(e).__name__ for e in events})})
+        else:
+            handler.handle(body, signature)
+            webhook_logger.info('webhook', extra={'bytes': len(body)})
     except InvalidSignatureError:
-        print("❌ 簽名驗證失敗！")
+        logger.warning("❌ 簽名驗證失敗！", extra={'bytes': len(body)})
         abort(400)
     except Exception as e:
-        print("❌ 其他錯誤：", e)
-        traceback.print_exc()
+        logger.exception("❌ 其他錯誤：%s", e)
         abort(500)
-        
+
     return "OK"
 
 
@@ -72,30 +171,48 @@ def handle_message(event):
     user_id = event.source.user_id
     if isinstance(event.message, TextMessageContent):
         text = event.message.text.strip()
-        if text.lower() in ['回測', '開始', 'macd']:
-            user_state[user_id] = {}
+        command, _, ticker_text = text.partition(' ')
+        state = user_state.get(user_id)
+        if command.lower() in ['回測', '開始', 'macd']:
+            # 可在指令後接代號清單，例如「回測 0050,0056,006208」，預設為 0050.TW
+            try:
+                user_state.set(user_id, {'tickers': normalize_tickers(ticker_text)})
+            except ValueError as e:
+                line_bot_api.reply_message(ReplyMessageRequest(
+                    reply_token=event.reply_token,
+                    messages=[TextMessage(text=f"⚠️ {e}")]
+                ))
+                return
             ask_start_date(user_id, event.reply_token)
+        elif command.lower() in ['訊號', 'signal']:
+            reply_current_signal(event.reply_token, ticker_text)
         elif text.lower() in ['說明', 'help', '使用說明']:
             send_instruction(event.reply_token)
-        elif user_id in user_state and 'end_date' not in user_state[user_id]:
-            user_state[user_id]['end_date'] = text
+        elif state is not None and 'end_date' not in state:
+            state['end_date'] = text
+            user_state.set(user_id, state)
             ask_invest_amount(user_id, event.reply_token)
-        elif user_id in user_state and 'amount' not in user_state[user_id]:
+        elif state is not None and 'amount' not in state:
             try:
-                user_state[user_id]['amount'] = float(text)
-                start = user_state[user_id]['start_date']
-                end = user_state[user_id]['end_date']
-                amount = user_state[user_id]['amount']
+                amount = float(text)
+            except ValueError:
+                amount = math.nan
+            if not math.isfinite(amount) or amount <= 0:
+                # 格式錯誤時保留對話狀態，讓使用者直接重新輸入金額
                 line_bot_api.reply_message(ReplyMessageRequest(
                     reply_token=event.reply_token,
-                    messages=[TextMessage(text="✅ 資料輸入完成，開始回測...")]
+                    messages=[TextMessage(text="⚠️ 金額格式錯誤，請重新輸入大於 0 的純數字金額。")]
                 ))
-                threading.Thread(target=process_backtest_in_background, args=(user_id, start, end, amount, BASE_URL)).start()
-                del user_state[user_id]
-            except:
+                return
+            user_state.delete(user_id)
+            try:
+                enqueue_backtest(user_id, event.reply_token, state['start_date'], state['end_date'], amount,
+                                 state.get('tickers', ['0050.TW']))
+            except Exception as e:
+                logger.exception('排入回測時發生錯誤')
                 line_bot_api.reply_message(ReplyMessageRequest(
                     reply_token=event.reply_token,
-                    messages=[TextMessage(text="⚠️ 金額格式錯誤，請重新輸入純數字金額。")]
+                    messages=[TextMessage(text=f"❌ 回測時發生錯誤：{e}，請稍後再輸入 `回測` 重新開始。")]
                 ))
         else:
             send_instruction(event.reply_token)
@@ -105,13 +222,41 @@ def handle_postback(event):
     user_id = event.source.user_id
     data = event.postback.params
     if 'date' in data:
-        if user_id not in user_state or 'start_date' not in user_state[user_id]:
-            user_state[user_id] = {'start_date': data['date']}
+        state = user_state.get(user_id) or {}
+        if 'start_date' not in state:
+            state['start_date'] = data['date']
+            user_state.set(user_id, state)
             ask_end_date(user_id, event.reply_token)
         else:
-            user_state[user_id]['end_date'] = data['date']
+            state['end_date'] = data['date']
+            user_state.set(user_id, state)
             ask_invest_amount(user_id, event.reply_token)
 
+# 非同步模式下逐一分派事件 (與上面 handler.add 的註冊相同)
+EVENT_HANDLERS = {MessageEvent: handle_message, PostbackEvent: handle_postback}
+
+def dispatch_event(event):
+    func = EVENT_HANDLERS.get(type(event))
+    if func is not None:
+        func(event)
+
+def reply_current_signal(reply_token, ticker_text):
+    # 今日訊號由保存的增量指標狀態回答，不需重新下載與回測
+    try:
+        ticker = normalize_tickers(ticker_text)[0]
+        state = get_signal_store().current(ticker, DEFAULT_SIGNAL_START, datetime.today().strftime('%Y-%m-%d'))
+        text = (f"📡 {ticker} 今日 MACD 訊號 (資料至 {state.last_date})\n"
+                f"{describe_signal(state)}\n"
+                f"DIF：{state.dif:.3f}　MACD：{state.macd:.3f}\n"
+                f"(自 {DEFAULT_SIGNAL_START} 起依策略模擬)")
+    except Exception as e:
+        logger.exception('取得 %s 訊號時發生錯誤', ticker_text)
+        text = f"❌ 無法取得訊號：{e}"
+    line_bot_api.reply_message(ReplyMessageRequest(
+        reply_token=reply_token,
+        messages=[TextMessage(text=text)]
+    ))
+
 def ask_start_date(user_id, reply_token):
     line_bot_api.reply_message(ReplyMessageRequest(
         reply_token=reply_token,
@@ -159,180 +304,136 @@ def send_instruction(reply_token):
             text=("您好，我是 MACD 回測機器人 📊\n\n"
                   "請輸入以下指令開始使用：\n"
                   "🔹 輸入 `回測` 或 `開始` 或 `macd` 來啟動互動式回測流程\n"
-                  "🔹 接著會請您依序輸入：開始日期、結束日期與本金金額\n\n"
+                  "🔹 接著會請您依序輸入：開始日期、結束日期與本金金額\n"
+                  "🔹 輸入 `訊號` 或 `訊號 0056` 查詢今日 MACD 持有/空手訊號\n"
+                  "🔹 多檔投資組合：輸入 `回測 0050,0056,006208`，本金會平均分配到各檔\n\n"
                   "⚠️ 若您輸入錯誤或中斷流程，請重新輸入 `回測` 即可重新開始。")
         )]
     ))
 
-def run_backtest_strategy(start, end, initial_cash):
+def build_portfolio_messages(start_date, end_date, initial_cash, base_url, tickers):
+    result = run_portfolio(tickers, start_date, end_date, initial_cash)
+    result_text = (
+        f"📈 投資組合回測報告 ({len(tickers)} 檔，平均配置)\n"
+        f"--------------------------\n"
+        f"時間範圍：{start_date} ~ {end_date}\n"
+        f"初始本金：${initial_cash:,.0f}\n"
+        f"最終價值：${result.final_value:,.2f}\n"
+        f"總報酬率：{result.total_return:.2f}% {'💹' if result.total_return > 0 else '🔻'}\n"
+        f"📊 年化報酬率：{result.cagr:.2f}%\n"
+        f"🎯 勝率：{result.win_rate:.2f}%\n"
+        f"🔁 交易次數：{result.total_trades} 次\n"
+        f"📉 最大回撤：{result.max_drawdown:.2f}%\n"
+        f"--------------------------\n"
+        "各標的最終價值：\n" + "\n".join(
+            f"- {sym.ticker}: ${sym.final_value:,.0f} ({sym.total_trades} 次交易)" for sym in result.symbols)
+    )
+
+    key = chart_key('portfolio', tuple(tickers), start_date, end_date, float(initial_cash),
+                    hashlib.sha1(result.equity.tobytes()).hexdigest(), 'bot')
+    chart_bytes = get_pipeline().render(
+        key, result.dates, result.equity, {sym.ticker: sym.equity for sym in result.symbols},
+        f"投資組合 MACD 策略回測 ({start_date} ~ {end_date})", renderer=render_equity_chart)
+    return [
+        TextMessage(text=result_text),
+        picture_message(base_url, key, chart_bytes)
+    ]
+
+
+def build_backtest_messages(start_date, end_date, initial_cash, base_url, tickers=('0050.TW',)):
+    # 執行回測並組出要推播的訊息；相同參數的請求會合併，只計算一次
+    if len(tickers) > 1:
+        try:
+            return build_portfolio_messages(start_date, end_date, initial_cash, base_url, list(tickers))
+        except ValueError as e:
+            return [TextMessage(text=f"❌ 錯誤：{e}")]
+
+    stock_ticker = tickers[0]
+    snapshot = get_snapshot_store().lookup(stock_ticker, start_date, end_date)
     try:
-        stock_ticker = "0050.TW"
-        df = yf.Ticker(stock_ticker).history(start=start, end=end)
-        if df.empty:
-            return {'error': f'無法取得 {stock_ticker} 資料，請檢查日期。'}
-
-        df['EMA_fast'] = df['Close'].ewm(span=12).mean()
-        df['EMA_slow'] = df['Close'].ewm(span=26).mean()
-        df['DIF'] = df['EMA_fast'] - df['EMA_slow']
-        df['MACD'] = df['DIF'].ewm(span=9).mean()
-        df['Histogram'] = df['DIF'] - df['MACD']
-
-        position = 0
-        cash = initial_cash
-        shares = 0
-        buy_price = 0
-        fee_rate, tax_rate = 0.001425, 0.003
-        stop_loss_pct, take_profit_pct = 0.05, 0.10
-        trade_log = []
-
-        equity_curve = []
-        peak = initial_cash
-
-        for i in range(1, len(df)):
-            today, yesterday = df.iloc[i], df.iloc[i - 1]
-
-            if position == 0 and yesterday['DIF'] < yesterday['MACD'] and today['DIF'] > today['MACD']:
-                buy_price = today['Close']
-                shares_to_buy = int(cash // (buy_price * (1 + fee_rate)))
-                if shares_to_buy > 0:
-                    cost = shares_to_buy * buy_price
-                    cash -= cost * (1 + fee_rate)
-                    shares = shares_to_buy
-                    position = shares
-                    trade_log.append({'日期': df.index[i].strftime('%Y-%m-%d'), '動作': '買進 (黃金交叉)', '價格': f"{buy_price:.2f}"})
-
-            elif position > 0:
-                sell, reason = False, ''
-                current_price = today['Close']
-                change_pct = (current_price - buy_price) / buy_price
-                if yesterday['DIF'] > yesterday['MACD'] and today['DIF'] < today['MACD']:
-                    sell, reason = True, '死亡交叉'
-                elif change_pct <= -stop_loss_pct:
-                    sell, reason = True, f'停損 (-{stop_loss_pct*100:.1f}%)'
-                elif change_pct >= take_profit_pct:
-                    sell, reason = True, f'停利 (+{take_profit_pct*100:.1f}%)'
-
-                if sell:
-                    revenue = shares * current_price
-                    cash += revenue * (1 - fee_rate - tax_rate)
-                    trade_log.append({'日期': df.index[i].strftime('%Y-%m-%d'), '動作': f'賣出 ({reason})', '價格': f"{current_price:.2f}"})
-                    position = 0
-                    shares = 0
-
-            # 每日資產紀錄
-            equity = cash + shares * today['Close']
-            equity_curve.append(equity)
-            peak = max(peak, equity)
-
-        if position > 0:
-            final_price = df.iloc[-1]['Close']
-            cash += shares * final_price * (1 - fee_rate - tax_rate)
-
-        final_value = cash
-        total_return = (final_value - initial_cash) / initial_cash * 100
-
-        # 新增統計指標
-        trade_pairs = [trade_log[i:i + 2] for i in range(0, len(trade_log) - 1, 2)
-                       if trade_log[i]['動作'].startswith('買進') and trade_log[i + 1]['動作'].startswith('賣出')]
-        win_trades = [pair for pair in trade_pairs if float(pair[1]['價格']) > float(pair[0]['價格'])]
-        total_trades = len(trade_pairs)
-        win_rate = len(win_trades) / total_trades * 100 if total_trades else 0
-
-        days = (pd.to_datetime(end) - pd.to_datetime(start)).days
-        annualized_return = ((final_value / initial_cash) ** (365 / days) - 1) * 100 if days > 0 else 0
-
-        drawdowns = [(peak_val - val) / peak_val for peak_val, val in zip(pd.Series(equity_curve).cummax(), equity_curve)]
-        max_drawdown = max(drawdowns) * 100 if drawdowns else 0
-
-        gains = [float(p[1]['價格']) - float(p[0]['價格']) for p in trade_pairs if float(p[1]['價格']) > float(p[0]['價格'])]
-        losses = [float(p[0]['價格']) - float(p[1]['價格']) for p in trade_pairs if float(p[1]['價格']) < float(p[0]['價格'])]
-        avg_gain = sum(gains) / len(gains) if gains else 0.01
-        avg_loss = sum(losses) / len(losses) if losses else 0.01
-        risk_reward = avg_gain / avg_loss if avg_loss != 0 else 0
-
-        # 繪圖
-        buf = io.BytesIO()
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), sharex=True, gridspec_kw={'height_ratios': [2, 1]})
-        ax1.plot(df.index, df['Close'], label='收盤價', color='darkcyan')
-        ax1.set_title(f'{stock_ticker} MACD 策略回測 ({start} ~ {end})', fontsize=16)
-        ax1.grid(True, linestyle='--', alpha=0.6)
-        ax2.plot(df.index, df['DIF'], label='DIF', color='blue')
-        ax2.plot(df.index, df['MACD'], label='MACD', color='red')
-        bar_colors = ['green' if x > 0 else 'red' for x in df['Histogram']]
-        ax2.bar(df.index, df['Histogram'], label='柱狀圖', color=bar_colors, alpha=0.5)
-        for ax in [ax1, ax2]: ax.legend()
-        plt.tight_layout()
-        plt.savefig(buf, format='png')
-        plt.close()
-
-        return {
-            'trades': trade_log,
-            'total_return_float': total_return,
-            'final_value': final_value,
-            'macd_chart_bytes': buf.getvalue(),
-            'win_rate': win_rate,
-            'annualized_return': annualized_return,
-            'trade_count': total_trades,
-            'max_drawdown': max_drawdown,
-            'risk_reward': risk_reward,
-            'error': None
-        }
-
+        if snapshot is not None:
+            bt = snapshot.backtest(initial_cash)
+        else:
+            bt = backtest_ticker(stock_ticker, start_date, end_date, initial_cash)
+    except ValueError as e:
+        return [TextMessage(text=f"❌ 錯誤：{e}")]
     except Exception as e:
-        traceback.print_exc()
-        return {'error': str(e)}
-
-
-def process_backtest_in_background(user_id, start_date, end_date, initial_cash, base_url):
+        logger.exception('回測 %s 時發生錯誤', stock_ticker)
+        return [TextMessage(text=f"❌ 錯誤：{e}")]
+
+    result_text = (
+        f"📈 回測結果報告 ({stock_ticker})\n"
+        f"--------------------------\n"
+        f"時間範圍：{start_date} ~ {end_date}\n"
+        f"初始本金：${initial_cash:,.0f}\n"
+        f"最終價值：${bt.final_value:,.2f}\n"
+        f"總報酬率：{bt.total_return:.2f}% {'💹' if bt.total_return > 0 else '🔻'}\n"
+        f"📊 年化報酬率：{bt.cagr:.2f}%\n"
+        f"🎯 勝率：{bt.win_rate:.2f}%\n"
+        f"🔁 交易次數：{bt.total_trades} 次\n"
+        f"📉 最大回撤：{bt.max_drawdown:.2f}%\n"
+        f"📈 風險報酬比：{bt.risk_reward:.2f}\n"
+        f"--------------------------\n"
+    )
+    dates = bt.indicators.dates
+    last_5 = bt.trades[-5:]
+    if last_5:
+        result_text += "最後 5 筆交易紀錄：\n" + "\n".join(
+            [f"- {dates[t.index]:%Y-%m-%d} {describe_action(t.action)} @{t.price:.2f}" for t in last_5])
+    else:
+        result_text += "期間內無交易紀錄。\n"
+
+    # 繪圖 (共用圖表流程，相同參數直接取用快取)
+    ind = bt.indicators
+    key = chart_key(stock_ticker, start_date, end_date, 12, 26, 9, ind.version, 'bot')
+    if snapshot is not None and 'bot' in snapshot.charts:
+        get_pipeline().put(key, snapshot.charts['bot'])
+    chart_bytes = get_pipeline().render(key, ind.dates, ind.close, ind.dif, ind.macd, ind.histogram,
+                                        f'{stock_ticker} MACD 策略回測 ({start_date} ~ {end_date})', BOT_STYLE)
+
+    return [
+        TextMessage(text=result_text),
+        picture_message(base_url, key, chart_bytes)
+    ]
+
+
+def push_backtest_result(user_id):
+    # 回傳給 JobQueue 的完成回呼，將結果推播給該使用者
+    def deliver(messages, error):
+        if error is not None:
+            logger.error('回測工作失敗', exc_info=error)
+            messages = [TextMessage(text=f"❌ 發生錯誤：{error}")]
+        try:
+            line_bot_api.push_message(PushMessageRequest(to=user_id, messages=messages))
+        except Exception:
+            logger.exception('推播回測結果失敗')
+    return deliver
+
+
+def enqueue_backtest(user_id, reply_token, start, end, amount, tickers=('0050.TW',)):
+    # 收盤後快照涵蓋的標準區間直接回覆結果，不必排隊
+    if len(tickers) == 1 and get_snapshot_store().lookup(tickers[0], start, end) is not None:
+        line_bot_api.reply_message(ReplyMessageRequest(
+            reply_token=reply_token,
+            messages=build_backtest_messages(start, end, amount, BASE_URL, tuple(tickers))
+        ))
+        return
     try:
-        data = run_backtest_strategy(start_date, end_date, initial_cash)
-        if data['error']:
-            line_bot_api.push_message(PushMessageRequest(
-                to=user_id,
-                messages=[TextMessage(text=f"❌ 錯誤：{data['error']}")]
-            ))
-            return
-
-        result_text = (
-            f"📈 回測結果報告 (0050.TW)\n"
-            f"--------------------------\n"
-            f"時間範圍：{start_date} ~ {end_date}\n"
-            f"初始本金：${initial_cash:,.0f}\n"
-            f"最終價值：${data['final_value']:,.2f}\n"
-            f"總報酬率：{data['total_return_float']:.2f}% {'💹' if data['total_return_float'] > 0 else '🔻'}\n"
-            f"📊 年化報酬率：{data['annualized_return']:.2f}%\n"
-            f"🎯 勝率：{data['win_rate']:.2f}%\n"
-            f"🔁 交易次數：{data['trade_count']} 次\n"
-            f"📉 最大回撤：{data['max_drawdown']:.2f}%\n"
-            f"📈 風險報酬比：{data['risk_reward']:.2f}\n"
-            f"--------------------------\n"
+        position = backtest_jobs.submit(
+            (tuple(tickers), start, end, amount), build_backtest_messages, start, end, amount, BASE_URL, tuple(tickers),
+            callback=push_backtest_result(user_id)
         )
-        last_5 = data['trades'][-5:]
-        if last_5:
-            result_text += "最後 5 筆交易紀錄：\n" + "\n".join(
-                [f"- {t['日期']} {t['動作']} @{t['價格']}" for t in last_5])
+    except QueueFull:
+        text = "⏳ 目前回測請求較多，請稍後再輸入 `回測` 重新開始。"
+    else:
+        if position == 0:
+            text = "✅ 資料輸入完成，開始回測..."
         else:
-            result_text += "期間內無交易紀錄。\n"
-
-        filename = f"{uuid.uuid4()}.png"
-        filepath = os.path.join(IMAGE_DIR, filename)
-        with open(filepath, 'wb') as f:
-            f.write(data['macd_chart_bytes'])
-        image_url = f"{base_url.rstrip('/')}/picture/{filename}"
-
-        line_bot_api.push_message(PushMessageRequest(
-            to=user_id,
-            messages=[
-                TextMessage(text=result_text),
-                ImageMessage(original_content_url=image_url, preview_image_url=image_url)
-            ]
-        ))
-    except Exception as e:
-        traceback.print_exc()
-        line_bot_api.push_message(PushMessageRequest(
-            to=user_id,
-            messages=[TextMessage(text=f"❌ 發生錯誤：{e}")]
-        ))
+            text = f"✅ 資料輸入完成，目前排隊中，前面還有 {position} 筆回測，完成後會自動通知您。"
+    line_bot_api.reply_message(ReplyMessageRequest(
+        reply_token=reply_token,
+        messages=[TextMessage(text=text)]
+    ))
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -0,0 +1,87 @@
+# fake_line_api.py
+# 本機假 LINE Messaging API：接收 reply / push 請求並記錄下來，供離線壓測使用
+# 單獨執行：python fake_line_api.py 8081，再以 LINE_API_HOST=http://127.0.0.1:8081 啟動 app.py
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLineApi:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency   # 模擬 LINE API 的回應延遲 (秒)
+        self.fail_next = 0       # 接下來幾個請求回應 500，模擬 LINE API 故障
+        self.failed = []
+        self.replies = []
+        self.pushes = []
+        self.connections = 0     # 建立過的 TCP 連線數，用來確認 keep-alive 連線池有被重複使用
+        self._cond = threading.Condition()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'   # 支援 keep-alive
+
+            def setup(self):
+                super().setup()
+                with api._cond:
+                    api.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if api.latency:
+                    time.sleep(api.latency)
+                with api._cond:
+                    failing = api.fail_next > 0
+                    if failing:
+                        api.fail_next -= 1
+                        api.failed.append(payload)
+                    elif self.path.endswith('/message/reply'):
+                        api.replies.append(payload)
+                    elif self.path.endswith('/message/push'):
+                        api.pushes.append(payload)
+                    api._cond.notify_all()
+                if failing:
+                    body = json.dumps({'message': 'fake failure'}).encode('utf-8')
+                else:
+                    sent = [{'id': str(i), 'quoteToken': 'fake'} for i, _ in enumerate(payload.get('messages', []))]
+                    body = json.dumps({'sentMessages': sent}).encode('utf-8')
+                self.send_response(500 if failing else 200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_for_pushes(self, count, timeout=60):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self.pushes) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    api = FakeLineApi(port=port)
+    print(f'Fake LINE API listening on {api.url}')
+    api.server.serve_forever()
@@ -0,0 +1,107 @@
+# loadtest.py
+# 離線壓測：啟動假 LINE API、以合成價格預先填入價格快取，
+# 模擬多位使用者同時完成對話並觸發回測，統計 webhook 延遲、推播等待時間與佇列狀態
+# 執行方式：python loadtest.py [使用者數] [同時送出的執行緒數]
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from fake_line_api import FakeLineApi
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_event(user_id, kind, value):
+    base = {
+        'mode': 'active',
+        'timestamp': int(time.time() * 1000),
+        'source': {'type': 'user', 'userId': user_id},
+        'webhookEventId': uuid.uuid4().hex,
+        'deliveryContext': {'isRedelivery': False},
+        'replyToken': uuid.uuid4().hex,
+    }
+    if kind == 'text':
+        base.update(type='message', message={'id': uuid.uuid4().hex, 'type': 'text',
+                                             'quoteToken': 'q', 'text': value})
+    else:
+        base.update(type='postback', postback={'data': kind, 'params': {'date': value}})
+    return base
+
+
+def sign_body(secret, payload):
+    body = json.dumps(payload)
+    signature = base64.b64encode(hmac.new(secret.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).digest())
+    return body, signature.decode('utf-8')
+
+
+def main(argv):
+    users = int(argv[0]) if argv else 50
+    concurrency = int(argv[1]) if len(argv) > 1 else 10
+
+    fake = FakeLineApi().start()
+    os.environ['LINE_API_HOST'] = fake.url
+    os.environ.setdefault('PRICE_CACHE_DIR', tempfile.mkdtemp(prefix='price_cache_'))
+    os.environ.setdefault('IMAGE_DIR', tempfile.mkdtemp(prefix='picture_'))
+
+    from backtest_core import data
+    from backtest_core.benchmarks import synthetic_prices
+    prices = synthetic_prices(6000)
+    for col in ['Open', 'High', 'Low']:
+        prices[col] = prices['Close']
+    prices['Volume'] = 0.0
+    data._default_store = data.PriceStore(os.environ['PRICE_CACHE_DIR'], fetcher=None, today=lambda: date(2100, 1, 1))
+    data._default_store.seed('0050.TW', prices, start='1990-01-01', end='2100-01-01')
+
+    import app as bot
+    client = bot.app.test_client()
+    secret = bot.LINE_CHANNEL_SECRET
+
+    # 只用少數幾組日期區間，觀察相同請求的合併效果
+    ranges = [('2005-01-03', '2015-01-01'), ('2008-01-01', '2018-01-01'), ('2010-06-01', '2020-06-01')]
+    webhook_latencies = []
+
+    def conversation(i):
+        user_id = f'U{i:032x}'
+        start, end = ranges[i % len(ranges)]
+        steps = [('text', '回測'), ('select_start', start), ('select_end', end), ('text', '1000000')]
+        for kind, value in steps:
+            payload = {'destination': 'Ufake', 'events': [make_event(user_id, kind, value)]}
+            body, signature = sign_body(secret, payload)
+            t0 = time.perf_counter()
+            resp = client.post('/callback', data=body, headers={'X-Line-Signature': signature,
+                                                                'Content-Type': 'application/json'})
+            webhook_latencies.append(time.perf_counter() - t0)
+            assert resp.status_code == 200, resp.data
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(conversation, range(users)))
+    submitted = time.perf_counter() - t0
+    rejected = bot.backtest_jobs.stats()['rejected']
+    done = fake.wait_for_pushes(users - rejected, timeout=300)
+    total = time.perf_counter() - t0
+
+    webhook_latencies.sort()
+    n = len(webhook_latencies)
+    print(f'使用者數: {users}  同時送出: {concurrency}  全部推播完成: {done}')
+    print(f'對話送出耗時: {submitted:.2f}s  全部完成耗時: {total:.2f}s')
+    print(f'webhook 延遲 p50={webhook_latencies[n // 2] * 1000:.1f}ms '
+          f'p99={webhook_latencies[int(n * 0.99) - 1] * 1000:.1f}ms')
+    if bot.ASYNC_WEBHOOK:
+        bot.line_bot_api.flush(timeout=30)
+    print(f'LINE API 請求: reply={len(fake.replies)} push={len(fake.pushes)}  TCP 連線數: {fake.connections}')
+    print('佇列統計:', json.dumps(bot.backtest_jobs.stats(), ensure_ascii=False, indent=2))
+    fake.stop()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
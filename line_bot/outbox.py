@@ -0,0 +1,122 @@
+# outbox.py
+# 非同步 webhook 處理用的兩個元件：
+#   LineOutbox     ：在背景 asyncio 事件迴圈上，以共用 keep-alive 連線池 (aiohttp) 送出 reply / push，
+#                    短時間內送給同一對象的訊息合併成一次請求 (每次最多 5 則)
+#   KeyedDispatcher：依使用者分派事件到固定的單一執行緒，同一位使用者的事件依序處理
+
+import asyncio
+import logging
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from linebot.v3.messaging import AsyncApiClient, AsyncMessagingApi
+from linebot.v3.messaging.models import ReplyMessageRequest, PushMessageRequest
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGES_PER_REQUEST = 5   # LINE API 的單次上限
+
+
+class LineOutbox:
+    """介面與 MessagingApi 的 reply_message / push_message 相同，但只排入佇列、不等待回應。"""
+
+    def __init__(self, configuration, flush_delay=0.02):
+        self.flush_delay = flush_delay
+        self._pending = {}        # (kind, target) -> (messages, 合併的呼叫次數)，只在事件迴圈執行緒中存取
+        self._outstanding = 0     # 尚未送出的 reply/push 呼叫數
+        self._idle = threading.Condition()
+        self.requests = 0
+        self.messages = 0
+        self.errors = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='line-outbox', daemon=True)
+        self._thread.start()
+        self._api = asyncio.run_coroutine_threadsafe(self._open(configuration), self._loop).result()
+
+    async def _open(self, configuration):
+        # aiohttp 的 ClientSession 必須在事件迴圈內建立
+        self._client = AsyncApiClient(configuration)
+        return AsyncMessagingApi(self._client)
+
+    def reply_message(self, request):
+        self._submit('reply', request.reply_token, request.messages)
+
+    def push_message(self, request):
+        self._submit('push', request.to, request.messages)
+
+    def _submit(self, kind, target, messages):
+        with self._idle:
+            self._outstanding += 1
+        self._loop.call_soon_threadsafe(self._enqueue, kind, target, list(messages))
+
+    def _enqueue(self, kind, target, messages):
+        key = (kind, target)
+        if key in self._pending:
+            pending, calls = self._pending[key]
+            self._pending[key] = (pending + messages, calls + 1)
+            return
+        self._pending[key] = (messages, 1)
+        self._loop.call_later(self.flush_delay, lambda: self._loop.create_task(self._flush(key)))
+
+    async def _flush(self, key):
+        kind, target = key
+        messages, calls = self._pending.pop(key)
+        try:
+            if kind == 'reply':
+                # reply token 只能使用一次，超過上限的訊息無法送出
+                if len(messages) > MAX_MESSAGES_PER_REQUEST:
+                    logger.warning('reply 訊息超過 %d 則，捨棄 %d 則', MAX_MESSAGES_PER_REQUEST,
+                                   len(messages) - MAX_MESSAGES_PER_REQUEST)
+                await self._api.reply_message(ReplyMessageRequest(
+                    reply_token=target, messages=messages[:MAX_MESSAGES_PER_REQUEST]))
+                self._sent(min(len(messages), MAX_MESSAGES_PER_REQUEST))
+            else:
+                for i in range(0, len(messages), MAX_MESSAGES_PER_REQUEST):
+                    chunk = messages[i:i + MAX_MESSAGES_PER_REQUEST]
+                    await self._api.push_message(PushMessageRequest(to=target, messages=chunk))
+                    self._sent(len(chunk))
+        except Exception:
+            self.errors += 1
+            logger.exception('LINE %s 失敗', kind)
+        finally:
+            with self._idle:
+                self._outstanding -= calls
+                self._idle.notify_all()
+
+    def _sent(self, count):
+        self.requests += 1
+        self.messages += count
+
+    def flush(self, timeout=None):
+        """等待目前排入的訊息全部送出，回傳是否在時限內完成。"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def stats(self):
+        return {'requests': self.requests, 'messages': self.messages, 'errors': self.errors,
+                'pending': self._outstanding}
+
+    def close(self):
+        self.flush(timeout=5)
+        asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class KeyedDispatcher:
+    """相同 key 的工作交給同一個單執行緒 executor，維持先後順序；不同 key 可平行處理。"""
+
+    def __init__(self, workers=4):
+        self._executors = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'webhook-{i}')
+                           for i in range(workers)]
+
+    def submit(self, key, func, *args):
+        shard = zlib.crc32(str(key).encode('utf-8')) % len(self._executors)
+        return self._executors[shard].submit(self._run, func, *args)
+
+    @staticmethod
+    def _run(func, *args):
+        try:
+            return func(*args)
+        except Exception:
+            logger.exception('webhook 事件處理失敗')
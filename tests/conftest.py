@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 與兩個前端相同，由專案根目錄匯入共用的 backtest_core
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,139 @@
+# PriceStore 的離線測試：以記錄呼叫的假 fetcher 取代 yfinance
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest_core.data import PriceStore, data_version, missing_ranges
+
+TODAY = date(2024, 1, 1)
+
+
+def make_bars(start, end, base=100.0, ex_date=None, factor=1.0):
+    # 價格只由日期決定；ex_date 之前的 K 棒乘上 factor，模擬除權息後 yfinance 還原整段歷史
+    index = pd.bdate_range(start, pd.Timestamp(end) - pd.Timedelta(days=1), name='Date')
+    close = base + (index - pd.Timestamp('2000-01-01')).days.to_numpy(dtype=float) / 10
+    if ex_date is not None:
+        close = np.where(index < pd.Timestamp(ex_date), close * factor, close)
+    return pd.DataFrame({'Open': close, 'High': close + 1, 'Low': close - 1, 'Close': close,
+                         'Volume': 1000.0}, index=index)
+
+
+class StubFetcher:
+    def __init__(self, base=100.0):
+        self.calls = []
+        self.base = base
+        self.ex_date = None
+        self.factor = 1.0
+
+    def __call__(self, ticker, start, end):
+        self.calls.append((ticker, start, end))
+        return make_bars(start, end, self.base, self.ex_date, self.factor)
+
+
+@pytest.fixture
+def fetcher():
+    return StubFetcher()
+
+
+@pytest.fixture
+def store(tmp_path, fetcher):
+    return PriceStore(str(tmp_path), fetcher=fetcher, today=lambda: TODAY)
+
+
+def test_missing_ranges_only_returns_uncovered_parts():
+    covered = [(date(2020, 1, 10), date(2020, 1, 20)), (date(2020, 1, 15), date(2020, 2, 1))]
+    assert missing_ranges(covered, date(2020, 1, 1), date(2020, 3, 1)) == [
+        (date(2020, 1, 1), date(2020, 1, 10)), (date(2020, 2, 1), date(2020, 3, 1))]
+    assert missing_ranges(covered, date(2020, 1, 12), date(2020, 1, 25)) == []
+
+
+def test_covered_range_is_not_refetched(store, fetcher):
+    first = store.history('0050.TW', '2020-01-01', '2020-02-01')
+    second = store.history('0050.TW', '2020-01-06', '2020-01-20')
+    assert fetcher.calls == [('0050.TW', '2020-01-01', '2020-02-01')]
+    assert second.equals(first.loc['2020-01-06':'2020-01-17'])
+
+
+def test_only_missing_ranges_are_fetched(store, fetcher):
+    store.history('0050.TW', '2020-02-01', '2020-03-01')
+    fetcher.calls.clear()
+    df = store.history('0050.TW', '2020-01-01', '2020-04-01')
+    # 缺口兩側各多抓一根已快取的 K 棒 (02-03、02-28) 比對還原價格
+    assert fetcher.calls == [('0050.TW', '2020-01-01', '2020-02-04'),
+                             ('0050.TW', '2020-02-28', '2020-04-01')]
+    assert df.index.is_monotonic_increasing and df.index.is_unique
+    assert df.index[0] == pd.Timestamp('2020-01-01') and df.index[-1] == pd.Timestamp('2020-03-31')
+
+
+def test_adjacent_ranges_are_merged(store, fetcher):
+    store.history('0050.TW', '2020-01-01', '2020-02-01')
+    store.history('0050.TW', '2020-02-01', '2020-03-01')
+    conn = store._connect('0050.TW')
+    try:
+        assert store._covered(conn) == [(date(2020, 1, 1), date(2020, 3, 1))]
+    finally:
+        conn.close()
+    fetcher.calls.clear()
+    store.history('0050.TW', '2020-01-15', '2020-02-15')
+    assert fetcher.calls == []
+
+
+def test_days_from_today_on_are_not_marked_covered(store, fetcher):
+    store.history('0050.TW', '2023-12-01', '2024-01-10')
+    store.history('0050.TW', '2023-12-01', '2024-01-10')
+    assert fetcher.calls[1] == ('0050.TW', '2023-12-29', '2024-01-10')
+
+
+def test_data_version_changes_with_data(store):
+    df = store.history('0050.TW', '2020-01-01', '2020-02-01')
+    assert data_version(df) == data_version(store.history('0050.TW', '2020-01-01', '2020-02-01'))
+
+    revised = df.copy()
+    revised.iloc[5, revised.columns.get_loc('Close')] += 0.5
+    store.seed('0050.TW', revised)
+    assert data_version(store.history('0050.TW', '2020-01-01', '2020-02-01')) != data_version(df)
+
+    longer = store.history('0050.TW', '2020-01-01', '2020-02-15')
+    assert data_version(longer) != data_version(revised)
+
+
+def test_offline_store_returns_cached_rows_without_fetching(tmp_path):
+    offline = PriceStore(str(tmp_path), fetcher=None, today=lambda: TODAY)
+    bars = make_bars('2020-01-01', '2020-02-01')
+    offline.seed('0050.TW', bars)
+    df = offline.history('0050.TW', '2019-12-01', '2020-03-01')
+    assert data_version(df) == data_version(bars)
+    assert offline.history('2330.TW', '2020-01-01', '2020-02-01').empty
+
+
+def test_adjustment_change_refetches_whole_history(store, fetcher):
+    store.history('0050.TW', '2020-01-01', '2020-02-01')
+    # 2020-02-10 除息：之後下載的資料中，除息日前的價格全部往下還原
+    fetcher.ex_date, fetcher.factor = '2020-02-10', 0.97
+    fetcher.calls.clear()
+    df = store.history('0050.TW', '2020-01-01', '2020-03-01')
+    assert fetcher.calls == [('0050.TW', '2020-01-31', '2020-03-01'),
+                             ('0050.TW', '2020-01-01', '2020-03-01')]
+    expected = make_bars('2020-01-01', '2020-03-01', ex_date='2020-02-10', factor=0.97)
+    assert np.allclose(df['Close'].to_numpy(), expected['Close'].to_numpy())
+
+    fetcher.calls.clear()
+    store.history('0050.TW', '2020-01-15', '2020-02-15')
+    assert fetcher.calls == []
+
+
+def test_unchanged_seam_keeps_cached_bars(store, fetcher):
+    store.history('0050.TW', '2020-01-01', '2020-02-01')
+    # 缺口之後才除息，已快取的 K 棒不受影響
+    fetcher.ex_date, fetcher.factor = '2019-06-03', 0.97
+    fetcher.calls.clear()
+    store.history('0050.TW', '2020-01-01', '2020-03-01')
+    assert fetcher.calls == [('0050.TW', '2020-01-31', '2020-03-01')]
+
+
+def test_fetcher_returning_none_is_treated_as_empty(tmp_path):
+    store = PriceStore(str(tmp_path), fetcher=lambda *args: None, today=lambda: TODAY)
+    assert store.history('0050.TW', '2020-01-01', '2020-02-01').empty
@@ -0,0 +1,38 @@
+# ImageStore 的清理只處理自己寫入的雜湊檔名
+
+import os
+
+from backtest_core.images import ImageStore
+
+NOW = 1_000_000_000.0
+
+
+def touch(root, name, size=100, age=0.0):
+    path = os.path.join(root, name)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    os.utime(path, (NOW - age, NOW - age))
+    return path
+
+
+def test_sweep_and_stats_ignore_foreign_pngs(tmp_path):
+    store = ImageStore(str(tmp_path), max_bytes=150, max_age=3600, clock=lambda: NOW)
+    foreign = touch(str(tmp_path), '40fb4d8a-f5dc-4818-ac70-8c7f7522b4c8.png', age=30 * 24 * 3600)
+    old = touch(str(tmp_path), 'abcdef0123456789.png', age=7200)
+    old_preview = touch(str(tmp_path), 'abcdef0123456789_preview.png', age=7200)
+    fresh = touch(str(tmp_path), '0123456789abcdef.png')
+
+    assert store.stats()['files'] == 3
+    assert store.sweep() == 2
+    assert os.path.exists(foreign) and os.path.exists(fresh)
+    assert not os.path.exists(old) and not os.path.exists(old_preview)
+
+
+def test_sweep_evicts_least_recently_used_over_capacity(tmp_path):
+    store = ImageStore(str(tmp_path), max_bytes=250, max_age=3600, clock=lambda: NOW)
+    oldest = touch(str(tmp_path), 'aaaaaaaa.png', age=30)
+    touch(str(tmp_path), 'bbbbbbbb.png', age=20)
+    touch(str(tmp_path), 'cccccccc.png', age=10)
+    assert store.sweep() == 1
+    assert not os.path.exists(oldest)
+    assert store.stats()['bytes'] == 200
@@ -0,0 +1,70 @@
+# JobQueue：相同 key 的工作合併成一次計算、佇列滿時拒絕新工作
+
+import threading
+
+import pytest
+
+from backtest_core.jobs import JobQueue, QueueFull
+
+
+class BlockingRunner:
+    """在 release() 之前一直卡住的假回測，記錄每次被呼叫的參數。"""
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Semaphore(0)
+        self._release = threading.Event()
+
+    def __call__(self, *args):
+        self.calls.append(args)
+        self.started.release()
+        self._release.wait(10)
+        return f'result{args}'
+
+    def release(self):
+        self._release.set()
+
+
+def collect(results, done):
+    def callback(result, error):
+        results.append((result, error))
+        done.release()
+    return callback
+
+
+def test_identical_keys_share_one_job():
+    runner = BlockingRunner()
+    queue = JobQueue(workers=1, max_pending=5)
+    results, done = [], threading.Semaphore(0)
+    running = (('0050.TW',), '2010-01-01', '2020-01-01', 1000000.0)
+    waiting = (('0056.TW',), '2010-01-01', '2020-01-01', 1000000.0)
+
+    assert queue.submit(running, runner, *running, callback=collect(results, done)) == 0
+    assert runner.started.acquire(timeout=5)
+    # 執行中與排隊中的相同請求都合併到既有工作
+    assert queue.submit(running, runner, *running, callback=collect(results, done)) == 0
+    assert queue.submit(waiting, runner, *waiting, callback=collect(results, done)) == 1
+    assert queue.submit(waiting, runner, *waiting, callback=collect(results, done)) == 1
+
+    runner.release()
+    for _ in range(4):
+        assert done.acquire(timeout=5)
+    assert runner.calls == [running, waiting]
+    assert sorted(r for r, _ in results) == sorted([f'result{running}'] * 2 + [f'result{waiting}'] * 2)
+    stats = queue.stats()
+    assert (stats['submitted'], stats['coalesced'], stats['completed']) == (2, 2, 2)
+
+
+def test_full_queue_rejects_new_keys_but_still_coalesces():
+    runner = BlockingRunner()
+    queue = JobQueue(workers=1, max_pending=1)
+    queue.submit('a', runner, 'a')
+    assert runner.started.acquire(timeout=5)
+    queue.submit('b', runner, 'b')
+
+    with pytest.raises(QueueFull):
+        queue.submit('c', runner, 'c')
+    # 已在佇列中的相同請求不佔用新位置
+    assert queue.submit('b', runner, 'b') == 1
+    assert queue.stats()['rejected'] == 1
+    runner.release()
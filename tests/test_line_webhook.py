@@ -0,0 +1,134 @@
+# LINE Bot 非同步 webhook 對本機假 LINE API 的端對端測試：
+# /callback 驗證簽名後立即回 200，回測結果由背景推播；LINE API 失敗時 outbox 記錄錯誤後繼續運作
+
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from backtest_core import data, snapshots
+from backtest_core.benchmarks import synthetic_ohlc
+from backtest_core.jobs import JobQueue
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'line_bot')
+sys.path.insert(0, BOT_DIR)
+
+from fake_line_api import FakeLineApi   # noqa: E402
+from loadtest import make_event, sign_body   # noqa: E402
+
+LATENCY = 0.5   # 假 LINE API 的回應延遲；/callback 必須在這之前就回應
+
+
+@pytest.fixture(scope='module')
+def fake():
+    api = FakeLineApi(latency=LATENCY).start()
+    yield api
+    api.stop()
+
+
+@pytest.fixture(scope='module')
+def bot(fake, tmp_path_factory):
+    root = tmp_path_factory.mktemp('line_bot')
+    env = {'LINE_API_HOST': fake.url, 'LINE_CHANNEL_ACCESS_TOKEN': 'test-token',
+           'LINE_CHANNEL_SECRET': 'test-secret', 'BASE_URL': 'https://bot.example',
+           'WEBHOOK_MODE': 'async', 'PREWARM': 'off', 'IMAGE_DIR': str(root / 'images')}
+    previous_env = {k: os.environ.get(k) for k in env}
+    previous_stores = data._default_store, snapshots._default_store
+    os.environ.update(env)
+    data._default_store = data.PriceStore(str(root / 'prices'), fetcher=None, today=lambda: date(2100, 1, 1))
+    data._default_store.seed('0050.TW', synthetic_ohlc(3000), start='1990-01-01', end='2100-01-01')
+    snapshots._default_store = snapshots.SnapshotStore(str(root / 'snapshots'))
+    try:
+        spec = importlib.util.spec_from_file_location('line_bot_app', os.path.join(BOT_DIR, 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        yield module
+        module.line_bot_api.close()
+    finally:
+        data._default_store, snapshots._default_store = previous_stores
+        for key, value in previous_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def post(bot, user_id, kind, value, secret='test-secret'):
+    body, signature = sign_body(secret, {'destination': 'Ufake', 'events': [make_event(user_id, kind, value)]})
+    started = time.perf_counter()
+    resp = bot.app.test_client().post('/callback', data=body, headers={'X-Line-Signature': signature,
+                                                                       'Content-Type': 'application/json'})
+    return resp, time.perf_counter() - started
+
+
+def test_invalid_signature_is_rejected(bot):
+    resp, _ = post(bot, 'U0', 'text', '說明', secret='wrong')
+    assert resp.status_code == 400
+
+
+def test_callback_returns_immediately_and_result_is_pushed(bot, fake):
+    user_id = 'U' + '1' * 32
+    steps = [('text', '回測'), ('select_start', '2005-01-03'), ('select_end', '2010-01-04'), ('text', '1000000')]
+    for kind, value in steps:
+        resp, elapsed = post(bot, user_id, kind, value)
+        assert resp.status_code == 200
+        assert elapsed < LATENCY
+
+    assert fake.wait_for_pushes(1, timeout=60)
+    push = fake.pushes[0]
+    assert push['to'] == user_id
+    assert any(m['type'] == 'image' and m['originalContentUrl'].startswith('https://bot.example/picture/')
+               for m in push['messages'])
+    assert bot.line_bot_api.flush(timeout=10)
+    # 回測、開始日期、結束日期、金額各回覆一次
+    assert len(fake.replies) == 4
+
+
+def test_failed_push_is_logged_and_outbox_keeps_working(bot, fake, caplog):
+    errors = bot.line_bot_api.stats()['errors']
+    pushes = len(fake.pushes)
+    fake.fail_next = 1
+    with caplog.at_level(logging.ERROR, logger='outbox'):
+        bot.line_bot_api.push_message(bot.PushMessageRequest(to='U2', messages=[bot.TextMessage(text='一')]))
+        assert bot.line_bot_api.flush(timeout=10)
+    assert len(fake.failed) == 1
+    assert bot.line_bot_api.stats()['errors'] == errors + 1
+    assert any(r.name == 'outbox' and 'LINE push 失敗' in r.getMessage() for r in caplog.records)
+
+    # outbox 不重送失敗的請求，之後的推播照常送出
+    bot.line_bot_api.push_message(bot.PushMessageRequest(to='U2', messages=[bot.TextMessage(text='二')]))
+    assert fake.wait_for_pushes(pushes + 1, timeout=10)
+    assert fake.pushes[-1]['messages'][0]['text'] == '二'
+
+
+def test_busy_queue_replies_to_user_and_coalesces(bot, fake, monkeypatch):
+    # 假回測卡住唯一的工作執行緒，佇列只容納一筆
+    release, started = threading.Event(), threading.Event()
+
+    def blocking_backtest(*args):
+        started.set()
+        release.wait(10)
+        return [bot.TextMessage(text='done')]
+
+    monkeypatch.setattr(bot, 'build_backtest_messages', blocking_backtest)
+    monkeypatch.setattr(bot, 'backtest_jobs', JobQueue(workers=1, max_pending=1))
+    replies = len(fake.replies)
+    bot.enqueue_backtest('U3', 'r1', '2005-01-03', '2010-01-04', 1000000.0)
+    assert started.wait(5)
+    bot.enqueue_backtest('U4', 'r2', '2005-01-03', '2010-01-04', 1000000.0)   # 相同請求：合併
+    bot.enqueue_backtest('U5', 'r3', '2006-01-02', '2010-01-04', 1000000.0)   # 排隊
+    bot.enqueue_backtest('U6', 'r4', '2007-01-02', '2010-01-04', 1000000.0)   # 佇列已滿
+    release.set()
+    assert bot.line_bot_api.flush(timeout=10)
+
+    texts = {r['replyToken']: r['messages'][0]['text'] for r in fake.replies[replies:]}
+    assert texts['r1'].startswith('✅') and texts['r2'].startswith('✅')
+    assert '前面還有 1 筆' in texts['r3']
+    assert texts['r4'].startswith('⏳ 目前回測請求較多')
+    stats = bot.backtest_jobs.stats()
+    assert (stats['submitted'], stats['coalesced'], stats['rejected']) == (2, 1, 1)
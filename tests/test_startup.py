@@ -0,0 +1,16 @@
+# 冷啟動預算：在全新子行程中匯入兩個前端並送出第一個請求，各項耗時不得超過 STARTUP_BUDGET。
+# CI 機器較慢時以環境變數 STARTUP_BUDGET_SCALE 放寬 (例如 2.0 為預算的兩倍)，與 `benchmarks startup --scale` 相同。
+
+import os
+
+from backtest_core.benchmarks import STARTUP_BUDGET, run_startup
+
+SCALE = float(os.getenv('STARTUP_BUDGET_SCALE', '1.0'))
+
+
+def test_startup_within_budget():
+    results = run_startup()
+    assert set(STARTUP_BUDGET) <= set(results)
+    over = {name: f'{results[name] * 1000:.0f}ms > {budget * SCALE * 1000:.0f}ms'
+            for name, budget in STARTUP_BUDGET.items() if results[name] > budget * SCALE}
+    assert not over, f'超過啟動預算 (STARTUP_BUDGET_SCALE={SCALE})：{over}'
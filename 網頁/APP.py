@@ -1,284 +1,708 @@
 # APP.py
 
-import yfinance as yf
 import pandas as pd
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import io
-import base64
-from flask import Flask, render_template, request
-from datetime import datetime
-import traceback
-
-plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei', 'Heiti TC', 'sans-serif']
-plt.rcParams['axes.unicode_minus'] = False
-
+from flask import (Flask, render_template, request, jsonify, abort, url_for, Response, stream_with_context,
+                   stream_template, g)
+from datetime import datetime, timedelta
+import json
+import logging
+import time
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backtest_core.charts import (chart_key, get_pipeline, render_equity_chart, render_heatmap,
+                                  render_series_chart, WEB_STYLE)
+from backtest_core.cache import LRUCache
+from backtest_core.data import load_history, data_version
+from backtest_core.profiling import stage, start_request_timer, stop_request_timer, recorder
+from backtest_core.metrics import CONTENT_TYPE, observe_request, render as render_metrics, track_cache
+from backtest_core.logs import configure_logging
+from backtest_core.portfolio import run_portfolio, load_price_matrix, normalize_tickers, allocate, PortfolioResult
+from backtest_core.streaming import get_signal_store, describe_signal, DEFAULT_SIGNAL_START
+from backtest_core.sweep import run_sweep, parse_range, SORT_KEYS
+from backtest_core.montecarlo import run_monte_carlo
+from backtest_core.strategies import IndicatorSet, STRATEGIES, get_strategies, compare_strategies
+from backtest_core.execution import parse_execution
+from backtest_core.snapshots import get_snapshot_store
+from backtest_core.warmup import start_prewarm
+from backtest_core.batch import parse_specs, run_batch
+from backtest_core.intraday import get_bar_store, run_intraday, INTERVALS
+from backtest_core.walkforward import run_rolling, run_walkforward, rolling_heatmap, walkforward_heatmap
+from backtest_core.backtest import compute_indicators, run_backtest, describe_action
+from backtest_core.engine import BUY, STOP_LOSS_PCT, TAKE_PROFIT_PCT
+from backtest_core.export import trade_table, equity_table, export_table, EXPORT_FORMATS, TradePages
+
+configure_logging()
 app = Flask(__name__)
+logger = logging.getLogger('web')
+access_logger = logging.getLogger('web.access')
+
+# 回測結果與指標快取 (上限以 MB 計，TTL 以秒計)
+result_cache = LRUCache(max_bytes=int(os.getenv('RESULT_CACHE_MAX_MB', '64')) * 1024 * 1024,
+                        ttl=int(os.getenv('RESULT_CACHE_TTL', '3600')))
+signal_cache = LRUCache(max_bytes=int(os.getenv('SIGNAL_CACHE_MAX_MB', '128')) * 1024 * 1024,
+                        ttl=int(os.getenv('RESULT_CACHE_TTL', '3600')))
+
+# 冷啟動預熱 (PREWARM=background|sync|off)：預先載入繪圖模組、字型與常用標的資料
+start_prewarm()
+
+# /metrics 的快取命中率 (抓取時才讀取各快取的統計)
+track_cache('result', result_cache.stats)
+track_cache('signal', signal_cache.stats)
+track_cache('snapshots', lambda: {'hits': get_snapshot_store().hits, 'misses': get_snapshot_store().misses})
+
+# /strategy 的交易紀錄表每頁筆數 (由 /api/trades 分頁載入) 與串流 HTML 的送出點標記
+TRADES_PAGE_SIZE = 100
+MAX_TRADES_PAGE_SIZE = 1000
+STREAM_FLUSH = '<!-- flush -->'
+
+# 分段計時：每個請求都會記錄，設定 ENABLE_SERVER_TIMING=1 或帶 ?timings=1 時以 Server-Timing 標頭回傳
+SERVER_TIMING = os.getenv('ENABLE_SERVER_TIMING') == '1'
+
+@app.before_request
+def start_timing():
+    g.started = time.perf_counter()
+    start_request_timer()
+
+@app.after_request
+def finish_timing(response):
+    timer = stop_request_timer()
+    if timer is not None:
+        recorder.record_request(request.path, timer.stages, timer.total())
+        if SERVER_TIMING or request.args.get('timings') == '1':
+            response.headers['Server-Timing'] = timer.server_timing()
+    # 延遲直方圖以路由規則 (而非實際路徑) 為標籤，避免 /chart/<key>.png 等造成標籤數量無限增長
+    started = g.get('started', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    method, status = request.method, response.status_code
+
+    def observe():
+        elapsed = time.perf_counter() - started
+        observe_request('web', endpoint, method, status, elapsed)
+        access_logger.log(logging.WARNING if status >= 500 else logging.INFO, 'request',
+                          extra={'method': method, 'endpoint': endpoint, 'status': status,
+                                 'ms': round(elapsed * 1000, 1)})
+
+    # 串流回應 (/strategy、ndjson) 送完最後一段才記錄，延遲涵蓋整個回應的產生時間
+    if response.is_streamed:
+        response.call_on_close(observe)
+    else:
+        observe()
+    return response
+
+@app.route('/debug/timings')
+def debug_timings():
+    return jsonify(recorder.summary())
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus 文字格式：請求延遲、回測各段落、價格下載、快取命中率
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
 
 @app.route('/favicon.ico')
 def favicon():
     return '', 204
 
-def generate_chart_base64(buf):
-    buf.seek(0)
-    b64 = base64.b64encode(buf.read()).decode('utf-8')
-    buf.close()
-    return f"data:image/png;base64,{b64}"
-
-def calculate_macd(df, fast=12, slow=26, signal=9):
-    df['EMA_fast'] = df['Close'].ewm(span=fast, adjust=False).mean()
-    df['EMA_slow'] = df['Close'].ewm(span=slow, adjust=False).mean()
-    df['DIF'] = df['EMA_fast'] - df['EMA_slow']
-    df['MACD'] = df['DIF'].ewm(span=signal, adjust=False).mean()
-    df['Histogram'] = df['DIF'] - df['MACD']
-    return df
-
-def run_backtest_strategy(start, end, initial_cash):
+@app.route('/chart/<key>.png')
+def chart(key):
+    try:
+        png = get_pipeline().get(key, timeout=60)
+    except Exception:
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
+        abort(500)
+    if png is None:
+        abort(404)
+    return Response(png, mimetype='image/png', headers={'Cache-Control': 'public, max-age=86400'})
+
+def trade_pages(result):
+    # 交易紀錄表的分頁來源 (直接讀取欄位式的 TradeLog)：投資組合依日期合併各標的
+    if isinstance(result, PortfolioResult):
+        return TradePages(result.dates, [(sym.ticker, sym.trades) for sym in result.symbols])
+    return TradePages(result.indicators.dates, [(result.ticker, result.trades)])
+
+def labelled(rows):
+    for row in rows:
+        row['label'] = describe_action(row['action'])
+    return rows
+
+def run_portfolio_strategy(start, end, initial_cash, tickers, allocation='equal', weights=None):
     try:
-        stock_ticker = "0050.TW"
-        # 轉換日期字串為 datetime 物件以計算年份
         start_date = datetime.strptime(start, '%Y-%m-%d')
         end_date = datetime.strptime(end, '%Y-%m-%d')
+        prices = load_price_matrix(tickers, start, end)
+
+        version = hashlib.sha1(prices.to_numpy(dtype='float64').tobytes()).hexdigest()
+        result_key = ('portfolio', tuple(tickers), start_date.date(), end_date.date(), allocation,
+                      tuple(weights or ()), version, float(initial_cash))
+        cached = result_cache.get(result_key)
+        if cached is not None:
+            return cached
+
+        result = run_portfolio(tickers, start, end, initial_cash, allocation=allocation,
+                               weights=weights, prices=prices)
+
+        key = chart_key(*result_key, 'portfolio')
+        get_pipeline().submit(key, result.dates, result.equity, {sym.ticker: sym.equity for sym in result.symbols},
+                              f"投資組合 MACD 策略回測 ({', '.join(tickers)}) ({start} ~ {end})",
+                              renderer=render_equity_chart)
+
+        data = {
+            'result': result,
+            'total_return_float': result.total_return,
+            'chart_key': key,
+            'error': None,
+            'annualized_return': result.cagr,
+            'win_rate': result.win_rate,
+            'total_trades': result.total_trades,
+            'max_drawdown': result.max_drawdown,
+        }
+        result_cache.put(result_key, data)
+        return data
 
-        df = yf.Ticker(stock_ticker).history(start=start, end=end)
+    except ValueError as e:
+        return {'error': str(e)}
+    except Exception as e:
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
+        return {'error': f"發生未預期的錯誤: {e}"}
 
-        if df.empty:
-            return {'error': f'無法在指定日期範圍內取得 {stock_ticker} 的資料，請嘗試調整日期。'}
-
-        df = calculate_macd(df)
-
-        position = 0
-        buy_price = 0
-        cash = initial_cash
-        shares = 0
-        trade_log = []
-        fee_rate = 0.001425
-        tax_rate = 0.001 # ETF 稅率為 0.1%
-
-        # 新增指標的變數
-        total_trades = 0
-        winning_trades = 0
-        peak_portfolio_value = initial_cash
-        max_drawdown = 0.0
-        
-        stop_loss_pct = 0.05
-        take_profit_pct = 0.10
-
-        for i in range(1, len(df)):
-            today = df.iloc[i]
-            yesterday = df.iloc[i - 1]
-
-            # 買進邏輯
-            if position == 0 and (yesterday['DIF'] < yesterday['MACD']) and (today['DIF'] > today['MACD']):
-                buy_price = today['Close']
-                shares_to_buy = int(cash // (buy_price * (1 + fee_rate)))
-                if shares_to_buy > 0:
-                    cost = shares_to_buy * buy_price
-                    fee = cost * fee_rate
-                    total_cost = cost + fee
-                    cash -= total_cost
-                    position = shares_to_buy
-                    shares = shares_to_buy
-                    trade_log.append({
-                        '日期': df.index[i].strftime('%Y-%m-%d'),
-                        '動作': '買進 (黃金交叉)',
-                        '價格': f"{buy_price:.2f}",
-                        '股數': shares,
-                        '資金餘額': f"{cash:,.2f}"
-                    })
-
-            # 賣出邏輯
-            elif position > 0:
-                sell, reason = False, ''
-                current_price = today['Close']
-                change_pct = (current_price - buy_price) / buy_price
-
-                if (yesterday['DIF'] > yesterday['MACD']) and (today['DIF'] < today['MACD']):
-                    sell, reason = True, '死亡交叉'
-                elif change_pct <= -stop_loss_pct:
-                    sell, reason = True, f'停損 (-{stop_loss_pct*100:.0f}%)'
-                elif change_pct >= take_profit_pct:
-                    sell, reason = True, f'停利 (+{take_profit_pct*100:.0f}%)'
-
-                if sell:
-                    revenue = shares * current_price
-                    fee = revenue * fee_rate
-                    tax = revenue * tax_rate
-                    net_income = revenue - fee - tax
-                    
-                    buy_cost = shares * buy_price
-                    profit = net_income - (buy_cost * (1 + fee_rate))
-                    roi = (profit / buy_cost) * 100 if buy_cost > 0 else 0
-                    
-                    cash += net_income
-                    
-                    # 更新交易統計
-                    total_trades += 1
-                    if profit > 0:
-                        winning_trades += 1
-                        
-                    trade_log.append({
-                        '日期': df.index[i].strftime('%Y-%m-%d'),
-                        '動作': f'賣出 ({reason})',
-                        '價格': f"{current_price:.2f}",
-                        '股數': shares,
-                        '資金餘額': f"{cash:,.2f}",
-                        '報酬率': f"{roi:.2f}%"
-                    })
-                    position = 0
-                    shares = 0
-                    buy_price = 0
-
-            # 計算每日的最大回撤
-            current_portfolio_value = cash + (shares * today['Close'])
-            peak_portfolio_value = max(peak_portfolio_value, current_portfolio_value)
-            drawdown = (peak_portfolio_value - current_portfolio_value) / peak_portfolio_value
-            max_drawdown = max(max_drawdown, drawdown)
-
-
-        # 期末強制平倉
-        if position > 0:
-            final_price = df.iloc[-1]['Close']
-            revenue = shares * final_price
-            fee, tax = revenue * fee_rate, revenue * tax_rate
-            net_income = revenue - fee - tax
-
-            buy_cost = shares * buy_price
-            profit = net_income - (buy_cost * (1 + fee_rate))
-            roi = (profit / buy_cost) * 100 if buy_cost > 0 else 0
-
-            cash += net_income
-
-            # 期末平倉也算一次交易
-            total_trades += 1
-            if profit > 0:
-                winning_trades += 1
-            
-            trade_log.append({
-                '日期': df.index[-1].strftime('%Y-%m-%d'),
-                '動作': '期末強制平倉',
-                '價格': f"{final_price:.2f}",
-                '股數': shares,
-                '資金餘額': f"{cash:,.2f}",
-                '報酬率': f"{roi:.2f}%"
-            })
-
-        # 計算最終指標
-        total_return_float = (cash - initial_cash) / initial_cash * 100
-        win_rate = (winning_trades / total_trades) * 100 if total_trades > 0 else 0
-
-        # 計算年化報酬率 (CAGR)
-        num_years = (end_date - start_date).days / 365.25
-        if num_years > 0:
-            cagr = ((cash / initial_cash) ** (1 / num_years) - 1) * 100
+def run_backtest_strategy(start, end, initial_cash, stock_ticker="0050.TW"):
+    try:
+        # 轉換日期字串為 datetime 物件
+        start_date = datetime.strptime(start, '%Y-%m-%d')
+        end_date = datetime.strptime(end, '%Y-%m-%d')
+
+        # 標準區間 (近 N 年至今天) 直接使用收盤後預先計算的快照
+        with stage('snapshot_lookup'):
+            snapshot = get_snapshot_store().lookup(stock_ticker, start_date.date(), end_date.date())
+        if snapshot is not None:
+            version = snapshot.indicators.version
+        else:
+            with stage('fetch'):
+                df = load_history(stock_ticker, start, end)
+            if df.empty:
+                return {'error': f'無法在指定日期範圍內取得 {stock_ticker} 的資料，請嘗試調整日期。'}
+            version = data_version(df)
+
+        # 快取 key：正規化後的參數 + 價格資料版本
+        with stage('cache_lookup'):
+            signal_key = (stock_ticker, start_date.date(), end_date.date(), 12, 26, 9, version)
+            result_key = signal_key + (float(initial_cash),)
+            cached = result_cache.get(result_key)
+            indicators = snapshot.indicators if snapshot is not None else signal_cache.get(signal_key)
+
+        # 指標與交叉訊號與本金無關，不同本金的回測共用同一份
+        if indicators is None:
+            with stage('indicators'):
+                indicators = compute_indicators(df)
+            signal_cache.put(signal_key, indicators)
+
+        # 圖表交由背景繪圖流程產生，頁面以網址引用 (已快取時不會重畫)
+        with stage('chart_submit'):
+            key = chart_key(*signal_key, 'web')
+            if snapshot is not None and 'web' in snapshot.charts:
+                get_pipeline().put(key, snapshot.charts['web'])
+            get_pipeline().submit(key, indicators.dates, indicators.close, indicators.dif,
+                                  indicators.macd, indicators.histogram,
+                                  f'{stock_ticker} MACD 策略回測 ({start} ~ {end})', WEB_STYLE)
+        if cached is not None:
+            return cached
+
+        if snapshot is not None:
+            bt = snapshot.backtest(initial_cash)
         else:
-            cagr = total_return_float # 如果時間不足一年，年化報酬率等於總報酬率
-
-        # 圖表生成 (不變)
-        buf_macd = io.BytesIO()
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), sharex=True, gridspec_kw={'height_ratios': [2, 1]})
-        ax1.plot(df.index, df['Close'], label='收盤價', color='darkcyan')
-        ax1.set_title(f'{stock_ticker} MACD 策略回測 ({start} ~ {end})', fontsize=16)
-        ax1.set_ylabel('股價 (TWD)')
-        ax1.grid(True, linestyle='--', alpha=0.6)
-        ax1.legend()
-        ax2.plot(df.index, df['DIF'], label='DIF (快線)', color='blue', linewidth=1.5)
-        ax2.plot(df.index, df['MACD'], label='MACD (慢線)', color='red', linewidth=1.5)
-        bar_colors = ['#28a745' if x > 0 else '#dc3545' for x in df['Histogram']]
-        ax2.bar(df.index, df['Histogram'], label='柱狀圖 (DIF-MACD)', color=bar_colors, alpha=0.5)
-        ax2.axhline(0, color='black', linewidth=0.8, linestyle='--')
-        ax2.set_xlabel('日期')
-        ax2.set_ylabel('MACD 值')
-        ax2.legend()
-        ax2.grid(True, linestyle='--', alpha=0.6)
-        plt.tight_layout()
-        plt.savefig(buf_macd, format='png', dpi=100)
-        plt.close(fig)
-
-        return {
-            'trades': trade_log,
-            'total_return_float': total_return_float,
-            'macd_chart_b64': generate_chart_base64(buf_macd),
+            bt = run_backtest(indicators, start, end, initial_cash, ticker=stock_ticker)
+        # 快取保存數值結果，字串格式化留到顯示時才做
+        result = {
+            'result': bt,
+            'total_return_float': bt.total_return,
+            'chart_key': key,
             'error': None,
-            # 回傳新指標
-            'annualized_return': cagr,
-            'win_rate': win_rate,
-            'total_trades': total_trades,
-            'max_drawdown': max_drawdown * 100, # 轉換為百分比
+            'annualized_return': bt.cagr,
+            'win_rate': bt.win_rate,
+            'total_trades': bt.total_trades,
+            'max_drawdown': bt.max_drawdown,
         }
+        result_cache.put(result_key, result)
+        return result
 
     except Exception as e:
-        traceback.print_exc()
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
         return {'error': f"發生未預期的錯誤: {e}"}
 
+def parse_strategy_args(cash_str):
+    # /strategy 與 /export 共用的參數解析，格式錯誤時丟出 ValueError
+    initial_cash = float(cash_str)
+    if initial_cash <= 0:
+        raise ValueError("投入金額必須大於 0。")
+    tickers = normalize_tickers(request.args.get('tickers'))
+    allocation = request.args.get('allocation', 'equal')
+    weights = [float(w) for w in request.args.get('weights', '').replace('，', ',').split(',') if w.strip()]
+    if len(tickers) > 1:
+        allocate(initial_cash, tickers, allocation, weights)
+    return initial_cash, tickers, allocation, weights
+
+def run_strategy(start, end, initial_cash, tickers, allocation='equal', weights=None):
+    if len(tickers) > 1:
+        return run_portfolio_strategy(start, end, initial_cash, tickers, allocation, weights)
+    return run_backtest_strategy(start, end, initial_cash, tickers[0])
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+class StrategyPage:
+    """/strategy 頁面內容；模板第一次取用欄位時才執行回測，串流時頁首會先送出。"""
+
+    def __init__(self, args):
+        self.args = args
+        self._context = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._context is None:
+            self._context = self._build()
+        try:
+            return self._context[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def _build(self):
+        start, end, cash_str = self.args.get('start'), self.args.get('end'), self.args.get('cash')
+        # 預設值，用於錯誤頁面
+        context = {
+            'error': None,
+            'tickers': [],
+            'total_return': "0.00",
+            'total_return_float': 0,
+            'annualized_return': "0.00",
+            'win_rate': "0.00",
+            'total_trades': 0,
+            'max_drawdown': "0.00",
+            'signal': "⚠️ 參數錯誤",
+            'chart_url': None,
+            'has_trades': False,
+        }
+        if not all([start, end, cash_str]):
+            context['error'] = "所有欄位 (投入金額、開始日期、結束日期) 皆為必填。"
+            return context
+        try:
+            initial_cash, tickers, allocation, weights = parse_strategy_args(cash_str)
+        except ValueError as e:
+            context['error'] = str(e)
+            return context
+
+        data = run_strategy(start, end, initial_cash, tickers, allocation, weights)
+        if data['error']:
+            context.update(error=data['error'], signal="⚠️ 執行錯誤")
+            return context
+
+        pages = trade_pages(data['result'])
+        signal = "⚪️ 無交易紀錄或期末平倉"
+        if len(pages):
+            last_trade = pages.rows(len(pages) - 1, 1)[0]
+            if last_trade['action'] == BUY:
+                signal = f"🟢 持有中 (於 {last_trade['date']} 買進)"
+            else:
+                signal = f"🔴 空手 (於 {last_trade['date']} 賣出)"
+
+        total_return_float = data.get('total_return_float', 0)
+        context.update(
+            tickers=tickers,
+            total_return=f"{total_return_float:.2f}",
+            total_return_float=total_return_float,
+            annualized_return=f"{data.get('annualized_return', 0):.2f}",
+            win_rate=f"{data.get('win_rate', 0):.2f}",
+            total_trades=data.get('total_trades', 0),
+            max_drawdown=f"{data.get('max_drawdown', 0):.2f}",
+            signal=signal,
+            chart_url=url_for('chart', key=data['chart_key']),
+            has_trades=len(pages) > 0,
+        )
+        return context
+
+def flush_at_markers(chunks):
+    # Jinja 逐段產生的小片段先累積，遇到模板中的 STREAM_FLUSH 標記才送出
+    buffer = []
+    for chunk in chunks:
+        buffer.append(chunk)
+        if STREAM_FLUSH in chunk:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
 @app.route('/strategy')
 def strategy():
+    # 串流 HTML：頁首立即送出，回測完成後送出指標卡片，圖表以網址載入、交易紀錄由 /api/trades 分頁載入
+    page = StrategyPage(request.args)
+    html = stream_template('strategy_template.html', page=page, end_date=request.args.get('end'),
+                           today=datetime.today().strftime('%Y-%m-%d'), export_args=request.args.to_dict(),
+                           page_size=TRADES_PAGE_SIZE, flush=STREAM_FLUSH)
+    # X-Accel-Buffering：請 nginx 等反向代理不要緩衝整份回應
+    return Response(flush_at_markers(html), mimetype='text/html', headers={'X-Accel-Buffering': 'no'})
+
+@app.route('/api/trades')
+def api_trades():
+    # 交易紀錄分頁 JSON：參數與 /strategy 相同，另有 offset、limit (上限 MAX_TRADES_PAGE_SIZE)；
+    # format=ndjson (或 Accept: application/x-ndjson) 時由 offset 起逐批串流其餘全部交易
     start = request.args.get('start')
     end = request.args.get('end')
-    cash_str = request.args.get('cash')
-    today_str = datetime.today().strftime('%Y-%m-%d')
-    
-    # 預設值，用於錯誤頁面
-    default_context = {
-        'error': None,
-        'today': today_str,
-        'end_date': end,
-        'total_return': "0.00",
-        'total_return_float': 0,
-        'annualized_return': 0,
-        'win_rate': 0,
-        'total_trades': 0,
-        'max_drawdown': 0,
-        'signal': "⚠️ 參數錯誤"
-    }
-
-    if not all([start, end, cash_str]):
-        default_context['error'] = "所有欄位 (投入金額、開始日期、結束日期) 皆為必填。"
-        return render_template('strategy_template.html', **default_context)
+    if not all([start, end, request.args.get('cash')]):
+        return jsonify({'error': '所有欄位 (投入金額、開始日期、結束日期) 皆為必填。'}), 400
+    fmt = request.args.get('format')
+    if fmt is None and request.accept_mimetypes.best == 'application/x-ndjson':
+        fmt = 'ndjson'
+    if fmt not in (None, 'json', 'ndjson'):
+        return jsonify({'error': '格式必須是 json 或 ndjson。'}), 400
+    try:
+        initial_cash, tickers, allocation, weights = parse_strategy_args(request.args.get('cash'))
+        offset = int(request.args.get('offset', '0'))
+        limit = int(request.args.get('limit', str(TRADES_PAGE_SIZE)))
+        if offset < 0 or not 0 < limit <= MAX_TRADES_PAGE_SIZE:
+            raise ValueError(f'offset 不可為負數，limit 必須介於 1 與 {MAX_TRADES_PAGE_SIZE} 之間。')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    data = run_strategy(start, end, initial_cash, tickers, allocation, weights)
+    if data['error']:
+        return jsonify({'error': data['error']}), 400
+    pages = trade_pages(data['result'])
+
+    if fmt == 'ndjson':
+        def generate():
+            for k in range(offset, len(pages), MAX_TRADES_PAGE_SIZE):
+                yield ''.join(json.dumps(row, ensure_ascii=False) + '\n'
+                              for row in labelled(pages.rows(k, MAX_TRADES_PAGE_SIZE)))
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    rows = labelled(pages.rows(offset, limit))
+    next_offset = offset + len(rows) if offset + len(rows) < len(pages) else None
+    return jsonify({'total': len(pages), 'offset': offset, 'limit': limit, 'next_offset': next_offset,
+                    'rows': rows})
+
+@app.route('/export')
+def export():
+    # 下載交易紀錄或權益曲線：table=trades|equity，format=csv|parquet|arrow
+    start = request.args.get('start')
+    end = request.args.get('end')
+    table = request.args.get('table', 'trades')
+    fmt = request.args.get('format', 'csv')
+    if not all([start, end, request.args.get('cash')]):
+        return jsonify({'error': '所有欄位 (投入金額、開始日期、結束日期) 皆為必填。'}), 400
+    if table not in ('trades', 'equity'):
+        return jsonify({'error': 'table 必須是 trades 或 equity。'}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"匯出格式必須是 {', '.join(EXPORT_FORMATS)} 其中之一。"}), 400
+    try:
+        initial_cash, tickers, allocation, weights = parse_strategy_args(request.args.get('cash'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    data = run_strategy(start, end, initial_cash, tickers, allocation, weights)
+    if data['error']:
+        return jsonify({'error': data['error']}), 400
+
+    result = data['result']
+    if isinstance(result, PortfolioResult):
+        if table == 'trades':
+            frame = pd.concat([trade_table(result.dates, sym.trades, sym.ticker) for sym in result.symbols],
+                              ignore_index=True).sort_values('date', kind='stable')
+        else:
+            frame = equity_table(result.dates, result.equity,
+                                 {sym.ticker: sym.equity for sym in result.symbols})
+    elif table == 'trades':
+        frame = trade_table(result.indicators.dates, result.trades, result.ticker)
+    else:
+        frame = equity_table(result.indicators.dates, result.equity)
 
     try:
+        body, content_type, ext = export_table(frame, fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filename = f"{'_'.join(tickers)}_{start}_{end}_{table}.{ext}"
+    return Response(body, content_type=content_type,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/signal')
+def current_signal():
+    # 今日訊號：以保存的增量 MACD 狀態回答，只需餵入上次之後的新 K 棒
+    try:
+        ticker = normalize_tickers(request.args.get('ticker'))[0]
+        start = request.args.get('start', DEFAULT_SIGNAL_START)
+        initial_cash = float(request.args.get('cash', '1000000'))
+        datetime.strptime(start, '%Y-%m-%d')
+        end = datetime.today().strftime('%Y-%m-%d')
+        state = get_signal_store().current(ticker, start, end, initial_cash)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
+        return jsonify({'error': f"發生未預期的錯誤: {e}"}), 500
+    return jsonify({'ticker': ticker, 'start': start, 'signal': describe_signal(state), **state.summary()})
+
+@app.route('/rolling')
+def rolling():
+    # 滾動視窗分析：對歷史上每段 N 年視窗執行基準策略
+    try:
+        ticker = normalize_tickers(request.args.get('ticker'))[0]
+        start = request.args.get('start', '2005-01-01')
+        end = request.args.get('end', datetime.today().strftime('%Y-%m-%d'))
+        initial_cash = float(request.args.get('cash', '1000000'))
+        years = parse_range(request.args.get('years', '1,3,5'))
+        step_months = int(request.args.get('step_months', '3'))
+        if step_months <= 0 or not years or min(years) <= 0:
+            raise ValueError('視窗長度與步長必須大於 0。')
+        df = load_history(ticker, start, end)
+        if df.empty:
+            return jsonify({'error': f'無法在指定日期範圍內取得 {ticker} 的資料，請嘗試調整日期。'}), 404
+        rows = run_rolling(df['Close'].to_numpy(), df.index, years, initial_cash, step_months)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
+        return jsonify({'error': f"發生未預期的錯誤: {e}"}), 500
+
+    key = chart_key('rolling', ticker, start, end, tuple(years), step_months, data_version(df))
+    get_pipeline().submit(key, *rolling_heatmap(rows), f'{ticker} 滾動視窗 CAGR (%)', renderer=render_heatmap)
+    return jsonify({'ticker': ticker, 'start': start, 'end': end, 'results': rows,
+                    'heatmap_url': url_for('chart', key=key)})
+
+@app.route('/walkforward')
+def walkforward():
+    # walk-forward：訓練視窗最佳化參數，下一段樣本外視窗驗證
+    try:
+        ticker = normalize_tickers(request.args.get('ticker'))[0]
+        start = request.args.get('start', '2005-01-01')
+        end = request.args.get('end', datetime.today().strftime('%Y-%m-%d'))
+        initial_cash = float(request.args.get('cash', '1000000'))
+        sort_by = request.args.get('sort', 'cagr')
+        train_months = int(request.args.get('train_months', '36'))
+        test_months = int(request.args.get('test_months', '12'))
+        if train_months <= 0 or test_months <= 0:
+            raise ValueError('訓練與測試視窗長度必須大於 0。')
+        fast = parse_range(request.args.get('fast', '8:16:4'), int)
+        slow = parse_range(request.args.get('slow', '22:30:4'), int)
+        signal = parse_range(request.args.get('signal', '9'), int)
+        stop_loss = parse_range(request.args.get('stop_loss', str(STOP_LOSS_PCT)))
+        take_profit = parse_range(request.args.get('take_profit', str(TAKE_PROFIT_PCT)))
+        df = load_history(ticker, start, end)
+        if df.empty:
+            return jsonify({'error': f'無法在指定日期範圍內取得 {ticker} 的資料，請嘗試調整日期。'}), 404
+        rows = run_walkforward(df['Close'].to_numpy(), df.index, train_months, test_months,
+                               fast, slow, signal, stop_loss, take_profit,
+                               initial_cash=initial_cash, sort_by=sort_by)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
+        return jsonify({'error': f"發生未預期的錯誤: {e}"}), 500
+
+    key = chart_key('walkforward', ticker, start, end, request.query_string, data_version(df))
+    get_pipeline().submit(key, *walkforward_heatmap(rows), f'{ticker} Walk-forward 各期結果 (%)',
+                          renderer=render_heatmap)
+    return jsonify({'ticker': ticker, 'start': start, 'end': end, 'sort': sort_by, 'results': rows,
+                    'heatmap_url': url_for('chart', key=key)})
+
+@app.route('/intraday')
+def intraday():
+    # 分鐘線回測：interval=1m|5m|60m，價格存於 memmap 欄位檔並以區塊串流回測
+    try:
+        ticker = normalize_tickers(request.args.get('ticker'))[0]
+        interval = request.args.get('interval', '5m')
+        if interval not in INTERVALS:
+            raise ValueError(f"週期必須是 {', '.join(INTERVALS)} 其中之一。")
+        end = request.args.get('end', datetime.today().strftime('%Y-%m-%d'))
+        start = request.args.get('start') or (datetime.strptime(end, '%Y-%m-%d') - timedelta(days=30)).strftime('%Y-%m-%d')
+        initial_cash = float(request.args.get('cash', '1000000'))
+        store = get_bar_store()
+        with stage('fetch'):
+            store.update(ticker, interval, start, end)
+            bars = store.bars(ticker, interval, start, end)
+        if len(bars) == 0:
+            return jsonify({'error': f'無法在指定日期範圍內取得 {ticker} 的 {interval} 資料。'}), 404
+        with stage('simulate'):
+            result = run_intraday(bars, initial_cash, ticker, interval)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
+        return jsonify({'error': f"發生未預期的錯誤: {e}"}), 500
+
+    key = chart_key('intraday', ticker, interval, int(bars.ts[0]), int(bars.ts[-1]), len(bars), initial_cash)
+    get_pipeline().submit(key, result.chart, f'{ticker} {interval} MACD 策略回測 ({start} ~ {end})', WEB_STYLE,
+                          renderer=render_series_chart)
+    last_trades = [{'time': pd.Timestamp(ts).isoformat(), 'action': describe_action(t.action), 'price': t.price, 'shares': t.shares}
+                   for ts, t in zip(result.ts[-20:], result.trades[-20:])]
+    return jsonify({'ticker': ticker, 'interval': interval, 'start': start, 'end': end, 'bars': result.bars,
+                    'final_value': result.final_value, 'total_return': result.total_return,
+                    'win_rate': result.win_rate, 'total_trades': result.total_trades,
+                    'max_drawdown': result.max_drawdown, 'last_trades': last_trades,
+                    'chart_url': url_for('chart', key=key)})
+
+@app.route('/compare')
+def compare():
+    # 同一檔標的比較多個策略 (strategies=macd,rsi,kd,bollinger,ma_cross,macd_rsi)，資料與指標只各算一次；
+    # execution=tw_board / tw_odd 或 fill、lot_size、min_fee、slippage_ticks 等參數改用實際成交模型
+    try:
+        ticker = normalize_tickers(request.args.get('ticker'))[0]
+        start = request.args.get('start', '2005-01-01')
+        end = request.args.get('end', datetime.today().strftime('%Y-%m-%d'))
+        initial_cash = float(request.args.get('cash', '1000000'))
+        sort_by = request.args.get('sort', 'cagr')
+        strategies = get_strategies(request.args.get('strategies') or ','.join(STRATEGIES))
+        execution = parse_execution(request.args)
+        with stage('fetch'):
+            df = load_history(ticker, start, end)
+        if df.empty:
+            return jsonify({'error': f'無法在指定日期範圍內取得 {ticker} 的資料，請嘗試調整日期。'}), 404
+
+        key = ('compare', ticker, start, end, tuple(s.name for s in strategies), sort_by,
+               data_version(df), initial_cash, execution)
+        result = result_cache.get(key)
+        if result is None:
+            ind = IndicatorSet(df)
+            num_years = (df.index[-1] - df.index[0]).days / 365.25
+            with stage('simulate'):
+                rows = compare_strategies(ind, strategies, initial_cash, num_years, sort_by=sort_by,
+                                          execution=execution)
+            result = {'results': rows, 'indicators_computed': ind.computed,
+                      'execution': execution._asdict() if execution else None}
+            result_cache.put(key, result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
+        return jsonify({'error': f"發生未預期的錯誤: {e}"}), 500
+
+    return jsonify({'ticker': ticker, 'start': start, 'end': end, 'sort': sort_by, **result})
+
+@app.route('/api/backtests', methods=['POST'])
+def batch_backtests():
+    # 批次回測 JSON API：body 為設定陣列或 {"specs": [...]}；
+    # format=ndjson (或 Accept: application/x-ndjson) 時每完成一筆就送出一行，否則依請求順序回傳整份結果
+    try:
+        body = request.get_json(silent=True)
+        if body is None:
+            raise ValueError('請求內容必須是 JSON。')
+        specs = parse_specs(body.get('specs') if isinstance(body, dict) else body)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    fmt = request.args.get('format')
+    if fmt is None and request.accept_mimetypes.best == 'application/x-ndjson':
+        fmt = 'ndjson'
+    if fmt == 'ndjson':
+        def generate():
+            for row in run_batch(specs, cache=result_cache):
+                yield json.dumps(row, ensure_ascii=False) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    if fmt not in (None, 'json'):
+        return jsonify({'error': '格式必須是 json 或 ndjson。'}), 400
+
+    try:
+        with stage('simulate'):
+            rows = sorted(run_batch(specs, cache=result_cache), key=lambda r: r['index'])
+    except Exception as e:
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
+        return jsonify({'error': f"發生未預期的錯誤: {e}"}), 500
+    return jsonify({'count': len(rows), 'errors': sum(r['error'] is not None for r in rows), 'results': rows})
+
+@app.route('/montecarlo')
+def montecarlo():
+    # 蒙地卡羅穩健度分析：method=bootstrap (區塊拔靴) 或 gbm，回傳各指標的分位數分布
+    try:
+        ticker = normalize_tickers(request.args.get('ticker'))[0]
+        start = request.args.get('start', '2005-01-01')
+        end = request.args.get('end', datetime.today().strftime('%Y-%m-%d'))
+        initial_cash = float(request.args.get('cash', '1000000'))
+        method = request.args.get('method', 'bootstrap')
+        n_paths = int(request.args.get('paths', '1000'))
+        block = int(request.args.get('block', '20'))
+        seed = request.args.get('seed')
+        seed = int(seed) if seed else None
+        if block <= 0:
+            raise ValueError('區塊長度必須大於 0。')
+        df = load_history(ticker, start, end)
+        if df.empty:
+            return jsonify({'error': f'無法在指定日期範圍內取得 {ticker} 的資料，請嘗試調整日期。'}), 404
+
+        # 指定 seed 時結果是確定的，可以快取
+        key = ('montecarlo', ticker, start, end, method, n_paths, block, seed, data_version(df), initial_cash)
+        result = result_cache.get(key) if seed is not None else None
+        if result is None:
+            num_years = (df.index[-1] - df.index[0]).days / 365.25
+            result = run_monte_carlo(df['Close'].to_numpy(), num_years, initial_cash, method=method,
+                                     n_paths=n_paths, block=block, seed=seed)
+            if seed is not None:
+                result_cache.put(key, result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
+        return jsonify({'error': f"發生未預期的錯誤: {e}"}), 500
+
+    return jsonify({'ticker': ticker, 'start': start, 'end': end, **result})
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify({'result_cache': result_cache.stats(), 'signal_cache': signal_cache.stats(),
+                    'snapshots': get_snapshot_store().stats()})
+
+@app.route('/sweep')
+def sweep():
+    # 參數掃描：範圍格式為 "起:迄:步長" (含終點) 或以逗號分隔的列表
+    start = request.args.get('start')
+    end = request.args.get('end')
+    cash_str = request.args.get('cash', '1000000')
+    sort_by = request.args.get('sort', 'cagr')
+    if not all([start, end]):
+        return jsonify({'error': '開始日期與結束日期皆為必填。'}), 400
+    if sort_by not in SORT_KEYS:
+        return jsonify({'error': f"排序欄位必須是 {', '.join(SORT_KEYS)} 其中之一。"}), 400
+
+    try:
+        stock_ticker = normalize_tickers(request.args.get('ticker'))[0]
         initial_cash = float(cash_str)
         if initial_cash <= 0:
             raise ValueError("投入金額必須大於 0。")
+        limit = int(request.args.get('limit', 50))
+        fast = parse_range(request.args.get('fast', '12'), int)
+        slow = parse_range(request.args.get('slow', '26'), int)
+        signal = parse_range(request.args.get('signal', '9'), int)
+        stop_loss = parse_range(request.args.get('stop_loss', str(STOP_LOSS_PCT)))
+        take_profit = parse_range(request.args.get('take_profit', str(TAKE_PROFIT_PCT)))
+        num_years = (datetime.strptime(end, '%Y-%m-%d') - datetime.strptime(start, '%Y-%m-%d')).days / 365.25
     except ValueError as e:
-        default_context['error'] = str(e)
-        return render_template('strategy_template.html', **default_context)
-
-    data = run_backtest_strategy(start, end, initial_cash)
+        return jsonify({'error': str(e)}), 400
 
-    if data['error']:
-        default_context['error'] = data['error']
-        default_context['signal'] = "⚠️ 執行錯誤"
-        return render_template('strategy_template.html', **default_context)
-
-    signal = "⚪️ 無交易紀錄或期末平倉"
-    if data['trades']:
-        last_trade = data['trades'][-1]
-        if '買進' in last_trade['動作']:
-            signal = f"🟢 持有中 (於 {last_trade['日期']} 買進)"
-        else:
-            signal = f"🔴 空手 (於 {last_trade['日期']} 賣出)"
-    
-    total_return_float = data.get('total_return_float', 0)
-
-    return render_template('strategy_template.html',
-                           trades=data['trades'],
-                           total_return=f"{total_return_float:.2f}",
-                           total_return_float=total_return_float,
-                           annualized_return=f"{data.get('annualized_return', 0):.2f}",
-                           win_rate=f"{data.get('win_rate', 0):.2f}",
-                           total_trades=data.get('total_trades', 0),
-                           max_drawdown=f"{data.get('max_drawdown', 0):.2f}",
-                           signal=signal,
-                           end_date=end,
-                           today=today_str,
-                           macd_chart_b64=data['macd_chart_b64'],
-                           error=None)
+    try:
+        df = load_history(stock_ticker, start, end)
+        if df.empty:
+            return jsonify({'error': f'無法在指定日期範圍內取得 {stock_ticker} 的資料，請嘗試調整日期。'}), 404
+        results = run_sweep(df['Close'].to_numpy(), initial_cash, num_years,
+                            fast, slow, signal, stop_loss, take_profit,
+                            sort_by=sort_by, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception('處理 %s 時發生未預期的錯誤', request.path)
+        return jsonify({'error': f"發生未預期的錯誤: {e}"}), 500
+
+    fmt = request.args.get('format')
+    if fmt:
+        # 大量組合可直接下載為 CSV / Parquet / Arrow
+        try:
+            body, content_type, ext = export_table(pd.DataFrame(results), fmt)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return Response(body, content_type=content_type,
+                        headers={'Content-Disposition': f'attachment; filename="sweep_{stock_ticker}_{start}_{end}.{ext}"'})
+
+    return jsonify({'ticker': stock_ticker, 'start': start, 'end': end,
+                    'sort': sort_by, 'results': results})
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
\ No newline at end of file